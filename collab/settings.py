@@ -109,6 +109,22 @@ TEMPLATES = [
             ],
         },
     },
+    # Email templates (use with `render_to_string(..., using='emails')`). The celery workers render
+    # these for every notification, so keep the compiled templates cached regardless of DEBUG.
+    {
+        'NAME': 'emails',
+        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'DIRS': [
+            BASE_DIR + '/collab_app/templates/',
+        ],
+        'OPTIONS': {
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                ]),
+            ],
+        },
+    },
 ]
 
 WSGI_APPLICATION = 'collab.wsgi.application'
@@ -125,6 +141,8 @@ DATABASES = {
         "HOST": os.environ.get("POSTGRES_HOST"),
         "PASSWORD": os.environ.get("POSTGRES_PASSWORD"),
         "PORT": os.environ.get("POSTGRES_PORT"),
+        # close connections at the end of each request/task. The `io` worker relies on this (see WORKER_PROFILES).
+        "CONN_MAX_AGE": 0,
     }
 }
 
@@ -249,6 +267,7 @@ AWS_SECRET_ACCESS_KEY = os.environ.get('AWS_SECRET_ACCESS_KEY', '')
 # CELERY_BROKER_POOL_LIMIT = 1  # for now on free cloudamqp tier (heroku) (can increase later if needed)
 if ENVIRONMENT == 'development':
     CELERY_BROKER_URL = os.environ.get('CLOUDAMQP_URL', '')
+    CELERY_TASK_DEFAULT_QUEUE = 'celery'
 else:
     CELERY_BROKER_URL = f'sqs://{AWS_ACCESS_KEY_ID}:{AWS_SECRET_ACCESS_KEY}@'
     CELERY_TASK_DEFAULT_QUEUE = os.environ.get('CELERY_TASK_DEFAULT_QUEUE', 'collabsauce-staging')
@@ -256,6 +275,121 @@ else:
         'region': AWS_REGION
     }
 
+# Tasks that spend nearly all their time waiting on SMTP or S3 go to their own queue, consumed by the `io`
+# worker profile. Everything else (the CPU- and browser-heavy screenshot rendering) stays on the default queue.
+IO_TASK_QUEUE = f'{CELERY_TASK_DEFAULT_QUEUE}-io'
+IO_TASKS = (
+    'collab_app.tasks.dispatch_notification_outbox',
+    # deprecated, see `collab_app.tasks`
+    'collab_app.tasks.notify_participants_of_assignee_change',
+    'collab_app.tasks.notify_participants_of_task',
+    'collab_app.tasks.notify_participants_of_task_column_change',
+    'collab_app.tasks.notify_participants_of_task_comment',
+    'collab_app.tasks.send_notification_email_chunk',
+    'collab_app.tasks.upload_chrome_extension_screenshots_for_task',
+    'djcelery_email_send_multiple',
+)
+CELERY_TASK_ROUTES = {task_name: {'queue': IO_TASK_QUEUE} for task_name in IO_TASKS}
+
+# Celery worker profiles, started with `python manage.py celery_worker --profile <name>`.
+WORKER_PROFILES = {
+    # prefork, one process per cpu. Playwright needs a process of its own.
+    'default': {
+        'pool': 'prefork',
+        'concurrency': None,
+        'queues': [CELERY_TASK_DEFAULT_QUEUE],
+    },
+    # threads, so an idle SMTP/S3 call only costs a thread. Each thread opens its own (thread-local) database
+    # connection, and celery's django fixup closes it after every task since CONN_MAX_AGE is 0. Keep the
+    # concurrency below what postgres' max_connections can spare.
+    'io': {
+        'pool': 'threads',
+        'concurrency': int(os.environ.get('IO_WORKER_CONCURRENCY', 50)),
+        'queues': [IO_TASK_QUEUE],
+    },
+}
+
+# Notification outbox (see `collab_app.notifications`). Signals write to the outbox, and
+# celery beat periodically runs the dispatcher to drain it in batches.
+NOTIFICATION_OUTBOX_BATCH_SIZE = int(os.environ.get('NOTIFICATION_OUTBOX_BATCH_SIZE', 100))
+NOTIFICATION_OUTBOX_MAX_ATTEMPTS = int(os.environ.get('NOTIFICATION_OUTBOX_MAX_ATTEMPTS', 5))
+NOTIFICATION_OUTBOX_DISPATCH_INTERVAL = float(os.environ.get('NOTIFICATION_OUTBOX_DISPATCH_INTERVAL', 5.0))  # seconds
+# an entry claimed by a dispatcher that died is claimed again after this long. Longer than the chunk retries take.
+NOTIFICATION_OUTBOX_CLAIM_TIMEOUT = int(os.environ.get('NOTIFICATION_OUTBOX_CLAIM_TIMEOUT', 900))  # seconds
+
+# Notification fan-out (see `collab_app.notifications.fan_out_messages`). Recipients are sent in chunks
+# of NOTIFICATION_FANOUT_CHUNK_SIZE, in parallel, by at most NOTIFICATION_FANOUT_MAX_CHUNKS tasks per event.
+# The chunk tasks are already running on a worker, so they send through the real backend.
+NOTIFICATION_EMAIL_BACKEND = CELERY_EMAIL_BACKEND
+NOTIFICATION_FANOUT_CHUNK_SIZE = int(os.environ.get('NOTIFICATION_FANOUT_CHUNK_SIZE', 25))
+NOTIFICATION_FANOUT_MAX_CHUNKS = int(os.environ.get('NOTIFICATION_FANOUT_MAX_CHUNKS', 8))
+NOTIFICATION_CHUNK_MAX_RETRIES = int(os.environ.get('NOTIFICATION_CHUNK_MAX_RETRIES', 3))
+NOTIFICATION_CHUNK_RETRY_DELAY = int(os.environ.get('NOTIFICATION_CHUNK_RETRY_DELAY', 30))  # seconds, doubles per retry
+
+# Widget reports queued by `queue_task_from_widget_anonymous` (see `collab_app.widget`). The endpoint only
+# stores them, and celery beat periodically creates their tasks in batches.
+WIDGET_REPORT_BATCH_SIZE = int(os.environ.get('WIDGET_REPORT_BATCH_SIZE', 100))
+WIDGET_REPORT_MAX_BYTES = int(os.environ.get('WIDGET_REPORT_MAX_BYTES', 5 * 1024 * 1024))
+WIDGET_REPORT_PERSIST_INTERVAL = float(os.environ.get('WIDGET_REPORT_PERSIST_INTERVAL', 2.0))  # seconds
+WIDGET_PROJECT_KEY_CACHE_TTL = int(os.environ.get('WIDGET_PROJECT_KEY_CACHE_TTL', 5 * 60))
+
+# The live board order in Redis (see `collab_app.board`). Off unless BOARD_REDIS_URL is set. Moves are
+# written back to Postgres every BOARD_ORDER_FLUSH_INTERVAL seconds.
+BOARD_REDIS_URL = os.environ.get('BOARD_REDIS_URL', '')
+BOARD_REDIS_TTL = int(os.environ.get('BOARD_REDIS_TTL', 24 * 60 * 60))
+BOARD_ORDER_FLUSH_INTERVAL = float(os.environ.get('BOARD_ORDER_FLUSH_INTERVAL', 2.0))  # seconds
+
+# The cross-request cache of each user's organizations and projects (see `collab_app.permissions.cache`).
+# Off unless PERMISSION_CACHE_REDIS_URL is set.
+PERMISSION_CACHE_REDIS_URL = os.environ.get('PERMISSION_CACHE_REDIS_URL', '')
+PERMISSION_CACHE_TTL = int(os.environ.get('PERMISSION_CACHE_TTL', 60 * 60))
+
+# Enforce organization visibility with postgres row-level security policies on GET requests (see
+# `collab_app.permissions.row_level_security`). Run `manage.py row_level_security --enable` before turning it on.
+PERMISSION_ROW_LEVEL_SECURITY = int(os.environ.get('PERMISSION_ROW_LEVEL_SECURITY', 0))
+
+# Serve the task list of a board (`GET /api/tasks?filter{project}=...`) from `values()` rows instead of the
+# serializer (see `collab_app.task_list`).
+TASK_LIST_FAST_PATH = int(os.environ.get('TASK_LIST_FAST_PATH', 0))
+
+CELERY_BEAT_SCHEDULE = {
+    'dispatch-notification-outbox': {
+        'task': 'collab_app.tasks.dispatch_notification_outbox',
+        'schedule': NOTIFICATION_OUTBOX_DISPATCH_INTERVAL,
+        # don't pile up dispatchers in the queue if the workers are behind. The next beat will run one.
+        'options': {'expires': NOTIFICATION_OUTBOX_DISPATCH_INTERVAL},
+    },
+    'purge-expired-idempotency-keys': {
+        'task': 'collab_app.tasks.purge_expired_idempotency_keys',
+        'schedule': 60 * 60,
+    },
+    'flush-board-order': {
+        'task': 'collab_app.tasks.flush_board_order',
+        'schedule': BOARD_ORDER_FLUSH_INTERVAL,
+        'options': {'expires': BOARD_ORDER_FLUSH_INTERVAL},
+    },
+    'persist-widget-reports': {
+        'task': 'collab_app.tasks.persist_widget_reports',
+        'schedule': WIDGET_REPORT_PERSIST_INTERVAL,
+        'options': {'expires': WIDGET_REPORT_PERSIST_INTERVAL},
+    },
+}
+
+# Task ranks (see `collab_app.ranking`). A column is rebalanced once a move produces a longer rank than this.
+TASK_RANK_MAX_LENGTH = int(os.environ.get('TASK_RANK_MAX_LENGTH', 12))
+
+# How long (seconds) a project's Raw Task column id is cached (see `TaskColumn.raw_task_column_id`).
+TASK_COLUMN_ID_CACHE_TTL = int(os.environ.get('TASK_COLUMN_ID_CACHE_TTL', 24 * 60 * 60))
+
+# How long (seconds) a project's organization id is cached (see `Project.organization_id_for`).
+PROJECT_ORGANIZATION_ID_CACHE_TTL = int(os.environ.get('PROJECT_ORGANIZATION_ID_CACHE_TTL', 24 * 60 * 60))
+
+# The most tasks the widget can submit in one `create_tasks_from_widget` request.
+WIDGET_MAX_TASKS_PER_REQUEST = int(os.environ.get('WIDGET_MAX_TASKS_PER_REQUEST', 50))
+
+# How long (seconds) the response to a request with an `Idempotency-Key` is replayed to retries.
+IDEMPOTENCY_KEY_TTL = int(os.environ.get('IDEMPOTENCY_KEY_TTL', 24 * 60 * 60))
+
 # CORS
 # TODO(BRANDON) Fix for dev/stage/prod
 CORS_ORIGIN_WHITELIST = [
@@ -3,9 +3,17 @@ from django.contrib.auth.admin import UserAdmin as DjangoUserAdmin
 from django.utils.translation import ugettext_lazy as _
 
 from collab_app.models import (
+    BrowserName,
+    BrowserVersion,
+    IdempotencyKey,
     Invite,
     Membership,
+    NotificationDelivery,
+    NotificationOutbox,
     Organization,
+    OsName,
+    OsVersion,
+    OsVersionName,
     Profile,
     Project,
     Task,
@@ -14,14 +22,24 @@ from collab_app.models import (
     TaskHtml,
     TaskDataUrl,
     TaskMetadata,
+    UrlOrigin,
     User,
+    WidgetReport,
 )
 
 
 @admin.register(
+    BrowserName,
+    BrowserVersion,
+    IdempotencyKey,
     Invite,
     Membership,
+    NotificationDelivery,
+    NotificationOutbox,
     Organization,
+    OsName,
+    OsVersion,
+    OsVersionName,
     Profile,
     Project,
     Task,
@@ -30,6 +48,8 @@ from collab_app.models import (
     TaskHtml,
     TaskDataUrl,
     TaskMetadata,
+    UrlOrigin,
+    WidgetReport,
 )
 class DefaultAdmin(admin.ModelAdmin):
     readonly_fields = ('id',)
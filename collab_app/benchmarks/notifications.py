@@ -0,0 +1,195 @@
+import contextlib
+import statistics
+import time
+
+from celery import current_app
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils.crypto import get_random_string
+
+from collab_app.benchmarks.smtp_sink import SMTPSink
+from collab_app.models import (
+    Membership,
+    NotificationOutbox,
+    Organization,
+    Project,
+    Task,
+    TaskColumn,
+    TaskComment,
+    User,
+)
+from collab_app.notifications import (
+    dispatch_outbox_batch,
+    enqueue_notification,
+)
+
+
+@contextlib.contextmanager
+def eager_celery():
+    # run the chunk groups the dispatcher fans out in this process.
+    conf = current_app.conf
+    previous = (conf.task_always_eager, conf.task_eager_propagates)
+    conf.task_always_eager, conf.task_eager_propagates = True, True
+    try:
+        yield
+    finally:
+        conf.task_always_eager, conf.task_eager_propagates = previous
+
+
+def mention(user):
+    return f'@@@__{user.id}^^^{user.first_name} {user.last_name}@@@^^^'
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(percent / 100 * (len(values) - 1))))]
+
+
+class NotificationBenchmark(object):
+    """
+    Fire comments and column moves through the notification outbox against a local SMTP sink: each event is
+    written to the outbox like the signals and views do, and sent by `dispatch_outbox_batch`. Measures
+    emails/sec, queries per event and end-to-end latency.
+
+    The seeded organization is created with `bulk_create`, so no notification signals fire
+    while seeding. It is deleted again at the end of the run. The dispatcher would send any other pending
+    entry too, so the run refuses to start while the outbox has some.
+    """
+
+    def __init__(self, events=50, participants=20, thread_length=30):
+        self.events = events
+        self.participants = participants
+        self.thread_length = thread_length
+        self.token = get_random_string(length=8).lower()
+        self.outbox_ids = []
+
+    def seed(self):
+        self.organization = Organization.objects.create(name=f'benchmark-{self.token}')
+        self.users = User.objects.bulk_create([
+            User(
+                email=f'benchmark-{self.token}-{i}@example.com',
+                first_name='Bench',
+                last_name=f'Mark {i}',
+            )
+            for i in range(self.participants)
+        ])
+        Membership.objects.bulk_create([
+            Membership(organization=self.organization, user=user) for user in self.users
+        ])
+        self.project = Project.objects.bulk_create([
+            Project(name='Benchmark', key=get_random_string(length=32), organization=self.organization)
+        ])[0]
+        self.task_columns = TaskColumn.objects.bulk_create([
+            TaskColumn(name=name, project=self.project, order=order)
+            for order, name in enumerate(TaskColumn.TASK_COLUMN_NAMES, 1)
+        ])
+        self.task = Task.objects.bulk_create([
+            Task(
+                title=f'Fix the header, {mention(self.users[-1])}',
+                has_target=False,
+                task_number=1,
+                project=self.project,
+                organization=self.organization,
+                task_column=self.task_columns[0],
+                creator=self.users[0],
+                assigned_to=self.users[1 % self.participants],
+            )
+        ])[0]
+        # a realistic thread: everyone comments, and every third comment mentions someone.
+        TaskComment.objects.bulk_create([
+            TaskComment(
+                task=self.task,
+                project=self.project,
+                organization=self.organization,
+                creator=self.users[i % self.participants],
+                text=f'Looks good {mention(self.users[(i * 7) % self.participants])}' if i % 3 == 0 else 'Looks good'
+            )
+            for i in range(self.thread_length)
+        ])
+
+    def cleanup(self):
+        NotificationOutbox.objects.filter(id__in=self.outbox_ids).delete()
+        TaskComment.objects.filter(task__project=self.project).delete()
+        Task.objects.filter(project=self.project).delete()
+        TaskColumn.objects.filter(project=self.project).delete()
+        self.project.delete()
+        Membership.objects.filter(organization=self.organization).delete()
+        self.organization.delete()
+        User.objects.filter(id__in=[user.id for user in self.users]).delete()
+
+    def fire_comment(self, i):
+        creator = self.users[i % self.participants]
+        comment = TaskComment.objects.bulk_create([
+            TaskComment(
+                task=self.task,
+                project=self.project,
+                organization=self.organization,
+                creator=creator,
+                text=f'Another look {mention(self.users[-1 - i % 2])}'
+            )
+        ])[0]
+        self.dispatch(NotificationOutbox.EventType.TASK_COMMENT_CREATED, task_comment_id=comment.id)
+
+    def fire_column_move(self, i):
+        prev_task_column, new_task_column = self.task_columns[i % 2], self.task_columns[(i + 1) % 2]
+        Task.objects.filter(id=self.task.id).update(task_column=new_task_column)
+        self.dispatch(
+            NotificationOutbox.EventType.TASK_COLUMN_CHANGED,
+            task_id=self.task.id,
+            prev_task_column_id=prev_task_column.id,
+            new_task_column_id=new_task_column.id,
+            mover_id=self.users[i % self.participants].id
+        )
+
+    def dispatch(self, event, **payload):
+        self.outbox_ids.append(enqueue_notification(event, **payload).id)
+        dispatch_outbox_batch()
+
+    def measure(self, name, fire, sink):
+        latencies = []
+        query_counts = []
+        first_message_count = sink.message_count
+        start = time.perf_counter()
+        for i in range(self.events):
+            event_start = time.perf_counter()
+            with CaptureQueriesContext(connection) as queries:
+                fire(i)
+            # the smtp backend only returns once the sink has accepted the message, so the event is
+            # delivered end to end here.
+            latencies.append(time.perf_counter() - event_start)
+            query_counts.append(len(queries.captured_queries))
+        elapsed = time.perf_counter() - start
+        emails = sink.message_count - first_message_count
+        return {
+            'name': name,
+            'events': self.events,
+            'emails': emails,
+            'seconds': elapsed,
+            'emails_per_second': emails / elapsed if elapsed else 0,
+            'queries_per_event': statistics.mean(query_counts),
+            'max_queries_per_event': max(query_counts),
+            'latency_p50_ms': percentile(latencies, 50) * 1000,
+            'latency_p95_ms': percentile(latencies, 95) * 1000,
+            'latency_max_ms': max(latencies) * 1000,
+        }
+
+    def run(self):
+        if NotificationOutbox.objects.filter(state=NotificationOutbox.OutboxState.PENDING).exists():
+            raise ValueError('The notification outbox has pending entries. Dispatch them before benchmarking.')
+        with SMTPSink() as sink, eager_celery(), override_settings(
+            NOTIFICATION_EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend',
+            EMAIL_HOST=sink.host,
+            EMAIL_PORT=sink.port,
+            EMAIL_HOST_USER='benchmark@example.com',
+            EMAIL_HOST_PASSWORD='',
+            EMAIL_USE_TLS=False,
+            EMAIL_USE_SSL=False,
+        ):
+            self.seed()
+            try:
+                return [
+                    self.measure('comments', self.fire_comment, sink),
+                    self.measure('column moves', self.fire_column_move, sink),
+                ]
+            finally:
+                self.cleanup()
@@ -0,0 +1,307 @@
+import json
+import re
+import statistics
+import time
+
+from django.db import connection
+from django.db.models import Q
+from django.test.utils import CaptureQueriesContext
+from django.utils.crypto import get_random_string
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from collab_app.benchmarks.notifications import percentile
+from collab_app.models import (
+    Invite,
+    Membership,
+    Organization,
+    Profile,
+    Project,
+    Task,
+    TaskColumn,
+    TaskComment,
+    TaskMetadata,
+    User,
+)
+from collab_app.permissions.object_level import BaseQuerySetPermission, OrganizationAccess
+from collab_app.views import (
+    MembershipViewSet,
+    OrganizationViewSet,
+    ProjectViewSet,
+    TaskCommentViewSet,
+    TaskViewSet,
+    UserViewSet,
+)
+
+
+# {size name: seeding options}. The benchmarked user is in `organizations` organizations of `members`
+# members each, and `foreign_organizations` more organizations of the same size hold rows they can't see.
+SIZES = {
+    'small': {'organizations': 3, 'foreign_organizations': 2, 'members': 100, 'tasks': 10000},
+    'medium': {'organizations': 3, 'foreign_organizations': 2, 'members': 1000, 'tasks': 100000},
+    'large': {'organizations': 3, 'foreign_organizations': 2, 'members': 10000, 'tasks': 1000000},
+}
+
+# The join filters the permission classes used before they filtered by the user's resolved organizations.
+# Benchmarked with `joins=True`, to compare.
+JOIN_FILTERS = {
+    Membership: lambda queryset, user: queryset.filter(organization__memberships__user=user),
+    Project: lambda queryset, user: queryset.filter(organization__memberships__user=user),
+    Task: lambda queryset, user: queryset.filter(project__organization__memberships__user=user),
+    TaskComment: lambda queryset, user: queryset.filter(task__project__organization__memberships__user=user),
+    User: lambda queryset, user: queryset.filter(
+        Q(id=user.id) |
+        Q(memberships__organization__memberships__user=user)
+    ),
+}
+
+# the list endpoints the app loads, with the query parameters it sends. `project` is filled in with one of
+# the user's projects.
+ENDPOINTS = (
+    (OrganizationViewSet, {}),
+    (ProjectViewSet, {}),
+    (MembershipViewSet, {'per_page': 100, 'include[]': ['user.*']}),
+    (UserViewSet, {'per_page': 100}),
+    (TaskViewSet, {
+        'per_page': 100,
+        'filter{project}': 'project',
+        'include[]': ['creator.*', 'task_metadata.*', 'task_comments.*']
+    }),
+    (TaskCommentViewSet, {'per_page': 100, 'include[]': ['creator.*']}),
+)
+
+BATCH_SIZE = 5000
+
+
+def scanned_tables(plan):
+    # the tables a postgres plan reads with a sequential scan
+    return sorted(set(re.findall(r'Seq Scan on (\w+)', plan)))
+
+
+class PermissionBenchmark(object):
+    """
+    Run each permission class's `read` and `update` filter, and the main list endpoints, against a synthetic
+    tenant (see SIZES), and record the latency, the rows and the query plan (`EXPLAIN ANALYZE` on postgres)
+    of each. `compare` checks the results against a baseline from an earlier run.
+
+    The seeded rows are created with `bulk_create`, so no signals fire, and are deleted again at the end of
+    the run. The large size seeds a million tasks: give it a few minutes.
+    """
+
+    def __init__(
+        self,
+        organizations=3,
+        foreign_organizations=2,
+        members=1000,
+        tasks=10000,
+        projects_per_organization=5,
+        repeat=5,
+        joins=False
+    ):
+        self.organizations = organizations
+        self.foreign_organizations = foreign_organizations
+        self.members = members
+        self.tasks = tasks
+        self.projects_per_organization = projects_per_organization
+        self.repeat = repeat
+        self.joins = joins
+        self.token = get_random_string(length=8).lower()
+
+    def seed(self):
+        self.organization_rows = Organization.objects.bulk_create([
+            Organization(name=f'benchmark-{self.token}-{i}')
+            for i in range(self.organizations + self.foreign_organizations)
+        ])
+        self.users = User.objects.bulk_create([
+            User(email=f'benchmark-{self.token}-{i}@example.com', first_name='Bench', last_name=f'Mark {i}')
+            for i in range(self.members)
+        ], batch_size=BATCH_SIZE)
+        self.user = self.users[0]
+        Profile.objects.bulk_create([Profile(user=user) for user in self.users], batch_size=BATCH_SIZE)
+
+        # everyone else is in every organization, which is the worst case for the join fan-out
+        Membership.objects.bulk_create([
+            Membership(organization=organization, user=user, role=Membership.RoleType.ADMIN)
+            for i, organization in enumerate(self.organization_rows)
+            for user in (self.users if i < self.organizations else self.users[1:])
+        ], batch_size=BATCH_SIZE)
+        Invite.objects.bulk_create([
+            Invite(
+                organization=organization,
+                inviter=self.users[1 % self.members],
+                email=f'invited-{self.token}-{i}@example.com',
+                key=get_random_string(length=64)
+            )
+            for i, organization in enumerate(self.organization_rows)
+        ])
+
+        self.projects = Project.objects.bulk_create([
+            Project(name=f'Benchmark {i}', key=get_random_string(length=32), organization=organization)
+            for organization in self.organization_rows
+            for i in range(self.projects_per_organization)
+        ])
+        task_columns = TaskColumn.objects.bulk_create([
+            TaskColumn(name=TaskColumn.TASK_COLUMN_RAW_TASK, project=project) for project in self.projects
+        ])
+        lookup_ids = {
+            f'{field_name}_id': TaskMetadata._meta.get_field(field_name).related_model.objects.id_for('')
+            for field_name in TaskMetadata.LOOKUP_FIELDS
+        }
+        for start in range(0, self.tasks, BATCH_SIZE):
+            task_rows = Task.objects.bulk_create([
+                Task(
+                    title=f'Task {i}',
+                    has_target=False,
+                    task_number=i + 1,
+                    project=self.projects[i % len(self.projects)],
+                    organization_id=self.projects[i % len(self.projects)].organization_id,
+                    task_column=task_columns[i % len(self.projects)],
+                    creator=self.users[i % self.members],
+                )
+                for i in range(start, min(start + BATCH_SIZE, self.tasks))
+            ])
+            TaskComment.objects.bulk_create([
+                TaskComment(
+                    task=task,
+                    project_id=task.project_id,
+                    organization_id=task.organization_id,
+                    creator=self.users[task.task_number % self.members],
+                    text='Looks good'
+                )
+                for task in task_rows
+            ])
+            TaskMetadata.objects.bulk_create([
+                TaskMetadata(task=task, project_id=task.project_id, organization_id=task.organization_id, **lookup_ids)
+                for task in task_rows
+            ])
+        # postgres plans with the statistics of the empty tables otherwise
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+
+    def cleanup(self):
+        organization_ids = [organization.id for organization in self.organization_rows]
+        TaskMetadata.objects.filter(organization_id__in=organization_ids).delete()
+        TaskComment.objects.filter(organization_id__in=organization_ids).delete()
+        Task.objects.filter(organization_id__in=organization_ids).delete()
+        TaskColumn.objects.filter(project__in=self.projects).delete()
+        Project.objects.filter(organization_id__in=organization_ids).delete()
+        Invite.objects.filter(organization_id__in=organization_ids).delete()
+        Membership.objects.filter(organization_id__in=organization_ids).delete()
+        Organization.objects.filter(id__in=organization_ids).delete()
+        Profile.objects.filter(user__in=self.users).delete()
+        User.objects.filter(id__in=[user.id for user in self.users]).delete()
+
+    def time(self, run):
+        # returns the last result, the latencies and the number of queries of the last run
+        latencies = []
+        for _ in range(self.repeat):
+            with CaptureQueriesContext(connection) as context:
+                start = time.perf_counter()
+                result = run()
+                latencies.append(time.perf_counter() - start)
+        return result, latencies, len(context.captured_queries)
+
+    def summarize(self, name, rows, latencies, queries, plan=''):
+        return {
+            'name': name,
+            'rows': rows,
+            'queries': queries,
+            'latency_p50_ms': percentile(latencies, 50) * 1000,
+            'latency_p95_ms': percentile(latencies, 95) * 1000,
+            'latency_mean_ms': statistics.mean(latencies) * 1000,
+            'plan': plan,
+            'seq_scans': scanned_tables(plan),
+        }
+
+    def measure_queryset(self, name, queryset):
+        queryset = queryset.values_list('id', flat=True)
+        ids, latencies, queries = self.time(lambda: list(queryset.all()))
+        if connection.vendor == 'postgresql':
+            plan = queryset.explain(analyze=True, buffers=True)
+        else:
+            plan = queryset.explain()
+        return self.summarize(name, len(ids), latencies, queries, plan)
+
+    def measure_endpoint(self, viewset, params):
+        resource = viewset.serializer_class.get_plural_name()
+        params = {key: self.projects[0].id if value == 'project' else value for key, value in params.items()}
+        view = viewset.as_view({'get': 'list'})
+
+        def get():
+            request = APIRequestFactory().get(f'/api/{resource}', params)
+            force_authenticate(request, user=self.user)
+            return view(request)
+
+        response, latencies, queries = self.time(get)
+        if response.status_code != 200:
+            raise ValueError(f'GET /api/{resource} returned {response.status_code}: {response.data}')
+        return self.summarize(f'GET /api/{resource}', len(response.data[resource]), latencies, queries)
+
+    def run(self):
+        self.seed()
+        try:
+            # resolved once per request, outside of the timed queries
+            access = OrganizationAccess.for_user(self.user)
+            results = []
+            for model, permission in BaseQuerySetPermission.object_perm_mapping.items():
+                queryset = model.objects.all()
+                results.append(self.measure_queryset(
+                    f'{model.__name__} read',
+                    permission.read(queryset, self.user, access)
+                ))
+                results.append(self.measure_queryset(
+                    f'{model.__name__} update',
+                    permission.update(queryset, self.user, access)
+                ))
+                if self.joins and model in JOIN_FILTERS:
+                    results.append(self.measure_queryset(
+                        f'{model.__name__} read (join)',
+                        JOIN_FILTERS[model](queryset, self.user)
+                    ))
+            for viewset, params in ENDPOINTS:
+                results.append(self.measure_endpoint(viewset, params))
+            return results
+        finally:
+            self.cleanup()
+
+
+def load_baseline(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_baseline(path, results_by_size):
+    # the plans themselves aren't kept, only the tables they scan sequentially
+    baseline = {
+        size: {
+            result['name']: {key: value for key, value in result.items() if key not in ('name', 'plan')}
+            for result in results
+        }
+        for size, results in results_by_size.items()
+    }
+    with open(path, 'w') as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+
+
+def compare(results, baseline, tolerance=0.5, min_latency_ms=1.0):
+    """
+    Return the regressions of `results` against the `baseline` of the same size, as messages: a different
+    number of rows, more queries, a new sequential scan, or a p50 latency more than `tolerance` (and
+    `min_latency_ms`) above the baseline's.
+    """
+    regressions = []
+    for result in results:
+        name, expected = result['name'], baseline.get(result['name'])
+        if expected is None:
+            continue
+        if result['rows'] != expected['rows']:
+            regressions.append(f'{name}: {result["rows"]} rows, the baseline had {expected["rows"]}')
+        if result['queries'] > expected['queries']:
+            regressions.append(f'{name}: {result["queries"]} queries, the baseline had {expected["queries"]}')
+        new_seq_scans = set(result['seq_scans']) - set(expected['seq_scans'])
+        if new_seq_scans:
+            regressions.append(f'{name}: new sequential scans on {", ".join(sorted(new_seq_scans))}')
+        latency, expected_latency = result['latency_p50_ms'], expected['latency_p50_ms']
+        if latency > expected_latency * (1 + tolerance) and latency - expected_latency > min_latency_ms:
+            regressions.append(f'{name}: p50 {latency:.1f}ms, the baseline had {expected_latency:.1f}ms')
+    return regressions
@@ -0,0 +1,49 @@
+import asyncore
+import smtpd
+import threading
+import time
+
+
+class SMTPSink(smtpd.SMTPServer):
+    """
+    A local SMTP server that accepts every message and throws it away, keeping count.
+
+    Point the smtp email backend at it (EMAIL_HOST/EMAIL_PORT) to measure email throughput without
+    sending anything to a real provider. It serves from a background thread:
+
+        with SMTPSink() as sink:
+            ...send emails to ('127.0.0.1', sink.port)...
+            sink.message_count
+    """
+
+    def __init__(self, host='127.0.0.1', port=0):
+        self._map = {}
+        super(SMTPSink, self).__init__((host, port), None, map=self._map, decode_data=False)
+        self.host, self.port = self.socket.getsockname()[:2]
+        self.message_count = 0
+        self.recipient_count = 0
+        self.last_received_at = None
+        self._thread = None
+
+    def process_message(self, peer, mailfrom, rcpttos, data, **kwargs):
+        self.message_count += 1
+        self.recipient_count += len(rcpttos)
+        self.last_received_at = time.perf_counter()
+
+    def start(self):
+        self._thread = threading.Thread(target=asyncore.loop, kwargs={'timeout': 0.05, 'map': self._map})
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        # closing every channel empties the map, which ends the `asyncore.loop` in the thread.
+        asyncore.close_all(map=self._map)
+        if self._thread:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
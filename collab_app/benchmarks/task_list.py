@@ -0,0 +1,167 @@
+import json
+import time
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils.crypto import get_random_string
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from collab_app.benchmarks.notifications import percentile
+from collab_app.models import (
+    Membership,
+    Organization,
+    Profile,
+    Project,
+    Task,
+    TaskColumn,
+    TaskComment,
+    TaskMetadata,
+    User,
+)
+from collab_app.serializers import TaskSerializer
+from collab_app.views import TaskViewSet
+
+
+# the board requests, as query parameters besides `filter{project}`
+REQUESTS = {
+    'fields': {},
+    'ids and names': {'include[]': list(TaskSerializer.Meta.deferred_fields)},
+}
+
+BATCH_SIZE = 5000
+
+
+class TaskListBenchmark(object):
+    """
+    Request the task list of a seeded board with the serializer, and with the fast path of
+    `collab_app.task_list`, and compare their latency, CPU time and queries. Checks that both render the
+    same JSON first.
+
+    The seeded rows are created with `bulk_create`, so no signals fire, and are deleted again at the end of
+    the run.
+    """
+
+    def __init__(self, tasks=2000, comments_per_task=2, repeat=5):
+        self.tasks = tasks
+        self.comments_per_task = comments_per_task
+        self.repeat = repeat
+        self.token = get_random_string(length=8).lower()
+
+    def seed(self):
+        self.organization = Organization.objects.create(name=f'benchmark-{self.token}')
+        self.users = User.objects.bulk_create([
+            User(email=f'benchmark-{self.token}-{i}@example.com', first_name='Bench', last_name=f'Mark {i}')
+            for i in range(10)
+        ])
+        self.user = self.users[0]
+        Profile.objects.bulk_create([Profile(user=user) for user in self.users])
+        Membership.objects.bulk_create([
+            Membership(organization=self.organization, user=user) for user in self.users
+        ])
+        self.project = Project.objects.bulk_create([
+            Project(name='Benchmark', key=get_random_string(length=32), organization=self.organization)
+        ])[0]
+        task_columns = TaskColumn.objects.bulk_create([
+            TaskColumn(name=name, project=self.project, order=order)
+            for order, name in enumerate(TaskColumn.TASK_COLUMN_NAMES, 1)
+        ])
+        lookup_ids = {
+            f'{field_name}_id': TaskMetadata._meta.get_field(field_name).related_model.objects.id_for('')
+            for field_name in TaskMetadata.LOOKUP_FIELDS
+        }
+        for start in range(0, self.tasks, BATCH_SIZE):
+            task_rows = Task.objects.bulk_create([
+                Task(
+                    title=f'Task {i}',
+                    description='The header overlaps the menu on small screens.',
+                    has_target=False,
+                    task_number=i + 1,
+                    order=i,
+                    project=self.project,
+                    organization=self.organization,
+                    task_column=task_columns[i % len(task_columns)],
+                    creator=self.users[i % len(self.users)],
+                    assigned_to=self.users[(i + 1) % len(self.users)] if i % 2 else None,
+                )
+                for i in range(start, min(start + BATCH_SIZE, self.tasks))
+            ])
+            TaskComment.objects.bulk_create([
+                TaskComment(
+                    task=task,
+                    project=self.project,
+                    organization=self.organization,
+                    creator=self.users[(task.task_number + i) % len(self.users)],
+                    text='Looks good'
+                )
+                for task in task_rows
+                for i in range(self.comments_per_task)
+            ], batch_size=BATCH_SIZE)
+            TaskMetadata.objects.bulk_create([
+                TaskMetadata(task=task, project=self.project, organization=self.organization, **lookup_ids)
+                for task in task_rows
+            ])
+
+    def cleanup(self):
+        TaskMetadata.objects.filter(project=self.project).delete()
+        TaskComment.objects.filter(project=self.project).delete()
+        Task.objects.filter(project=self.project).delete()
+        TaskColumn.objects.filter(project=self.project).delete()
+        self.project.delete()
+        Membership.objects.filter(organization=self.organization).delete()
+        self.organization.delete()
+        Profile.objects.filter(user__in=self.users).delete()
+        User.objects.filter(id__in=[user.id for user in self.users]).delete()
+
+    def get(self, params, fast_path):
+        view = TaskViewSet.as_view({'get': 'list'})
+        request = APIRequestFactory().get('/api/tasks', {'filter{project}': self.project.id, **params})
+        force_authenticate(request, user=self.user)
+        with override_settings(TASK_LIST_FAST_PATH=fast_path):
+            response = view(request)
+            # rendered like the server would
+            response.render()
+        if response.status_code != 200:
+            raise ValueError(f'GET /api/tasks returned {response.status_code}: {response.data}')
+        return response
+
+    def measure(self, name, params, fast_path):
+        latencies, cpu_times = [], []
+        for _ in range(self.repeat):
+            with CaptureQueriesContext(connection) as context:
+                start, cpu_start = time.perf_counter(), time.process_time()
+                response = self.get(params, fast_path)
+                latencies.append(time.perf_counter() - start)
+                cpu_times.append(time.process_time() - cpu_start)
+        return {
+            'name': f'{name} ({"fast path" if fast_path else "serializer"})',
+            'tasks': len(response.data['tasks']),
+            'queries': len(context.captured_queries),
+            'latency_p50_ms': percentile(latencies, 50) * 1000,
+            'latency_p95_ms': percentile(latencies, 95) * 1000,
+            'cpu_p50_ms': percentile(cpu_times, 50) * 1000,
+        }
+
+    def check(self, name, params):
+        # both render the same tasks. The order of the unordered lists can differ between the two queries.
+        def normalized(response):
+            tasks = json.loads(response.content)['tasks']
+            for task in tasks:
+                task.get('task_comments', []).sort()
+            return sorted(tasks, key=lambda task: task['id'])
+
+        if normalized(self.get(params, fast_path=0)) != normalized(self.get(params, fast_path=1)):
+            raise ValueError(f'{name}: the fast path renders different tasks than the serializer')
+
+    def run(self):
+        self.seed()
+        try:
+            results = []
+            for name, params in REQUESTS.items():
+                self.check(name, params)
+                serializer = self.measure(name, params, fast_path=0)
+                fast_path = self.measure(name, params, fast_path=1)
+                fast_path['speedup'] = serializer['cpu_p50_ms'] / fast_path['cpu_p50_ms']
+                results += [serializer, fast_path]
+            return results
+        finally:
+            self.cleanup()
@@ -0,0 +1,369 @@
+import logging
+import uuid
+
+import redis
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from sentry_sdk import capture_exception
+
+from collab_app.models import (
+    Task,
+    TaskColumn,
+)
+from collab_app.ranking import rerank
+from collab_app.tasks import rebalance_task_column
+from collab_app.utils import update_from_values
+
+
+"""
+The live order of the boards, in Redis. Optional: it is on when BOARD_REDIS_URL is set.
+
+Each task column is a sorted set of task ids (`board:column:<id>`), scored by position. Moving a task
+(`move_task`) is one atomic script in Redis, and doesn't write to Postgres unless the task changes columns.
+Moved columns are added to the `board:dirty` set, and `flush_board_order` (run by celery beat) writes their
+order back to `Task.order` and `Task.rank`. A column that isn't in Redis is loaded from Postgres when it is
+first read or moved in.
+
+Code that writes the order of a column straight to Postgres (reordering, creating tasks, ...) calls
+`sync_columns` first. That writes the column's pending moves to Postgres, and drops the column from Redis
+once the transaction commits, so it is loaded again with the new order. Until then the column is marked as
+syncing (`board:syncing:<id>`), and moves in it fail with ColumnSyncing, so they are written to Postgres
+instead of to a copy that is about to be dropped.
+"""
+
+logger = logging.getLogger('collabsauce')
+
+DIRTY_KEY = 'board:dirty'
+# every loaded column holds this member, scored -inf, so an empty column is still a key in Redis.
+# MOVE_SCRIPT skips it by name.
+SENTINEL = 'column'
+# how long a column stays marked as syncing if its transaction never commits
+SYNCING_TTL = 60
+
+# KEYS: the task's current column, the column it moves to, the dirty set, and the syncing marks of both columns.
+# ARGV: the task id, the id of the task right above the new position, the id of the task right below it
+# ('' for the top or the bottom of the column), the ttl of the columns, the id of the column it moves to.
+# Returns 'syncing' if a column is being written to Postgres, 'missing' if a column isn't loaded, 'stale' if
+# the neighbours aren't next to each other in the column, 'full' if there is no score left between them, or 'ok'.
+MOVE_SCRIPT = """
+if redis.call('exists', KEYS[4]) == 1 or redis.call('exists', KEYS[5]) == 1 then
+    return 'syncing'
+end
+if redis.call('exists', KEYS[1]) == 0 or redis.call('exists', KEYS[2]) == 0 then
+    return 'missing'
+end
+local task_id, before_id, after_id = ARGV[1], ARGV[2], ARGV[3]
+if before_id == task_id or after_id == task_id then
+    return 'stale'
+end
+
+-- the score of the first task in a range of the column, other than the moved task
+local function neighbour(command, from, to)
+    local members = redis.call(command, KEYS[2], from, to, 'WITHSCORES', 'LIMIT', 0, 2)
+    for i = 1, #members, 2 do
+        if members[i] ~= task_id and members[i] ~= 'column' then
+            return members[i + 1]
+        end
+    end
+    return nil
+end
+
+local low, high
+if before_id ~= '' then
+    low = redis.call('zscore', KEYS[2], before_id)
+    if not low then
+        return 'stale'
+    end
+end
+if after_id ~= '' then
+    high = redis.call('zscore', KEYS[2], after_id)
+    if not high then
+        return 'stale'
+    end
+end
+
+local score
+if low and high then
+    if tonumber(low) >= tonumber(high) or neighbour('zrangebyscore', '(' .. low, '(' .. high) then
+        return 'stale'
+    end
+    score = (tonumber(low) + tonumber(high)) / 2
+elseif low then
+    high = neighbour('zrangebyscore', '(' .. low, '+inf')
+    score = high and (tonumber(low) + tonumber(high)) / 2 or tonumber(low) + 1
+elseif high then
+    low = neighbour('zrevrangebyscore', '(' .. high, '-inf')
+    score = low and (tonumber(low) + tonumber(high)) / 2 or tonumber(high) - 1
+else
+    low = neighbour('zrevrangebyscore', '+inf', '-inf')
+    score = low and tonumber(low) + 1 or 1
+end
+if (low and score <= tonumber(low)) or (high and score >= tonumber(high)) then
+    return 'full'
+end
+
+redis.call('zrem', KEYS[1], task_id)
+redis.call('zadd', KEYS[2], string.format('%.17g', score), task_id)
+redis.call('sadd', KEYS[3], ARGV[5])
+redis.call('expire', KEYS[1], ARGV[4])
+redis.call('expire', KEYS[2], ARGV[4])
+return 'ok'
+"""
+
+_redis = None
+_move_script = None
+
+
+class ColumnSyncing(Exception):
+    pass
+
+
+def is_enabled():
+    return bool(settings.BOARD_REDIS_URL)
+
+
+def get_redis():
+    global _redis, _move_script
+    if _redis is None:
+        _redis = redis.Redis.from_url(settings.BOARD_REDIS_URL, decode_responses=True)
+        _move_script = _redis.register_script(MOVE_SCRIPT)
+    return _redis
+
+
+def column_key(task_column_id):
+    return f'board:column:{task_column_id}'
+
+
+def syncing_key(task_column_id):
+    return f'board:syncing:{task_column_id}'
+
+
+def get_board_order(task_column_ids):
+    """
+    Return {task column id: [task ids, in board order]}. Read from Redis when it is on, else from Postgres.
+    """
+    if is_enabled():
+        try:
+            return get_redis_board_order(task_column_ids)
+        except redis.RedisError as err:
+            logger.info('Failed to read the board order from redis')
+            capture_exception(err)
+            logger.info(err)
+    return get_db_board_order(task_column_ids)
+
+
+def get_db_board_order(task_column_ids):
+    board_order = {task_column_id: [] for task_column_id in task_column_ids}
+    for task_column_id, task_id in Task.objects.filter(
+        task_column_id__in=task_column_ids
+    ).order_by('task_column_id', 'rank', 'id').values_list('task_column_id', 'id'):
+        board_order[task_column_id].append(task_id)
+    return board_order
+
+
+def get_redis_board_order(task_column_ids):
+    pipeline = get_redis().pipeline(transaction=False)
+    for task_column_id in task_column_ids:
+        pipeline.zrange(column_key(task_column_id), 0, -1)
+    board_order = {}
+    missing = []
+    for task_column_id, members in zip(task_column_ids, pipeline.execute()):
+        if members:
+            board_order[task_column_id] = [int(member) for member in members if member != SENTINEL]
+        else:
+            missing.append(task_column_id)
+    if missing:
+        board_order.update(load_columns(missing))
+    return board_order
+
+
+def load_columns(task_column_ids):
+    # (re)load columns into Redis from Postgres. Returns {task column id: [task ids]}.
+    board_order = get_db_board_order(task_column_ids)
+    pipeline = get_redis().pipeline()
+    for task_column_id, task_ids in board_order.items():
+        key = column_key(task_column_id)
+        pipeline.delete(key)
+        pipeline.zadd(key, {SENTINEL: float('-inf'), **{task_id: i for i, task_id in enumerate(task_ids, 1)}})
+        pipeline.expire(key, settings.BOARD_REDIS_TTL)
+    pipeline.execute()
+    return board_order
+
+
+def respace_column(task_column_id):
+    # give the tasks of a column whole number scores again, in the same order
+    key = column_key(task_column_id)
+    task_ids = [member for member in get_redis().zrange(key, 0, -1) if member != SENTINEL]
+    get_redis().zadd(key, {task_id: i for i, task_id in enumerate(task_ids, 1)}, xx=True)
+
+
+def move_task(task_id, prev_task_column_id, task_column_id, before_id=None, after_id=None):
+    """
+    Move a task between two neighbours in Redis. `before_id` is the task right above the new position and
+    `after_id` the task right below it. Raises ValueError if they aren't next to each other any more, and
+    ColumnSyncing if one of the columns is being written to Postgres.
+    """
+    keys = [
+        column_key(prev_task_column_id),
+        column_key(task_column_id),
+        DIRTY_KEY,
+        syncing_key(prev_task_column_id),
+        syncing_key(task_column_id),
+    ]
+    args = [task_id, before_id or '', after_id or '', settings.BOARD_REDIS_TTL, task_column_id]
+    get_redis()
+    for _ in range(3):
+        result = _move_script(keys=keys, args=args)
+        if result == 'ok':
+            return
+        if result == 'stale':
+            raise ValueError('The neighbours are not next to each other.')
+        if result == 'syncing':
+            raise ColumnSyncing(f'Task {task_id} moves between columns that are being synced.')
+        if result == 'missing':
+            load_columns([
+                column_id for column_id in {prev_task_column_id, task_column_id}
+                if not get_redis().exists(column_key(column_id))
+            ])
+        elif result == 'full':
+            respace_column(task_column_id)
+    raise redis.RedisError(f'Could not move task {task_id}: {result}')
+
+
+def lock_column(task_column_id):
+    # like the board writes do (see `TaskColumn.lock_versions`)
+    list(TaskColumn.objects.select_for_update().filter(id=task_column_id).values_list('id'))
+
+
+def write_column_order(task_column_id, task_ids):
+    """
+    Write the order of a column's tasks (`task_ids`, in board order) to `Task.order` and `Task.rank`. Tasks
+    that are no longer in the column are skipped. Call inside a transaction.
+    """
+    lock_column(task_column_id)
+    current = {
+        task_id: (order, rank)
+        for task_id, order, rank in Task.objects.filter(
+            id__in=task_ids,
+            task_column_id=task_column_id
+        ).values_list('id', 'order', 'rank')
+    }
+    task_ids = [task_id for task_id in task_ids if task_id in current]
+    new_ranks = rerank([current[task_id][1] for task_id in task_ids])
+
+    now = timezone.now()
+    changed_rows = []
+    for position, task_id in enumerate(task_ids):
+        order, rank = position + 1, new_ranks.get(position, current[task_id][1])
+        if (order, rank) != current[task_id]:
+            changed_rows.append((task_id, order, rank, now))
+    update_from_values(Task, ['order', 'rank', 'updated'], sorted(changed_rows))
+    if changed_rows:
+        TaskColumn.bump_versions([task_column_id])
+    if any(len(row[2]) > settings.TASK_RANK_MAX_LENGTH for row in changed_rows):
+        rebalance_task_column.delay_on_commit(task_column_id)
+    return len(changed_rows)
+
+
+def flush_board_order():
+    """
+    Write the order of the columns moved in Redis to Postgres. Returns the number of columns written.
+    """
+    if not is_enabled():
+        return 0
+    client = get_redis()
+    # take the dirty set, so moves made while flushing mark their column dirty again
+    flushing_key = f'board:flushing:{uuid.uuid4().hex}'
+    try:
+        client.rename(DIRTY_KEY, flushing_key)
+    except redis.ResponseError:
+        return 0  # nothing was moved
+
+    task_column_ids = [int(task_column_id) for task_column_id in client.smembers(flushing_key)]
+    for task_column_id in task_column_ids:
+        try:
+            with transaction.atomic():
+                flush_column(task_column_id)
+        except Exception as err:
+            logger.info(f'Failed to write the board order of task column {task_column_id}')
+            capture_exception(err)
+            logger.info(err)
+            client.sadd(DIRTY_KEY, task_column_id)
+    client.delete(flushing_key)
+    return len(task_column_ids)
+
+
+def flush_column(task_column_id):
+    # The order is read once the column is locked: a reorder or a sync that wrote the column after the dirty
+    # set was taken has committed by then, and must not be overwritten with what Redis held before it.
+    lock_column(task_column_id)
+    pipeline = get_redis().pipeline(transaction=False)
+    pipeline.exists(syncing_key(task_column_id))
+    pipeline.zrange(column_key(task_column_id), 0, -1)
+    is_syncing, members = pipeline.execute()
+    if is_syncing:
+        # a sync is writing it, and drops it from Redis once it commits. If it doesn't commit, the moves are
+        # still only in Redis, for the next flush.
+        get_redis().sadd(DIRTY_KEY, task_column_id)
+        return
+    if not members:
+        # dropped from Redis by a sync that wrote it already
+        return
+    write_column_order(task_column_id, [int(member) for member in members if member != SENTINEL])
+
+
+def sync_columns(task_column_ids):
+    """
+    Call before writing the order of these columns in Postgres, inside the same transaction. See above.
+    Returns the ids of the columns whose pending moves were written, and so whose version was bumped.
+    """
+    if not is_enabled():
+        return []
+    task_column_ids = list(task_column_ids)
+    # marks each column with a token of this sync, so another sync of the column committing first doesn't
+    # unmark it
+    token = uuid.uuid4().hex
+    synced_ids = []
+    try:
+        # marked before the order is read, so no move can land between the read and the commit
+        pipeline = get_redis().pipeline()
+        for task_column_id in task_column_ids:
+            pipeline.sadd(syncing_key(task_column_id), token)
+            pipeline.expire(syncing_key(task_column_id), SYNCING_TTL)
+        pipeline.execute()
+
+        pipeline = get_redis().pipeline(transaction=False)
+        for task_column_id in task_column_ids:
+            pipeline.sismember(DIRTY_KEY, task_column_id)
+        dirty_ids = [
+            task_column_id for task_column_id, is_dirty in zip(task_column_ids, pipeline.execute()) if is_dirty
+        ]
+        if dirty_ids:
+            board_order = get_redis_board_order(dirty_ids)
+            for task_column_id in dirty_ids:
+                if write_column_order(task_column_id, board_order[task_column_id]):
+                    synced_ids.append(task_column_id)
+    except redis.RedisError as err:
+        logger.info('Failed to sync the board order from redis')
+        capture_exception(err)
+        logger.info(err)
+    transaction.on_commit(lambda: forget_columns(task_column_ids, token))
+    return synced_ids
+
+
+def forget_columns(task_column_ids, sync_token=None):
+    if not task_column_ids:
+        return
+    try:
+        pipeline = get_redis().pipeline()
+        pipeline.delete(*[column_key(task_column_id) for task_column_id in task_column_ids])
+        pipeline.srem(DIRTY_KEY, *task_column_ids)
+        if sync_token:
+            for task_column_id in task_column_ids:
+                pipeline.srem(syncing_key(task_column_id), sync_token)
+        pipeline.execute()
+    except redis.RedisError as err:
+        logger.info('Failed to drop columns from redis')
+        capture_exception(err)
+        logger.info(err)
@@ -0,0 +1,60 @@
+from dynamic_rest.filters import DynamicFilterBackend, DynamicSortingFilter, FilterNode
+
+from collab_app.serializers import LookupValueField
+
+
+"""
+Filter and sort backends for every `ApiViewSet`: dynamic-rest's, except that `LookupValueField`s, which
+serialize a foreign key to a lookup table as its value, are filtered and sorted on the value too
+(`filter{browser_name}=chrome` filters on `browser_name__value`), like API clients see them.
+"""
+
+
+def lookup_value_query_name(query_name, depth, field_name):
+    # `query_name` (e.g. `task_metadata__browser_name_id__in`) with the model field at `depth` replaced by the
+    # value of the lookup foreign key `field_name` (`LookupValueField`s are named like their foreign key)
+    parts = query_name.split('__')
+    parts[depth] = f'{field_name}__value'
+    return '__'.join(parts)
+
+
+class LookupFilterNode(FilterNode):
+
+    def generate_query_key(self, serializer):
+        query_key, field = super(LookupFilterNode, self).generate_query_key(serializer)
+        if isinstance(field, LookupValueField):
+            query_key = lookup_value_query_name(query_key, len(self.field) - 1, self.field[-1])
+        return query_key, field
+
+
+class LookupFilterBackend(DynamicFilterBackend):
+
+    def _filters_to_query(self, includes, excludes, serializer, q=None):
+        def lookup_nodes(filters):
+            return filters and {
+                key: LookupFilterNode(node.field, node.operator, node.value) for key, node in filters.items()
+            }
+
+        return super(LookupFilterBackend, self)._filters_to_query(
+            lookup_nodes(includes),
+            lookup_nodes(excludes),
+            serializer,
+            q=q
+        )
+
+
+class LookupSortingFilter(DynamicSortingFilter):
+
+    def ordering_for(self, term, view):
+        ordering = super(LookupSortingFilter, self).ordering_for(term, view)
+        if ordering is None:
+            return None
+
+        # the serializer field `term` ends with, found like `ordering_for` does
+        *path, name = term.split('.')
+        serializer = self._get_serializer_class(view)()
+        for segment in path:
+            serializer = serializer.get_all_fields()[segment].serializer_class()
+        if isinstance(serializer.get_all_fields().get(name), LookupValueField):
+            ordering = lookup_value_query_name(ordering, len(path), name)
+        return ordering
@@ -0,0 +1,138 @@
+import datetime
+import functools
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import exceptions
+from rest_framework.response import Response
+
+from collab_app.models import IdempotencyKey
+
+
+"""
+Idempotency keys for endpoints that clients retry.
+
+A client sends a unique `Idempotency-Key` header with a request, and the same header with every retry of
+it. The first successful response is stored for IDEMPOTENCY_KEY_TTL seconds, in the cache and in the
+`IdempotencyKey` table. Retries get that response back without running the view again.
+
+Keys are scoped to the endpoint, and to the user, or for anonymous widget requests to the project key they
+are for. A hash of the request (method, path and body) is stored with the key: reusing a key for a different
+request is answered with a 422 instead of the other request's response.
+
+The unique `IdempotencyKey` row is what dedupes requests across workers. The cache is only a shortcut for
+retries, and is per process unless CACHES configures a shared one.
+"""
+
+IDEMPOTENCY_HEADER = 'HTTP_IDEMPOTENCY_KEY'
+
+
+def get_cache_key(scope, key):
+    # the key comes from the client, so hash it to keep the cache key short and safe
+    return 'idempotency:' + hashlib.sha1(f'{scope}:{key}'.encode()).hexdigest()
+
+
+def get_stored_response(scope, key):
+    cutoff = timezone.now() - datetime.timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)
+    return IdempotencyKey.objects.filter(
+        scope=scope,
+        key=key,
+        created__gte=cutoff
+    ).values('status_code', 'response', 'request_hash').first()
+
+
+def get_scope(view_method, request):
+    scope = view_method.__name__
+    if request.user.is_authenticated:
+        return f'{scope}:{request.user.pk}'
+    # anonymous widget requests are for one project, by its key: `task.project_key` (of the first task, for
+    # several). Hashed, as the scope is stored in a short column.
+    data = request.data if isinstance(request.data, dict) else {}
+    submissions = data.get('tasks') if isinstance(data.get('tasks'), list) else [data]
+    task = submissions[0].get('task') if submissions and isinstance(submissions[0], dict) else None
+    project_key = task.get('project_key') if isinstance(task, dict) else None
+    return f'{scope}:project:' + hashlib.sha1(str(project_key).encode()).hexdigest()
+
+
+def get_request_hash(request):
+    body = json.dumps(request.data, sort_keys=True, cls=DjangoJSONEncoder)
+    return hashlib.sha256(f'{request.method}:{request.path}:{body}'.encode()).hexdigest()
+
+
+def replay(stored, request_hash):
+    # the stored response, unless the key was used for a different request
+    if stored.get('request_hash') and stored['request_hash'] != request_hash:
+        return Response(
+            {'detail': 'This Idempotency-Key was already used for a different request.'},
+            status=422
+        )
+    return Response(stored['response'], status=stored['status_code'])
+
+
+def idempotent(view_method):
+    """
+    Make a viewset action idempotent for requests that send an `Idempotency-Key` header.
+    Requests without the header are handled as usual.
+    """
+    @functools.wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.META.get(IDEMPOTENCY_HEADER)
+        if not key:
+            return view_method(self, request, *args, **kwargs)
+        if len(key) > IdempotencyKey._meta.get_field('key').max_length:
+            raise exceptions.ValidationError('The Idempotency-Key header is too long.')
+
+        scope = get_scope(view_method, request)
+        request_hash = get_request_hash(request)
+        cache_key = get_cache_key(scope, key)
+
+        stored = cache.get(cache_key)
+        if stored is None:
+            stored = get_stored_response(scope, key)
+        if stored is not None:
+            cache.set(cache_key, stored, settings.IDEMPOTENCY_KEY_TTL)
+            return replay(stored, request_hash)
+
+        with transaction.atomic():
+            # an expired key can be used again
+            cutoff = timezone.now() - datetime.timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)
+            IdempotencyKey.objects.filter(scope=scope, key=key, created__lt=cutoff).delete()
+            try:
+                with transaction.atomic():
+                    # if a request with the same key is in flight, this waits for it to finish
+                    idempotency_key = IdempotencyKey.objects.create(scope=scope, key=key, request_hash=request_hash)
+            except IntegrityError:
+                idempotency_key = None
+
+            if idempotency_key is None:
+                stored = get_stored_response(scope, key)
+                if stored is None:
+                    raise exceptions.ValidationError('A request with this Idempotency-Key is already being processed.')
+                return replay(stored, request_hash)
+
+            # an error (response or exception) rolls the key back, so the client can retry
+            response = view_method(self, request, *args, **kwargs)
+            if response.status_code >= 400:
+                transaction.set_rollback(True)
+                return response
+            idempotency_key.status_code = response.status_code
+            idempotency_key.response = response.data
+            idempotency_key.save(update_fields=['status_code', 'response', 'updated'])
+
+        cache.set(
+            cache_key,
+            {
+                'status_code': idempotency_key.status_code,
+                'response': idempotency_key.response,
+                'request_hash': request_hash,
+            },
+            settings.IDEMPOTENCY_KEY_TTL
+        )
+        return response
+
+    return wrapper
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from collab_app.benchmarks.notifications import NotificationBenchmark
+
+
+class Command(BaseCommand):
+    help = (
+        'Fire comments and column moves through the notification outbox against a local SMTP sink. '
+        'Reports emails/sec, queries per event and end-to-end latency. Run against a development database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--events', type=int, default=50, help='Number of comments, and of column moves, to fire.')
+        parser.add_argument('--participants', type=int, default=20, help='Number of users on the task thread.')
+        parser.add_argument('--thread-length', type=int, default=30, help='Number of comments already on the task.')
+
+    def handle(self, *args, **options):
+        benchmark = NotificationBenchmark(
+            events=options['events'],
+            participants=options['participants'],
+            thread_length=options['thread_length'],
+        )
+        for result in benchmark.run():
+            self.stdout.write(
+                '{name}: {events} events, {emails} emails in {seconds:.2f}s ({emails_per_second:.1f} emails/sec), '
+                'queries/event {queries_per_event:.1f} (max {max_queries_per_event}), '
+                'latency p50 {latency_p50_ms:.1f}ms p95 {latency_p95_ms:.1f}ms max {latency_max_ms:.1f}ms'.format(
+                    **result
+                )
+            )
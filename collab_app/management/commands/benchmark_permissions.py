@@ -0,0 +1,68 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from collab_app.benchmarks.permissions import (
+    SIZES,
+    PermissionBenchmark,
+    compare,
+    load_baseline,
+    save_baseline,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Run the permission filters and the main list endpoints against seeded organizations of several sizes. '
+        'Reports rows, queries, latency and query plans, and compares them with a baseline from an earlier run. '
+        'Run against a development database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--size',
+            action='append',
+            choices=sorted(SIZES),
+            help='Size to seed and run (repeatable). Defaults to small.'
+        )
+        parser.add_argument('--repeat', type=int, default=5, help='Number of times each query is timed.')
+        parser.add_argument('--joins', action='store_true', help='Also run the join filters the reads replaced.')
+        parser.add_argument('--plans', action='store_true', help='Print the query plans.')
+        parser.add_argument('--baseline', help='Compare with the baseline in this file, and fail on regressions.')
+        parser.add_argument('--save-baseline', help='Write the results to this file, as the baseline.')
+        parser.add_argument(
+            '--tolerance',
+            type=float,
+            default=0.5,
+            help='How much slower than the baseline (as a fraction) a p50 latency can be.'
+        )
+
+    def handle(self, *args, **options):
+        baseline = load_baseline(options['baseline']) if options['baseline'] else None
+        results_by_size = {}
+        regressions = []
+        for size in options['size'] or ['small']:
+            self.stdout.write(f'{size}: {SIZES[size]}')
+            benchmark = PermissionBenchmark(repeat=options['repeat'], joins=options['joins'], **SIZES[size])
+            results = results_by_size[size] = benchmark.run()
+            for result in results:
+                self.stdout.write(
+                    '  {name}: {rows} rows, {queries} queries, '
+                    'latency p50 {latency_p50_ms:.1f}ms p95 {latency_p95_ms:.1f}ms mean {latency_mean_ms:.1f}ms'.format(
+                        **result
+                    )
+                )
+                if options['plans'] and result['plan']:
+                    self.stdout.write(result['plan'])
+            if baseline is not None:
+                if size in baseline:
+                    regressions += [f'{size}: {regression}' for regression in compare(
+                        results,
+                        baseline[size],
+                        tolerance=options['tolerance']
+                    )]
+                else:
+                    self.stdout.write(f'The baseline has no {size} results.')
+
+        if options['save_baseline']:
+            save_baseline(options['save_baseline'], results_by_size)
+        if regressions:
+            raise CommandError('Regressions against the baseline:\n' + '\n'.join(regressions))
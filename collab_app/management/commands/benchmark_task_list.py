@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from collab_app.benchmarks.task_list import TaskListBenchmark
+
+
+class Command(BaseCommand):
+    help = (
+        'Request the task list of a seeded board with the serializer and with the fast path (TASK_LIST_FAST_PATH). '
+        'Reports latency, CPU time and queries of each. Run against a development database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tasks', type=int, default=2000, help='Number of tasks on the board.')
+        parser.add_argument('--comments-per-task', type=int, default=2, help='Number of comments on each task.')
+        parser.add_argument('--repeat', type=int, default=5, help='Number of times each request is timed.')
+
+    def handle(self, *args, **options):
+        benchmark = TaskListBenchmark(
+            tasks=options['tasks'],
+            comments_per_task=options['comments_per_task'],
+            repeat=options['repeat'],
+        )
+        for result in benchmark.run():
+            line = (
+                '{name}: {tasks} tasks, {queries} queries, '
+                'latency p50 {latency_p50_ms:.1f}ms p95 {latency_p95_ms:.1f}ms, cpu p50 {cpu_p50_ms:.1f}ms'
+            ).format(**result)
+            if 'speedup' in result:
+                line += f', {result["speedup"]:.1f}x less cpu'
+            self.stdout.write(line)
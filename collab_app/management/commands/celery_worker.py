@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from collab.celery import app
+
+
+class Command(BaseCommand):
+    help = 'Start a celery worker using one of the WORKER_PROFILES in settings (pool, concurrency and queues).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profile', default='default', choices=sorted(settings.WORKER_PROFILES))
+        parser.add_argument('--loglevel', default='info')
+
+    def handle(self, *args, **options):
+        profile_name = options['profile']
+        profile = settings.WORKER_PROFILES[profile_name]
+        argv = [
+            'worker',
+            f'--loglevel={options["loglevel"]}',
+            f'--pool={profile["pool"]}',
+            f'--queues={",".join(profile["queues"])}',
+            f'--hostname={profile_name}@%h',
+        ]
+        if profile['concurrency']:
+            argv.append(f'--concurrency={profile["concurrency"]}')
+        app.worker_main(argv)
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from collab_app.permissions import row_level_security
+
+
+class Command(BaseCommand):
+    help = (
+        'Install (--enable) or remove (--disable) the postgres role and row-level security policies used when '
+        'PERMISSION_ROW_LEVEL_SECURITY is on. Run as the owner of the tables, with the CREATEROLE privilege. '
+        'Other roles that aren\'t the owner can no longer read the tables with policies.'
+    )
+
+    def add_arguments(self, parser):
+        group = parser.add_mutually_exclusive_group(required=True)
+        group.add_argument('--enable', action='store_true', help='Create the role and the policies (again).')
+        group.add_argument('--disable', action='store_true', help='Drop the policies.')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Row-level security needs postgres.')
+        with transaction.atomic():
+            if options['enable']:
+                row_level_security.enable()
+            else:
+                row_level_security.disable()
+        self.stdout.write('Row-level security policies {}.'.format('enabled' if options['enable'] else 'disabled'))
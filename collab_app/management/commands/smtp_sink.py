@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from collab_app.benchmarks.smtp_sink import SMTPSink
+
+
+class Command(BaseCommand):
+    help = (
+        'Run a local SMTP server that accepts and discards every email. Point a worker at it with '
+        'EMAIL_HOST/EMAIL_PORT and NOTIFICATION_EMAIL_BACKEND=django.core.mail.backends.smtp.EmailBackend.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='0.0.0.0')
+        parser.add_argument('--port', type=int, default=1025)
+        parser.add_argument('--interval', type=float, default=5.0, help='Seconds between throughput reports.')
+
+    def handle(self, *args, **options):
+        with SMTPSink(host=options['host'], port=options['port']) as sink:
+            self.stdout.write(f'SMTP sink listening on {sink.host}:{sink.port}')
+            last_count = 0
+            try:
+                while True:
+                    time.sleep(options['interval'])
+                    count = sink.message_count
+                    rate = (count - last_count) / options['interval']
+                    self.stdout.write(f'{count} emails received ({rate:.1f} emails/sec)')
+                    last_count = count
+            except KeyboardInterrupt:
+                pass
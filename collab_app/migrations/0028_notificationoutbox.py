@@ -0,0 +1,54 @@
+# Generated by Django 3.0.4 on 2026-10-19 18:35
+
+import collab_app.mixins.models
+from django.conf import settings
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('collab_app', '0027_taskdataurl'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationOutbox',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('event', models.PositiveSmallIntegerField(choices=[(1, 'Task Created'), (2, 'Task Comment Created'), (3, 'Assignee Changed'), (4, 'Task Column Changed')])),
+                ('payload', django.contrib.postgres.fields.jsonb.JSONField(default=dict)),
+                ('state', models.PositiveSmallIntegerField(choices=[(1, 'Pending'), (2, 'Sent'), (3, 'Failed')], default=1)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True, default='')),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+                ('creator', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='collab_app_notificationoutbox_related', to=settings.AUTH_USER_MODEL)),
+            ],
+            bases=(collab_app.mixins.models.ModelDiffMixin, models.Model),
+        ),
+        migrations.CreateModel(
+            name='NotificationDelivery',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('email', models.EmailField(max_length=254)),
+                ('state', models.PositiveSmallIntegerField(choices=[(1, 'Sent'), (2, 'Failed')])),
+                ('error', models.TextField(blank=True, default='')),
+                ('creator', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='collab_app_notificationdelivery_related', to=settings.AUTH_USER_MODEL)),
+                ('outbox', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='deliveries', to='collab_app.NotificationOutbox')),
+            ],
+            options={
+                'abstract': False,
+            },
+            bases=(collab_app.mixins.models.ModelDiffMixin, models.Model),
+        ),
+        migrations.AddIndex(
+            model_name='notificationoutbox',
+            index=models.Index(fields=['state', 'id'], name='notificationoutbox_state_id'),
+        ),
+    ]
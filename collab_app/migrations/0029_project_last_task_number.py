@@ -0,0 +1,30 @@
+# Generated by Django 3.0.4 on 2026-10-19 18:41
+
+from django.db import migrations, models
+from django.db.models import Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_last_task_number(apps, schema_editor):
+    Project = apps.get_model('collab_app', 'Project')
+    Task = apps.get_model('collab_app', 'Task')
+    max_task_number = Task.objects.filter(
+        project=OuterRef('pk')
+    ).order_by().values('project').annotate(max_task_number=Max('task_number')).values('max_task_number')
+    Project.objects.update(last_task_number=Coalesce(Subquery(max_task_number), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('collab_app', '0028_notificationoutbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='last_task_number',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_last_task_number, migrations.RunPython.noop),
+    ]
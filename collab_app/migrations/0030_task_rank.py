@@ -0,0 +1,62 @@
+# Generated by Django 3.0.4 on 2026-10-19 18:43
+
+from django.db import migrations, models
+
+
+# a copy of `collab_app.ranking.evenly_spaced_ranks` as of this migration, so later changes to the ranking
+# module don't change what it backfills
+DIGITS = '0123456789abcdefghijklmnopqrstuvwxyz'
+BASE = len(DIGITS)
+
+
+def evenly_spaced_ranks(count):
+    width = 1
+    while BASE ** width <= count:
+        width += 1
+    step = BASE ** width // (count + 1)
+    return [_encode(step * (i + 1), width) for i in range(count)]
+
+
+def _encode(value, width):
+    digits = []
+    for _ in range(width):
+        value, digit = divmod(value, BASE)
+        digits.append(DIGITS[digit])
+    return ''.join(reversed(digits)).rstrip('0')
+
+
+def use_c_collation(apps, schema_editor):
+    # ranks are compared byte-wise, whatever the database's default collation is.
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('ALTER TABLE collab_app_task ALTER COLUMN rank TYPE varchar(255) COLLATE "C"')
+
+
+def backfill_rank(apps, schema_editor):
+    Task = apps.get_model('collab_app', 'Task')
+    TaskColumn = apps.get_model('collab_app', 'TaskColumn')
+    for task_column_id in TaskColumn.objects.values_list('id', flat=True).iterator():
+        tasks = list(Task.objects.filter(task_column_id=task_column_id).order_by('order', 'id').only('id'))
+        for task, rank in zip(tasks, evenly_spaced_ranks(len(tasks))):
+            task.rank = rank
+        Task.objects.bulk_update(tasks, ['rank'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('collab_app', '0029_project_last_task_number'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='rank',
+            field=models.CharField(default='', max_length=255),
+        ),
+        migrations.RunPython(use_c_collation, migrations.RunPython.noop),
+        migrations.RunPython(backfill_rank, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['task_column', 'rank'], name='task_task_column_rank'),
+        ),
+    ]
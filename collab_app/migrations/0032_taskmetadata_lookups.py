@@ -0,0 +1,89 @@
+# Generated by Django 3.0.4 on 2026-10-19 18:51
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+import django.db.models.deletion
+
+
+LOOKUPS = (
+    ('url_origin', 'UrlOrigin'),
+    ('os_name', 'OsName'),
+    ('os_version', 'OsVersion'),
+    ('os_version_name', 'OsVersionName'),
+    ('browser_name', 'BrowserName'),
+    ('browser_version', 'BrowserVersion'),
+)
+
+
+def backfill_lookups(apps, schema_editor):
+    TaskMetadata = apps.get_model('collab_app', 'TaskMetadata')
+    for field_name, model_name in LOOKUPS:
+        Lookup = apps.get_model('collab_app', model_name)
+        text_field_name = f'{field_name}_text'
+        values = TaskMetadata.objects.order_by().values_list(text_field_name, flat=True).distinct()
+        Lookup.objects.bulk_create([Lookup(value=value) for value in values], ignore_conflicts=True)
+        TaskMetadata.objects.update(**{
+            f'{field_name}_id': Subquery(Lookup.objects.filter(value=OuterRef(text_field_name)).values('id')[:1])
+        })
+
+
+def create_lookup_model(model_name):
+    return migrations.CreateModel(
+        name=model_name,
+        fields=[
+            ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+            ('value', models.TextField(unique=True)),
+        ],
+        options={
+            'abstract': False,
+        },
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('collab_app', '0031_idempotencykey'),
+    ]
+
+    operations = [
+        create_lookup_model(model_name) for _, model_name in LOOKUPS
+    ] + [
+        migrations.RenameField(
+            model_name='taskmetadata',
+            old_name=field_name,
+            new_name=f'{field_name}_text',
+        )
+        for field_name, _ in LOOKUPS
+    ] + [
+        migrations.AddField(
+            model_name='taskmetadata',
+            name=field_name,
+            field=models.ForeignKey(
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name='+',
+                to=f'collab_app.{model_name}'
+            ),
+        )
+        for field_name, model_name in LOOKUPS
+    ] + [
+        migrations.RunPython(backfill_lookups, migrations.RunPython.noop),
+    ] + [
+        migrations.RemoveField(
+            model_name='taskmetadata',
+            name=f'{field_name}_text',
+        )
+        for field_name, _ in LOOKUPS
+    ] + [
+        migrations.AlterField(
+            model_name='taskmetadata',
+            name=field_name,
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name='+',
+                to=f'collab_app.{model_name}'
+            ),
+        )
+        for field_name, model_name in LOOKUPS
+    ]
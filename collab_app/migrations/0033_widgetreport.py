@@ -0,0 +1,38 @@
+# Generated by Django 3.0.4 on 2026-10-19 18:53
+
+import collab_app.mixins.models
+from django.conf import settings
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('collab_app', '0032_taskmetadata_lookups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WidgetReport',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('ticket', models.UUIDField(default=uuid.uuid4, editable=False, unique=True)),
+                ('payload', django.contrib.postgres.fields.jsonb.JSONField(default=dict)),
+                ('state', models.PositiveSmallIntegerField(choices=[(1, 'Pending'), (2, 'Processed'), (3, 'Failed')], default=1)),
+                ('error', models.TextField(blank=True, default='')),
+                ('creator', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='collab_app_widgetreport_related', to=settings.AUTH_USER_MODEL)),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='widget_reports', to='collab_app.Project')),
+                ('task', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='collab_app.Task')),
+            ],
+            bases=(collab_app.mixins.models.ModelDiffMixin, models.Model),
+        ),
+        migrations.AddIndex(
+            model_name='widgetreport',
+            index=models.Index(fields=['state', 'id'], name='widgetreport_state_id'),
+        ),
+    ]
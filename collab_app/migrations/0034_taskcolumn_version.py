@@ -0,0 +1,18 @@
+# Generated by Django 3.0.4 on 2026-10-19 18:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('collab_app', '0033_widgetreport'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='taskcolumn',
+            name='version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
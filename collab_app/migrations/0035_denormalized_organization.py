@@ -0,0 +1,88 @@
+# Generated by Django 3.0.4 on 2026-10-19 20:12
+
+from django.db import migrations, models, transaction
+from django.db.models import OuterRef, Subquery
+import django.db.models.deletion
+
+
+BATCH_SIZE = 5000
+
+
+def backfill_in_batches(model, **values):
+    # one transaction per batch of ids, so the rows of a large table aren't all locked at once. Rows that
+    # are already set are skipped, so the migration can be run again after a failure.
+    last_id = 0
+    while True:
+        ids = list(
+            model.objects.filter(
+                id__gt=last_id,
+                organization_id__isnull=True
+            ).order_by('id').values_list('id', flat=True)[:BATCH_SIZE]
+        )
+        if not ids:
+            return
+        with transaction.atomic():
+            model.objects.filter(id__in=ids).update(**values)
+        last_id = ids[-1]
+
+
+def backfill_organizations(apps, schema_editor):
+    Project = apps.get_model('collab_app', 'Project')
+    Task = apps.get_model('collab_app', 'Task')
+    backfill_in_batches(
+        Task,
+        organization_id=Subquery(Project.objects.filter(id=OuterRef('project_id')).values('organization_id')[:1])
+    )
+    for model_name in ('TaskComment', 'TaskMetadata'):
+        task = Task.objects.filter(id=OuterRef('task_id'))
+        backfill_in_batches(
+            apps.get_model('collab_app', model_name),
+            project_id=Subquery(task.values('project_id')[:1]),
+            organization_id=Subquery(task.values('organization_id')[:1])
+        )
+
+
+def foreign_key(to, null=False):
+    return models.ForeignKey(
+        blank=True,
+        null=null,
+        on_delete=django.db.models.deletion.PROTECT,
+        related_name='+',
+        to=to
+    )
+
+
+FIELDS = (
+    ('task', 'organization', 'collab_app.Organization'),
+    ('taskcomment', 'project', 'collab_app.Project'),
+    ('taskcomment', 'organization', 'collab_app.Organization'),
+    ('taskmetadata', 'project', 'collab_app.Project'),
+    ('taskmetadata', 'organization', 'collab_app.Organization'),
+)
+
+
+class Migration(migrations.Migration):
+    # the backfill commits batch by batch
+    atomic = False
+
+    dependencies = [
+        ('collab_app', '0034_taskcolumn_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name=model_name,
+            name=name,
+            field=foreign_key(to, null=True),
+        )
+        for model_name, name, to in FIELDS
+    ] + [
+        migrations.RunPython(backfill_organizations, migrations.RunPython.noop),
+    ] + [
+        migrations.AlterField(
+            model_name=model_name,
+            name=name,
+            field=foreign_key(to),
+        )
+        for model_name, name, to in FIELDS
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.0.4 on 2026-10-19 21:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('collab_app', '0036_idempotencykey_request_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notificationoutbox',
+            name='unsent',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='notificationoutbox',
+            name='state',
+            field=models.PositiveSmallIntegerField(choices=[(1, 'Pending'), (2, 'Sent'), (3, 'Failed'), (4, 'Sending')], default=1),
+        ),
+    ]
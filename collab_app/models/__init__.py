@@ -1,15 +1,30 @@
+from collab_app.models.idempotency import IdempotencyKey
 from collab_app.models.invite import Invite
+from collab_app.models.lookup import (
+    BrowserName,
+    BrowserVersion,
+    OsName,
+    OsVersion,
+    OsVersionName,
+    UrlOrigin,
+)
 from collab_app.models.membership import Membership
+from collab_app.models.notification import NotificationDelivery, NotificationOutbox
 from collab_app.models.organization import Organization
 from collab_app.models.profile import Profile
 from collab_app.models.project import Project
 from collab_app.models.task import (Task, TaskColumn, TaskMetadata, TaskComment, TaskHtml, TaskDataUrl)
 from collab_app.models.user import User
+from collab_app.models.widget_report import WidgetReport
 
 # import signals so django registers them
 from collab_app.signals.create_profile import create_profile_on_user_create
 from collab_app.signals.invite_emails import email_on_invite_change
 from collab_app.signals.create_task_columns import create_task_columns_on_project_create
+from collab_app.signals.permission_cache import (
+    invalidate_permission_cache_on_membership_change,
+    invalidate_permission_cache_on_project_change
+)
 from collab_app.signals.task_actions import (
     notify_on_task_create,
     notify_on_task_comment_create,
@@ -18,9 +33,17 @@ from collab_app.signals.task_actions import (
 
 # for flake8
 __all__ = [
+    'BrowserName',
+    'BrowserVersion',
+    'IdempotencyKey',
     'Invite',
     'Membership',
+    'NotificationDelivery',
+    'NotificationOutbox',
     'Organization',
+    'OsName',
+    'OsVersion',
+    'OsVersionName',
     'Profile',
     'Project',
     'Task',
@@ -29,10 +52,14 @@ __all__ = [
     'TaskComment',
     'TaskHtml',
     'TaskDataUrl',
+    'UrlOrigin',
     'User',
+    'WidgetReport',
     'create_profile_on_user_create',
     'email_on_invite_change',
     'create_task_columns_on_project_create',
+    'invalidate_permission_cache_on_membership_change',
+    'invalidate_permission_cache_on_project_change',
     'notify_on_task_create',
     'notify_on_task_comment_create',
     'notify_on_task_assignment_change'
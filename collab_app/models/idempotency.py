@@ -0,0 +1,24 @@
+from django.contrib.postgres.fields import JSONField
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models
+
+from collab_app.mixins.models import BaseModel
+
+
+# The response to a request that carried an `Idempotency-Key` header, so a retry of the request
+# gets the same response instead of being run again. See `collab_app.idempotency`.
+class IdempotencyKey(BaseModel):
+    scope = models.CharField(max_length=255)  # the endpoint, and the user or the widget's project key
+    key = models.CharField(max_length=255)
+    # sha256 of the request's method, path and body. Empty for keys stored before it was.
+    request_hash = models.CharField(max_length=64, blank=True, default='')
+    status_code = models.PositiveSmallIntegerField(default=0)
+    response = JSONField(default=dict, encoder=DjangoJSONEncoder)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created'], name='idempotencykey_created'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['scope', 'key'], name='unique_idempotencykey_scope_key'),
+        ]
@@ -0,0 +1,156 @@
+import threading
+from collections import OrderedDict, defaultdict
+
+from django.db import models, transaction
+from django.db.models.query import ModelIterable
+
+
+# {model label: {'ids': {value: id}, 'values': {id: value}}}, for this process. `values` is in least recently
+# used order.
+_lookup_cache = defaultdict(lambda: {'ids': {}, 'values': OrderedDict()})
+_lookup_cache_lock = threading.Lock()
+
+
+class LookupManager(models.Manager):
+
+    """
+    Get-or-create lookups of values, cached in memory.
+
+    Lookup rows are never updated or deleted, so a cached id stays valid for the life of the process.
+    Rows are only cached once they are committed, so a rolled back transaction can't leave a stale id behind.
+    Past `max_cached` values, the least recently used ones are evicted.
+    """
+
+    max_cached = 10000
+
+    def _cache(self):
+        return _lookup_cache[self.model._meta.label]
+
+    def _remember(self, ids):
+        cache = self._cache()
+        with _lookup_cache_lock:
+            for value, value_id in ids.items():
+                cache['ids'][value] = value_id
+                cache['values'][value_id] = value
+                cache['values'].move_to_end(value_id)
+            while len(cache['values']) > self.max_cached:
+                _, value = cache['values'].popitem(last=False)
+                cache['ids'].pop(value, None)
+
+    def _cached(self, keys, by):
+        # {key: cached id or value} for the `keys` in the cache `by` ('ids' or 'values'), marked as used
+        cache = self._cache()
+        with _lookup_cache_lock:
+            found = {key: cache[by][key] for key in keys if key in cache[by]}
+            for value_id in (found.values() if by == 'ids' else found.keys()):
+                cache['values'].move_to_end(value_id)
+        return found
+
+    @staticmethod
+    def normalize(value):
+        # the value as it is stored, and as the database returns it: a string, '' for None
+        return '' if value is None else str(value)
+
+    def ids_for(self, values):
+        """
+        Return {value: id} for `values`, keyed by their `normalize`d value, creating the values that don't exist
+        yet.
+        """
+        values = {self.normalize(value) for value in values}
+        ids = self._cached(values, 'ids')
+        missing = values - ids.keys()
+        if missing:
+            self.bulk_create([self.model(value=value) for value in missing], ignore_conflicts=True)
+            fetched = dict(self.filter(value__in=missing).values_list('value', 'id'))
+            ids.update(fetched)
+            transaction.on_commit(lambda: self._remember(fetched))
+        return ids
+
+    def id_for(self, value):
+        return self.ids_for([value])[self.normalize(value)]
+
+    def values_for(self, value_ids):
+        """
+        Return {id: value} for `value_ids`, with one query for the ids that aren't cached.
+        """
+        values = self._cached(set(value_ids), 'values')
+        missing = set(value_ids) - values.keys()
+        if missing:
+            fetched = dict(self.filter(id__in=missing).values_list('id', 'value'))
+            values.update(fetched)
+            transaction.on_commit(lambda: self._remember({value: value_id for value_id, value in fetched.items()}))
+        return values
+
+    def value_for(self, value_id):
+        return self.values_for([value_id]).get(value_id)
+
+
+class LookupValuesIterable(ModelIterable):
+
+    """
+    Model instances whose lookup foreign keys (the model's `LOOKUP_FIELDS`) hold their lookup row, like
+    `select_related` would, but read from the lookup cache, with one query per lookup table for the values
+    that aren't cached.
+    """
+
+    def __iter__(self):
+        instances = list(super(LookupValuesIterable, self).__iter__())
+        if instances:
+            deferred = instances[0].get_deferred_fields()
+            for field_name in self.queryset.model.LOOKUP_FIELDS:
+                field = self.queryset.model._meta.get_field(field_name)
+                if field.attname in deferred:
+                    continue
+                values = field.related_model.objects.values_for(
+                    {getattr(instance, field.attname) for instance in instances}
+                )
+                for instance in instances:
+                    value_id = getattr(instance, field.attname)
+                    if value_id in values:
+                        field.set_cached_value(instance, field.related_model(id=value_id, value=values[value_id]))
+        yield from instances
+
+
+class LookupValuesQuerySet(models.QuerySet):
+
+    def __init__(self, *args, **kwargs):
+        super(LookupValuesQuerySet, self).__init__(*args, **kwargs)
+        self._iterable_class = LookupValuesIterable
+
+
+# Small tables for the values that repeat across many `TaskMetadata` rows.
+# `TaskMetadata` references them by id, and `TaskMetadataSerializer` serializes them as their value.
+class Lookup(models.Model):
+    value = models.TextField(unique=True)
+
+    objects = LookupManager()
+
+    class Meta:
+        abstract = True
+
+    def __str__(self):
+        return self.value
+
+
+class UrlOrigin(Lookup):
+    pass
+
+
+class OsName(Lookup):
+    pass
+
+
+class OsVersion(Lookup):
+    pass
+
+
+class OsVersionName(Lookup):
+    pass
+
+
+class BrowserName(Lookup):
+    pass
+
+
+class BrowserVersion(Lookup):
+    pass
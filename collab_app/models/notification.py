@@ -0,0 +1,51 @@
+from django.contrib.postgres.fields import JSONField
+from django.db import models
+
+from collab_app.mixins.models import BaseModel
+
+
+# Notifications are written to this outbox inside the same transaction as the change that
+# triggered them. The `dispatch_notification_outbox` task drains it in batches (see `dispatch_outbox_batch`).
+class NotificationOutbox(BaseModel):
+    class EventType(models.IntegerChoices):
+        TASK_CREATED = 1
+        TASK_COMMENT_CREATED = 2
+        ASSIGNEE_CHANGED = 3
+        TASK_COLUMN_CHANGED = 4
+
+    class OutboxState(models.IntegerChoices):
+        PENDING = 1
+        SENT = 2
+        FAILED = 3
+        SENDING = 4  # claimed by a dispatcher
+
+    event = models.PositiveSmallIntegerField(choices=EventType.choices)
+    payload = JSONField(default=dict)  # kwargs for the email builder of this `event`
+    state = models.PositiveSmallIntegerField(choices=OutboxState.choices, default=OutboxState.PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    unsent = models.PositiveIntegerField(default=0)  # the messages of the current attempt not delivered yet
+    last_error = models.TextField(blank=True, default='')
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['state', 'id'], name='notificationoutbox_state_id'),
+        ]
+
+
+# One row per recipient per delivery attempt of an outbox entry. A recipient with a SENT
+# delivery is skipped when the entry is retried.
+class NotificationDelivery(BaseModel):
+    class DeliveryState(models.IntegerChoices):
+        SENT = 1
+        FAILED = 2
+
+    outbox = models.ForeignKey(
+        'collab_app.NotificationOutbox',
+        related_name='deliveries',
+        on_delete=models.CASCADE
+    )
+
+    email = models.EmailField()
+    state = models.PositiveSmallIntegerField(choices=DeliveryState.choices)
+    error = models.TextField(blank=True, default='')
@@ -1,4 +1,6 @@
-from django.db import models
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, models
 
 from collab_app.mixins.models import BaseModel
 
@@ -7,6 +9,8 @@ class Project(BaseModel):
     name = models.TextField()
     key = models.CharField(max_length=32, unique=True)
     url = models.TextField(blank=True, default='')  # make this a url field? Does it even matter?
+    # the `task_number` of the most recently created task in this project. See `next_task_number`.
+    last_task_number = models.PositiveIntegerField(default=0)
 
     organization = models.ForeignKey(
         'collab_app.Organization',
@@ -21,3 +25,35 @@ class Project(BaseModel):
 
     def __str__(self):
         return f'{self.name}'
+
+    @classmethod
+    def organization_id_for(cls, project_id):
+        # projects don't move between organizations, so the id can be cached
+        cache_key = f'project_organization:{project_id}'
+        organization_id = cache.get(cache_key)
+        if organization_id is None:
+            organization_id = cls.objects.filter(id=project_id).values_list('organization_id', flat=True).get()
+            cache.set(cache_key, organization_id, settings.PROJECT_ORGANIZATION_ID_CACHE_TTL)
+        return organization_id
+
+    @classmethod
+    def next_task_number(cls, project_id):
+        return cls.reserve_task_numbers(project_id, 1)[0]
+
+    @classmethod
+    def reserve_task_numbers(cls, project_id, count):
+        # Increment and read the counter in one statement. The row stays locked until the surrounding
+        # transaction ends, so concurrent task creates in the same project get consecutive numbers
+        # instead of colliding on `unique_tasknumber_project`. Call this inside the creation transaction.
+        # Raises Project.DoesNotExist if there is no such project.
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'UPDATE {connection.ops.quote_name(cls._meta.db_table)} '
+                'SET last_task_number = last_task_number + %s WHERE id = %s RETURNING last_task_number',
+                [count, project_id]
+            )
+            row = cursor.fetchone()
+        if row is None:
+            raise cls.DoesNotExist(f'Project {project_id} does not exist.')
+        last_task_number = row[0]
+        return list(range(last_task_number - count + 1, last_task_number + 1))
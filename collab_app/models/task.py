@@ -1,7 +1,12 @@
+from django.conf import settings
+from django.core.cache import cache
 from django.db import models
-from django.db.models import Q
+from django.db.models import F, Max, Q
 
 from collab_app.mixins.models import BaseModel
+from collab_app.models.lookup import LookupValuesQuerySet
+from collab_app.models.project import Project
+from collab_app.ranking import rank_between
 
 
 class Task(BaseModel):
@@ -19,8 +24,12 @@ class Task(BaseModel):
     has_target = models.BooleanField(default=True)
     one_off_email_set_by = models.TextField(blank=True, default='')
 
-    # for ordering inside a task_column
+    # for ordering inside a task_column. `rank` is a fractional rank (see `collab_app.ranking`), and
+    # moving a card only rewrites that card's rank. `order` is the older dense ordering, deprecated: it is
+    # still written by `reorder_tasks` for clients that send back the whole column, but not by `move_task`.
+    # Note: the rank column uses the "C" collation (set in migration 0030) so it sorts byte-wise.
     order = models.PositiveIntegerField(default=0)
+    rank = models.CharField(max_length=255, default='')
 
     project = models.ForeignKey(
         'collab_app.Project',
@@ -28,6 +37,15 @@ class Task(BaseModel):
         on_delete=models.PROTECT
     )
 
+    # the project's organization, copied here so permission checks don't have to join the project.
+    # Set on save from the project (set it yourself with `bulk_create`).
+    organization = models.ForeignKey(
+        'collab_app.Organization',
+        related_name='+',
+        on_delete=models.PROTECT,
+        blank=True
+    )
+
     task_column = models.ForeignKey(
         'collab_app.TaskColumn',
         related_name='tasks',
@@ -52,6 +70,9 @@ class Task(BaseModel):
     )
 
     class Meta:
+        indexes = [
+            models.Index(fields=['task_column', 'rank'], name='task_task_column_rank'),
+        ]
         constraints = [
             models.UniqueConstraint(fields=['task_number', 'project'], name='unique_tasknumber_project'),
             models.CheckConstraint(
@@ -64,6 +85,23 @@ class Task(BaseModel):
             )
         ]
 
+    def save(self, *args, **kwargs):
+        # tasks created without a rank go to the bottom of their column
+        appended = not self.rank
+        if appended:
+            self.rank = rank_between(Task.last_rank_in_column(self.task_column_id), None)
+        if self.organization_id is None:
+            self.organization_id = Project.organization_id_for(self.project_id)
+        super(Task, self).save(*args, **kwargs)
+        if appended and len(self.rank) > settings.TASK_RANK_MAX_LENGTH:
+            # collab_app.tasks imports the models
+            from collab_app.tasks import rebalance_task_column
+            rebalance_task_column.delay_on_commit(self.task_column_id)
+
+    @classmethod
+    def last_rank_in_column(cls, task_column_id):
+        return cls.objects.filter(task_column_id=task_column_id).aggregate(Max('rank'))['rank__max'] or None
+
 
 class TaskColumn(BaseModel):
     TASK_COLUMN_RAW_TASK = 'Raw Task'
@@ -71,6 +109,9 @@ class TaskColumn(BaseModel):
 
     name = models.TextField()
     order = models.PositiveIntegerField(default=0)
+    # incremented whenever tasks are moved into, out of or within the column. Clients send back the version
+    # they loaded, and a write against an older version is rejected (see `TaskColumn.lock_versions`).
+    version = models.PositiveIntegerField(default=0)
 
     project = models.ForeignKey(
         'collab_app.Project',
@@ -78,14 +119,58 @@ class TaskColumn(BaseModel):
         on_delete=models.PROTECT
     )
 
+    @classmethod
+    def raw_task_column_id(cls, project_id):
+        # a project's columns are created with it and can't be deleted, so the id can be cached
+        cache_key = f'raw_task_column:{project_id}'
+        task_column_id = cache.get(cache_key)
+        if task_column_id is None:
+            task_column_id = cls.objects.filter(
+                project_id=project_id,
+                name=cls.TASK_COLUMN_RAW_TASK
+            ).values_list('id', flat=True).get()
+            cache.set(cache_key, task_column_id, settings.TASK_COLUMN_ID_CACHE_TTL)
+        return task_column_id
+
+    @classmethod
+    def project_task_column_ids(cls, project_id):
+        # cached, like `raw_task_column_id`
+        cache_key = f'project_task_columns:{project_id}'
+        task_column_ids = cache.get(cache_key)
+        if task_column_ids is None:
+            task_column_ids = set(cls.objects.filter(project_id=project_id).values_list('id', flat=True))
+            cache.set(cache_key, task_column_ids, settings.TASK_COLUMN_ID_CACHE_TTL)
+        return task_column_ids
+
+    @classmethod
+    def lock_versions(cls, task_column_ids, project_id):
+        # Lock the columns and return {id: version}, leaving out the columns that aren't in the project.
+        # The rows are locked in id order, so writers to overlapping columns queue up behind each other
+        # instead of deadlocking. Lock the columns before writing any of their tasks.
+        return dict(
+            cls.objects.select_for_update().filter(
+                id__in=task_column_ids,
+                project_id=project_id
+            ).order_by('id').values_list('id', 'version')
+        )
+
+    @classmethod
+    def bump_versions(cls, task_column_ids):
+        if task_column_ids:
+            cls.objects.filter(id__in=task_column_ids).update(version=F('version') + 1)
+
 
 class TaskMetadata(BaseModel):
-    url_origin = models.TextField(default='')
-    os_name = models.TextField(default='')
-    os_version = models.TextField(default='')
-    os_version_name = models.TextField(default='')
-    browser_name = models.TextField(default='')
-    browser_version = models.TextField(default='')
+    # The values that repeat across tasks are stored once, in lookup tables (see `collab_app.models.lookup`).
+    # Set them with `<Lookup>.objects.id_for(value)`.
+    LOOKUP_FIELDS = ('url_origin', 'os_name', 'os_version', 'os_version_name', 'browser_name', 'browser_version')
+
+    url_origin = models.ForeignKey('collab_app.UrlOrigin', related_name='+', on_delete=models.PROTECT)
+    os_name = models.ForeignKey('collab_app.OsName', related_name='+', on_delete=models.PROTECT)
+    os_version = models.ForeignKey('collab_app.OsVersion', related_name='+', on_delete=models.PROTECT)
+    os_version_name = models.ForeignKey('collab_app.OsVersionName', related_name='+', on_delete=models.PROTECT)
+    browser_name = models.ForeignKey('collab_app.BrowserName', related_name='+', on_delete=models.PROTECT)
+    browser_version = models.ForeignKey('collab_app.BrowserVersion', related_name='+', on_delete=models.PROTECT)
     selector = models.TextField(default='')
     screen_height = models.PositiveSmallIntegerField(default=0)
     screen_width = models.PositiveSmallIntegerField(default=0)
@@ -101,6 +186,18 @@ class TaskMetadata(BaseModel):
         on_delete=models.PROTECT
     )
 
+    # the task's project and organization, copied like `Task.organization`. Set on save from the task.
+    project = models.ForeignKey('collab_app.Project', related_name='+', on_delete=models.PROTECT, blank=True)
+    organization = models.ForeignKey('collab_app.Organization', related_name='+', on_delete=models.PROTECT, blank=True)
+
+    # fetched rows come with their lookup values (see `LookupValuesIterable`)
+    objects = LookupValuesQuerySet.as_manager()
+
+    def save(self, *args, **kwargs):
+        if self.project_id is None or self.organization_id is None:
+            self.project_id, self.organization_id = self.task.project_id, self.task.organization_id
+        super(TaskMetadata, self).save(*args, **kwargs)
+
 
 class TaskComment(BaseModel):
     task = models.ForeignKey(
@@ -116,6 +213,15 @@ class TaskComment(BaseModel):
         on_delete=models.PROTECT
     )
 
+    # the task's project and organization, copied like `Task.organization`. Set on save from the task.
+    project = models.ForeignKey('collab_app.Project', related_name='+', on_delete=models.PROTECT, blank=True)
+    organization = models.ForeignKey('collab_app.Organization', related_name='+', on_delete=models.PROTECT, blank=True)
+
+    def save(self, *args, **kwargs):
+        if self.project_id is None or self.organization_id is None:
+            self.project_id, self.organization_id = self.task.project_id, self.task.organization_id
+        super(TaskComment, self).save(*args, **kwargs)
+
 
 # sqs can only send 256kb of data. The HTML might be larger than 256kb. Therefore, save
 # that html data in this model temporarily, so that the asynchronous task can just
@@ -0,0 +1,39 @@
+import uuid
+
+from django.contrib.postgres.fields import JSONField
+from django.db import models
+
+from collab_app.mixins.models import BaseModel
+
+
+# A widget report accepted by `queue_task_from_widget_anonymous`, waiting to be turned into a task.
+# The `persist_widget_reports` task creates the tasks in batches. See `collab_app.widget`.
+class WidgetReport(BaseModel):
+    class ReportState(models.IntegerChoices):
+        PENDING = 1
+        PROCESSED = 2
+        FAILED = 3
+
+    ticket = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    payload = JSONField(default=dict)  # the request body, as for `create_task_from_widget_anonymous`
+    state = models.PositiveSmallIntegerField(choices=ReportState.choices, default=ReportState.PENDING)
+    error = models.TextField(blank=True, default='')
+
+    project = models.ForeignKey(
+        'collab_app.Project',
+        related_name='widget_reports',
+        on_delete=models.CASCADE
+    )
+
+    task = models.ForeignKey(
+        'collab_app.Task',
+        related_name='+',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['state', 'id'], name='widgetreport_state_id'),
+        ]
@@ -0,0 +1,459 @@
+import logging
+import math
+import datetime
+import re
+from collections import Counter, OrderedDict
+
+from celery import group
+from django.conf import settings
+from django.core.mail import get_connection
+from django.db import models, transaction
+from django.template.loader import render_to_string
+from django.utils import timezone
+from django.utils.html import strip_tags
+from sentry_sdk import capture_exception
+
+from collab_app.models import (
+    NotificationDelivery,
+    NotificationOutbox,
+    Task,
+    TaskColumn,
+    TaskComment,
+    User,
+)
+from collab_app.utils import (
+    generate_email
+)
+
+logger = logging.getLogger('collabsauce')
+
+# match the id from `@@@__<ID HERE>^^^Some Name@@@^^^`
+MENTION_REGEX = r'@@@__(\d+)\^\^\^'
+
+
+"""
+Email builders. Each builder takes the payload of a notification event and returns the
+list of emails (one recipient each) that the event should send.
+"""
+
+
+def get_full_name(user):
+    return f'{user.first_name} {user.last_name}'
+
+
+def get_mentioned_user_ids(text):
+    return [int(user_id) for user_id in re.findall(MENTION_REGEX, text)]
+
+
+def get_mentioned_users(*texts):
+    # fetch every user mentioned in `texts` in one query. Keep the mention order, and drop
+    # mentions of users that no longer exist.
+    user_ids = [user_id for text in texts for user_id in get_mentioned_user_ids(text)]
+    users = User.objects.in_bulk(set(user_ids))
+    return [users[user_id] for user_id in user_ids if user_id in users]
+
+
+def get_task_participants(task):
+    # the task creator and task.assigned_to, the creator of every comment on the task chain,
+    # and anyone who has been mentioned on a comment or on the task title.
+    comments = list(task.task_comments.select_related('creator').order_by('id'))
+    participants = [task.creator, task.assigned_to]
+    participants += [comment.creator for comment in comments]
+    participants += get_mentioned_users(*[comment.text for comment in comments], task.title)
+    return participants
+
+
+class EmailRenderer(object):
+    """
+    Renders each distinct (template, context) pair once.
+
+    Most notification emails have the same body for every recipient, so a builder renders
+    through one `EmailRenderer` per event and reuses the html and text bodies for each recipient.
+    """
+
+    def __init__(self):
+        self._bodies = {}
+
+    def render(self, template_name, context):
+        key = (template_name, tuple(sorted(context.items())))
+        if key not in self._bodies:
+            html_body = render_to_string(template_name, context, using='emails')
+            self._bodies[key] = (html_body, strip_tags(html_body))
+        return self._bodies[key]
+
+    def email(self, subject, template_name, context, user):
+        html_body, text_body = self.render(template_name, context)
+        return generate_email(subject, html_body, settings.EMAIL_HOST_USER, [user.email], text_body=text_body)
+
+
+def build_task_created_emails(task_id, renderer=None):
+    renderer = renderer or EmailRenderer()
+    task = Task.objects.select_related('creator', 'assigned_to').get(id=task_id)
+    if task.creator:
+        task_creator_name = get_full_name(task.creator)
+    else:
+        task_creator_name = task.one_off_email_set_by
+    context = {
+        'task_creator_name': task_creator_name,
+        'task_url': f'projects/{task.project_id}/tasks/{task_id}'
+    }
+
+    emails = []
+    already_mentioned = set()
+
+    # Notify the person assigned on the task (if applicable)
+    assignee = task.assigned_to
+    if assignee:
+        subject = f'{task_creator_name} has assigned you a task.'
+        emails.append(renderer.email(subject, 'emails/tasks/task-assigned.html', context, assignee))
+        already_mentioned.add(assignee)
+
+    # Notify the people mentioned on the task.
+    subject = f'{task_creator_name} has mentioned you on a task.'
+    for mentioned in get_mentioned_users(task.title):
+        if mentioned not in already_mentioned:
+            emails.append(renderer.email(subject, 'emails/tasks/task-mention.html', context, mentioned))
+            already_mentioned.add(mentioned)
+
+    return emails
+
+
+def build_task_comment_created_emails(task_comment_id, renderer=None):
+    renderer = renderer or EmailRenderer()
+    task_comment = TaskComment.objects.select_related(
+        'creator', 'task__creator', 'task__assigned_to'
+    ).get(id=task_comment_id)
+    task = task_comment.task
+    task_comment_creator = task_comment.creator
+    taskcomment_creator_name = get_full_name(task_comment_creator)
+    context = {
+        'taskcomment_creator_name': taskcomment_creator_name,
+        'task_url': f'projects/{task.project_id}/tasks/{task.id}'
+    }
+
+    emails = []
+    already_mentioned = set([task_comment_creator])
+
+    # Notify the people mentioned on the comment.
+    subject = f'{taskcomment_creator_name} has mentioned you on a task.'
+    for mentioned in get_mentioned_users(task_comment.text):
+        emails.append(renderer.email(subject, 'emails/tasks/taskcomment-mention.html', context, mentioned))
+        already_mentioned.add(mentioned)
+
+    # Now notify everyone who is 'participating' on the task chain.
+    # If they are the same person, logic below already handles duplicates
+    subject = f'{taskcomment_creator_name} has commented on a task you are participating on.'
+    for user in get_task_participants(task):
+        if user and user not in already_mentioned:
+            emails.append(renderer.email(subject, 'emails/tasks/taskcomment-participating.html', context, user))
+            already_mentioned.add(user)
+
+    return emails
+
+
+def build_assignee_changed_emails(task_id, renderer=None):
+    # TODO: notify original_assignee (if there was one) that they are unassigned??
+    renderer = renderer or EmailRenderer()
+    task = Task.objects.select_related('assigned_to').get(id=task_id)
+
+    assignee = task.assigned_to
+    if not assignee:
+        return []
+
+    subject = 'You have been assigned a task!'
+    context = {
+        'task_url': f'projects/{task.project_id}/tasks/{task_id}'
+    }
+    return [renderer.email(subject, 'emails/tasks/task-assigned-changed.html', context, assignee)]
+
+
+def build_task_column_changed_emails(task_id, prev_task_column_id, new_task_column_id, mover_id, renderer=None):
+    renderer = renderer or EmailRenderer()
+    task = Task.objects.select_related('creator', 'assigned_to').get(id=task_id)
+    task_columns = TaskColumn.objects.in_bulk([prev_task_column_id, new_task_column_id])
+    prev_task_column = task_columns[int(prev_task_column_id)]
+    new_task_column = task_columns[int(new_task_column_id)]
+    mover = User.objects.get(id=mover_id)
+    mover_full_name = get_full_name(mover)
+    subject = (
+        f'{mover_full_name} has moved task # {task.task_number} '
+        f'from `{prev_task_column.name}` to `{new_task_column.name}`.'
+    )
+    context = {
+        'mover_full_name': mover_full_name,
+        'task_number': task.task_number,
+        'prev_task_column_name': prev_task_column.name,
+        'new_task_column_name': new_task_column.name,
+        'task_url': f'projects/{task.project_id}/tasks/{task.id}'
+    }
+
+    emails = []
+    already_mentioned = set([mover])
+
+    # notify everyone who is 'participating' on the task chain.
+    # If they are the same person, or if that was the mover, logic below already handles duplicates
+    for user in get_task_participants(task):
+        if user and user not in already_mentioned:
+            emails.append(renderer.email(subject, 'emails/tasks/task-moved-column.html', context, user))
+            already_mentioned.add(user)
+
+    return emails
+
+
+EMAIL_BUILDERS = {
+    NotificationOutbox.EventType.TASK_CREATED: build_task_created_emails,
+    NotificationOutbox.EventType.TASK_COMMENT_CREATED: build_task_comment_created_emails,
+    NotificationOutbox.EventType.ASSIGNEE_CHANGED: build_assignee_changed_emails,
+    NotificationOutbox.EventType.TASK_COLUMN_CHANGED: build_task_column_changed_emails,
+}
+
+
+"""
+Sending. Emails are serialized to plain dicts so they can be handed to celery. Large fan-outs are
+split into chunks of recipients that are sent in parallel by `send_notification_email_chunk` tasks.
+"""
+
+
+def serialize_email(email, outbox_id=None, attempt=None):
+    # `attempt` is the outbox entry's attempt the message is sent for (see `record_deliveries`)
+    return {
+        'outbox_id': outbox_id,
+        'attempt': attempt,
+        'to': email.to[0],
+        'subject': email.subject,
+        'text_body': email.body,
+        'html_body': email.alternatives[0][0] if email.alternatives else '',
+    }
+
+
+def chunk_messages(messages):
+    """
+    Split `messages` into chunks of at most NOTIFICATION_FANOUT_CHUNK_SIZE recipients. All the messages
+    of a recipient stay in the same chunk. At most NOTIFICATION_FANOUT_MAX_CHUNKS chunks are made, so one
+    fan-out never takes more than that many workers; past that, the chunks grow instead.
+    """
+    messages_by_recipient = OrderedDict()
+    for message in messages:
+        messages_by_recipient.setdefault(message['to'], []).append(message)
+    recipients = list(messages_by_recipient.values())
+
+    chunk_size = max(
+        settings.NOTIFICATION_FANOUT_CHUNK_SIZE,
+        math.ceil(len(recipients) / settings.NOTIFICATION_FANOUT_MAX_CHUNKS)
+    )
+    return [
+        [message for recipient_messages in recipients[i:i + chunk_size] for message in recipient_messages]
+        for i in range(0, len(recipients), chunk_size)
+    ]
+
+
+def send_messages(messages):
+    """
+    Send `messages` over one connection and record the deliveries of outbox messages that were sent.
+    A failure for one recipient does not stop the others. Returns the `(message, error)` pairs that failed.
+    """
+    sent = []
+    failed = []
+    with get_connection(settings.NOTIFICATION_EMAIL_BACKEND) as connection:
+        for message in messages:
+            email = generate_email(
+                message['subject'],
+                message['html_body'],
+                settings.EMAIL_HOST_USER,
+                [message['to']],
+                text_body=message['text_body']
+            )
+            try:
+                connection.send_messages([email])
+            except Exception as err:
+                failed.append((message, err))
+                continue
+            sent.append((message, None))
+    record_deliveries(sent)
+    return failed
+
+
+def record_failed_messages(failed):
+    # called once a message has used up its retries.
+    for message, err in failed:
+        logger.info('Error while sending notification email')
+        capture_exception(err)
+        logger.info(err)
+    record_deliveries(failed)
+
+
+def record_deliveries(results):
+    """
+    Record a delivery for each outbox message of the `(message, error)` pairs in `results` (`error` is None
+    for a sent message), and count the messages off their entry's `unsent`. Entries of another attempt, or
+    no longer SENDING, are left alone: they were claimed again since. The entries left without unsent
+    messages are then finished (see `finish_outbox_entries`).
+    """
+    deliveries = []
+    delivered = Counter()
+    errors = {}
+    for message, err in results:
+        if not message['outbox_id']:
+            continue
+        deliveries.append(NotificationDelivery(
+            outbox_id=message['outbox_id'],
+            email=message['to'],
+            state=NotificationDelivery.DeliveryState.SENT if err is None else NotificationDelivery.DeliveryState.FAILED,
+            error='' if err is None else str(err)
+        ))
+        delivered[(message['outbox_id'], message.get('attempt'))] += 1
+        if err is not None:
+            errors[message['outbox_id']] = str(err)
+    if not deliveries:
+        return
+
+    NotificationDelivery.objects.bulk_create(deliveries)
+    current_attempts = models.Q()
+    for outbox_id, attempt in delivered:
+        current_attempts |= models.Q(id=outbox_id, attempts=attempt)
+    NotificationOutbox.objects.filter(current_attempts, state=NotificationOutbox.OutboxState.SENDING).update(
+        unsent=models.F('unsent') - models.Case(
+            *[models.When(id=outbox_id, then=count) for (outbox_id, _), count in delivered.items()],
+            output_field=models.PositiveIntegerField()
+        ),
+        last_error=models.Case(
+            *[models.When(id=outbox_id, then=models.Value(error)) for outbox_id, error in errors.items()],
+            default=models.F('last_error'),
+            output_field=models.TextField()
+        )
+    )
+    finish_outbox_entries([outbox_id for outbox_id, _ in delivered])
+
+
+def fan_out_messages(messages):
+    """
+    Send `messages`. A small fan-out (one chunk) is sent right away, by the current worker. A large one
+    is sent as a celery `group` of chunks once the current transaction commits.
+    Failed messages are retried by `send_notification_email_chunk`.
+    """
+    # imported here, as `collab_app.tasks` imports this module
+    from collab_app.tasks import send_notification_email_chunk
+
+    chunks = chunk_messages(messages)
+    if len(chunks) > 1:
+        fan_out = group(send_notification_email_chunk.s(chunk) for chunk in chunks)
+        transaction.on_commit(fan_out.apply_async)
+    elif chunks:
+        failed = [message for message, _ in send_messages(chunks[0])]
+        if failed:
+            retry = send_notification_email_chunk.s(failed).set(countdown=settings.NOTIFICATION_CHUNK_RETRY_DELAY)
+            transaction.on_commit(retry.apply_async)
+
+
+"""
+Transactional outbox.
+"""
+
+
+def enqueue_notification(event, **payload):
+    # Call this inside the transaction that makes the change, so the notification is
+    # recorded if and only if the change is committed.
+    return NotificationOutbox.objects.create(event=event, payload=payload)
+
+
+def enqueue_notifications(event, payloads):
+    # Same as `enqueue_notification`, for changes made in bulk (where no signals fire).
+    return NotificationOutbox.objects.bulk_create([
+        NotificationOutbox(event=event, payload=payload) for payload in payloads
+    ])
+
+
+def claim_outbox_batch(batch_size):
+    """
+    Claim a batch of pending outbox entries: mark them SENDING, and count the attempt. Entries are locked with
+    `SELECT ... FOR UPDATE SKIP LOCKED`, so concurrent dispatchers never claim the same entry, only for the
+    transaction of the claim. An entry whose dispatcher died is claimed again after
+    NOTIFICATION_OUTBOX_CLAIM_TIMEOUT seconds.
+    """
+    now = timezone.now()
+    expired_claims = now - datetime.timedelta(seconds=settings.NOTIFICATION_OUTBOX_CLAIM_TIMEOUT)
+    with transaction.atomic():
+        entries = list(
+            NotificationOutbox.objects.select_for_update(skip_locked=True).filter(
+                models.Q(state=NotificationOutbox.OutboxState.PENDING) |
+                models.Q(state=NotificationOutbox.OutboxState.SENDING, updated__lt=expired_claims)
+            ).order_by('id')[:batch_size]
+        )
+        for entry in entries:
+            entry.state = NotificationOutbox.OutboxState.SENDING
+            entry.attempts += 1
+            entry.unsent = 0
+            entry.last_error = ''
+            entry.updated = now  # when it was claimed
+        NotificationOutbox.objects.bulk_update(entries, ['state', 'attempts', 'unsent', 'last_error', 'updated'])
+    return entries
+
+
+def finish_outbox_entries(outbox_ids):
+    # The SENDING entries of `outbox_ids` without unsent messages are SENT, unless building or sending one of
+    # their messages failed: then they are retried, until they have used up NOTIFICATION_OUTBOX_MAX_ATTEMPTS.
+    now = timezone.now()
+    sent = models.Q(last_error='')
+    NotificationOutbox.objects.filter(
+        id__in=outbox_ids,
+        state=NotificationOutbox.OutboxState.SENDING,
+        unsent=0
+    ).update(
+        state=models.Case(
+            models.When(sent, then=NotificationOutbox.OutboxState.SENT),
+            models.When(
+                attempts__gte=settings.NOTIFICATION_OUTBOX_MAX_ATTEMPTS,
+                then=NotificationOutbox.OutboxState.FAILED
+            ),
+            default=NotificationOutbox.OutboxState.PENDING
+        ),
+        sent_at=models.Case(models.When(sent, then=models.Value(now)), default=models.F('sent_at')),
+        updated=now
+    )
+
+
+def dispatch_outbox_batch(batch_size=None):
+    """
+    Claim a batch of pending outbox entries and send them. Returns the number of entries claimed.
+
+    The claim is committed before anything is built or sent (see `claim_outbox_batch`), so no row lock is
+    held while waiting on SMTP. Each recipient's delivery is recorded as it is sent, or once it has used up
+    its retries (see `fan_out_messages`), and a re-claimed entry skips the recipients that were already sent
+    to. An entry is SENT once every one of its messages was.
+    """
+    entries = claim_outbox_batch(batch_size or settings.NOTIFICATION_OUTBOX_BATCH_SIZE)
+    if not entries:
+        return 0
+
+    already_delivered = set(NotificationDelivery.objects.filter(
+        outbox__in=entries,
+        state=NotificationDelivery.DeliveryState.SENT
+    ).values_list('outbox_id', 'email'))
+
+    messages = []
+    renderer = EmailRenderer()  # shared by the batch, so repeated events reuse rendered bodies
+    for entry in entries:
+        try:
+            emails = EMAIL_BUILDERS[entry.event](renderer=renderer, **entry.payload)
+        except Exception as err:
+            logger.info('Error while building notification emails')
+            capture_exception(err)
+            logger.info(err)
+            entry.last_error = str(err)
+            continue
+        entry_messages = [
+            serialize_email(email, outbox_id=entry.id, attempt=entry.attempts) for email in emails
+            if (entry.id, email.to[0]) not in already_delivered
+        ]
+        entry.unsent = len(entry_messages)
+        messages += entry_messages
+
+    # before sending, so no delivery is counted off an entry that doesn't count its messages yet
+    NotificationOutbox.objects.bulk_update(entries, ['unsent', 'last_error'])
+    # the entries with nothing to send, and those that failed to build
+    finished_ids = [entry.id for entry in entries if not entry.unsent]
+    if finished_ids:
+        finish_outbox_entries(finished_ids)
+
+    fan_out_messages(messages)
+    return len(entries)
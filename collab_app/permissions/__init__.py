@@ -1,6 +1,6 @@
-from collab_app.permissions.object_level import GateKeeper, SideGateKeeper
+from collab_app.permissions.object_level import GateKeeper, SideGateKeeper, get_organization_access
 
 # for flake8
 __all__ = [
-    'GateKeeper', 'SideGateKeeper'
+    'GateKeeper', 'SideGateKeeper', 'get_organization_access'
 ]
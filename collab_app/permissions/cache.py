@@ -0,0 +1,116 @@
+import json
+import logging
+import time
+import uuid
+
+import redis
+from django.conf import settings
+from django.db import transaction
+from sentry_sdk import capture_exception
+
+
+"""
+A cache of each user's access set (the organizations they belong to, their roles and the projects of those
+organizations), shared across requests. Optional: it is on when PERMISSION_CACHE_REDIS_URL is set.
+
+Entries are keyed by the user's access version: `permissions:access:<user id>:<epoch>:<version>`. Changing
+a membership, or creating or deleting a project, increments the version of the users concerned (see
+`collab_app.signals.permission_cache`), so their old entries are never read again and expire. The
+version is read from Redis on every request, and the entry itself is also kept in process memory, so a
+user whose access didn't change costs one Redis round trip and no queries.
+
+The epoch is a random id stored with the version, and replaced when the version is lost (Redis restarted or
+evicted it), so a version that starts again from 0 never matches an entry of the old one. When a version
+can't be incremented, the process drops its local entries, and reads go to Redis or the database.
+
+Versions are incremented when the change is saved and again once it commits: a request that reads the
+database between the two can only cache what it read under the first version.
+"""
+
+logger = logging.getLogger('collabsauce')
+
+# the most entries kept in process memory. The whole local cache is dropped when it is full.
+MAX_LOCAL_ENTRIES = 10000
+
+_redis = None
+# {versioned key: (expires at, entry)}, for this process
+_local_cache = {}
+
+
+def is_enabled():
+    return bool(settings.PERMISSION_CACHE_REDIS_URL)
+
+
+def get_redis():
+    global _redis
+    if _redis is None:
+        _redis = redis.Redis.from_url(settings.PERMISSION_CACHE_REDIS_URL, decode_responses=True)
+    return _redis
+
+
+def version_key(user_id):
+    # a hash of the epoch and the version. Named apart from the integer keys the versions used to be.
+    return f'permissions:epoch_version:{user_id}'
+
+
+def get_access(user_id, load):
+    """
+    Return the user's access entry, a JSON-serializable dict. `load()` reads it from the database on a miss,
+    or for every call when the cache is off or Redis is down.
+    """
+    if not is_enabled():
+        return load()
+    try:
+        # {'epoch': ..., 'version': ...}, with a new epoch if the version was lost
+        pipeline = get_redis().pipeline(transaction=False)
+        pipeline.hsetnx(version_key(user_id), 'epoch', uuid.uuid4().hex)
+        pipeline.hmget(version_key(user_id), 'epoch', 'version')
+        _, (epoch, version) = pipeline.execute()
+        key = f'permissions:access:{user_id}:{epoch}:{version or 0}'
+
+        expires_at, entry = _local_cache.get(key, (0, None))
+        if expires_at > time.monotonic():
+            return entry
+
+        cached = get_redis().get(key)
+        if cached is None:
+            entry = load()
+            get_redis().set(key, json.dumps(entry), ex=settings.PERMISSION_CACHE_TTL)
+        else:
+            entry = json.loads(cached)
+    except redis.RedisError as err:
+        logger.info('Failed to read the permission cache from redis')
+        capture_exception(err)
+        logger.info(err)
+        return load()
+
+    if len(_local_cache) >= MAX_LOCAL_ENTRIES:
+        _local_cache.clear()
+    _local_cache[key] = (time.monotonic() + settings.PERMISSION_CACHE_TTL, entry)
+    return entry
+
+
+def invalidate(user_ids):
+    """
+    Make the users' cached access stale, now and again when the current transaction commits. See above.
+    """
+    if not is_enabled():
+        return
+    user_ids = set(user_ids)
+    if user_ids:
+        bump_versions(user_ids)
+        transaction.on_commit(lambda: bump_versions(user_ids))
+
+
+def bump_versions(user_ids):
+    try:
+        pipeline = get_redis().pipeline(transaction=False)
+        for user_id in user_ids:
+            pipeline.hincrby(version_key(user_id), 'version', 1)
+        pipeline.execute()
+    except redis.RedisError as err:
+        logger.info('Failed to invalidate the permission cache in redis')
+        capture_exception(err)
+        logger.info(err)
+        # the old entries would still be read from this process
+        _local_cache.clear()
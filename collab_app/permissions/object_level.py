@@ -1,4 +1,6 @@
+from django.db import connection, transaction
 from django.db.models import Q
+from rest_framework.serializers import ListSerializer
 
 from collab_app.models import (
     Invite,
@@ -11,6 +13,66 @@ from collab_app.models import (
     TaskComment,
     User,
 )
+from collab_app.permissions import cache as permission_cache
+from collab_app.permissions import row_level_security
+
+
+class OrganizationAccess(object):
+    """
+    The organizations a user belongs to, their role in each ({organization id: role}) and the projects of
+    those organizations ({project id: organization id}).
+
+    It is resolved once per request (see `get_organization_access`) and shared by the permission filters of
+    the main queryset and of every sideload, which filter by `organization_id__in` against it instead of
+    joining through the memberships again. Tasks, task comments and task metadata store their organization
+    id, so none of these filters need a join. Across requests, it is cached in `collab_app.permissions.cache`.
+    """
+    def __init__(self, user_id, roles, projects):
+        self.user_id = user_id
+        self.roles = roles
+        self.projects = projects
+
+    @classmethod
+    def for_user(cls, user):
+        if not user.is_authenticated:
+            return cls(None, {}, {})
+        entry = permission_cache.get_access(user.id, lambda: cls.load(user.id))
+        # JSON object keys are strings
+        return cls(
+            user.id,
+            {int(organization_id): role for organization_id, role in entry['roles'].items()},
+            {int(project_id): organization_id for project_id, organization_id in entry['projects'].items()}
+        )
+
+    @staticmethod
+    def load(user_id):
+        roles, projects = {}, {}
+        for organization_id, role, project_id in Membership.objects.filter(
+            user_id=user_id
+        ).values_list('organization_id', 'role', 'organization__projects__id'):
+            roles[organization_id] = role
+            if project_id is not None:
+                projects[project_id] = organization_id
+        return {'roles': roles, 'projects': projects}
+
+    @property
+    def organization_ids(self):
+        return list(self.roles)
+
+    @property
+    def admin_organization_ids(self):
+        return [
+            organization_id for organization_id, role in self.roles.items() if role == Membership.RoleType.ADMIN
+        ]
+
+
+def get_organization_access(request):
+    # cached on the (rest framework) request, which the view and the serializers' context share
+    access = getattr(request, '_organization_access', None)
+    if access is None or access.user_id != request.user.id:
+        access = OrganizationAccess.for_user(request.user)
+        request._organization_access = access
+    return access
 
 
 class BaseObjectPermission(object):
@@ -20,91 +82,112 @@ class BaseObjectPermission(object):
     By default, a user can read or update on a model object.
     Update the appropriate method to apply permissions on the action.
     """
-    def read(self, queryset, user):
+    def read(self, queryset, user, access):
         return queryset
 
-    def update(self, queryset, user):
+    def update(self, queryset, user, access):
         return queryset
 
 
 class InvitePermission(BaseObjectPermission):
-    def read(self, queryset, user):
-        return queryset.filter(organization__memberships__user=user)
+    def read(self, queryset, user, access):
+        return queryset.filter(organization_id__in=access.organization_ids)
 
 
 class MembershipPermission(BaseObjectPermission):
-    def read(self, queryset, user):
-        return queryset.filter(organization__memberships__user=user)
+    def read(self, queryset, user, access):
+        return queryset.filter(organization_id__in=access.organization_ids)
 
 
 class OrganizationPermission(BaseObjectPermission):
-    def read(self, queryset, user):
-        return queryset.filter(memberships__user=user)
+    def read(self, queryset, user, access):
+        return queryset.filter(id__in=access.organization_ids)
 
-    def update(self, queryset, user):
+    def update(self, queryset, user, access):
         # you can update an org if you are the admin of the org
-        return queryset.filter(
-            Q(memberships__role=Membership.RoleType.ADMIN) &
-            Q(memberships__user=user)
-        )
+        return queryset.filter(id__in=access.admin_organization_ids)
 
 
 class ProfilePermission(BaseObjectPermission):
-    def read(self, queryset, user):
+    def read(self, queryset, user, access):
         # can read profile that belong to you
         return queryset.filter(user=user)
 
-    def update(self, queryset, user):
+    def update(self, queryset, user, access):
         # can only update profile that belong to you
         return queryset.filter(user=user)
 
 
 class ProjectPermission(BaseObjectPermission):
-    def read(self, queryset, user):
-        return queryset.filter(organization__memberships__user=user)
+    def read(self, queryset, user, access):
+        return queryset.filter(organization_id__in=access.organization_ids)
 
-    def update(self, queryset, user):
-        return queryset.filter(organization__memberships__user=user)
+    def update(self, queryset, user, access):
+        return queryset.filter(organization_id__in=access.organization_ids)
 
 
 class TaskPermission(BaseObjectPermission):
-    def read(self, queryset, user):
-        return queryset.filter(project__organization__memberships__user=user)
+    def read(self, queryset, user, access):
+        return queryset.filter(organization_id__in=access.organization_ids)
 
-    def update(self, queryset, user):
+    def update(self, queryset, user, access):
         return queryset.filter(creator=user)
 
 
 class TaskMetadataPermission(BaseObjectPermission):
-    def read(self, queryset, user):
-        return queryset.filter(task__project__organization__memberships__user=user)
+    def read(self, queryset, user, access):
+        return queryset.filter(organization_id__in=access.organization_ids)
 
-    def update(self, queryset, user):
+    def update(self, queryset, user, access):
         return queryset.filter(task__creator=user)  # remove permission?
 
 
 class TaskCommentPermission(BaseObjectPermission):
-    def read(self, queryset, user):
-        return queryset.filter(task__project__organization__memberships__user=user)
+    def read(self, queryset, user, access):
+        return queryset.filter(organization_id__in=access.organization_ids)
 
-    def update(self, queryset, user):
+    def update(self, queryset, user, access):
         return queryset.filter(creator=user)  # remove permission?
 
 
 class UserPermission(BaseObjectPermission):
-    def read(self, queryset, user):
+    def read(self, queryset, user, access):
         # can read your own user,
         # or other users of the orgs you belong to.
         return queryset.filter(
             Q(id=user.id) |
-            Q(memberships__organization__memberships__user=user)
+            Q(id__in=Membership.objects.filter(organization_id__in=access.organization_ids).values('user_id'))
         )
 
-    def update(self, queryset, user):
+    def update(self, queryset, user, access):
         # can only update your own user
         return queryset.filter(id=user.id)
 
 
+# {(model, relation)}: sideloads whose rows a user can read whenever they can read the parent row they are
+# fetched through. The child has the same organization as its parent (or, for `Membership.user`, belongs to
+# it, and `Profile.user` is the reader), so reading it through a permission-filtered parent can't widen
+# what the `read` filters allow. Relations that can lead out of the parent's organization are not here: a
+# user's memberships, profile, created tasks and sent invites, and the creator or assignee of a task, who
+# may have left the organization since.
+TRUSTED_SIDELOADS = frozenset([
+    (Invite, 'organization'),
+    (Membership, 'organization'),
+    (Membership, 'user'),
+    (Organization, 'invites'),
+    (Organization, 'memberships'),
+    (Organization, 'projects'),
+    (Profile, 'user'),
+    (Project, 'organization'),
+    (Project, 'tasks'),
+    (Task, 'project'),
+    (Task, 'task_comments'),
+    (Task, 'task_metadata'),
+    (TaskComment, 'task'),
+    (TaskMetadata, 'task'),
+])
+
+
 class BaseQuerySetPermission(object):
     object_perm_mapping = {
         Invite: InvitePermission(),
@@ -139,14 +222,19 @@ class BaseQuerySetPermission(object):
         if sideload and model in self.no_sideload_filtering:
             return queryset
 
+        # in row-level security mode, postgres filters what the request can read (see `GateKeeper.initial`)
+        if getattr(request, '_row_level_security', False) and model in row_level_security.POLICIES:
+            return queryset
+
+        access = get_organization_access(request)
         if request.method == 'GET':
-            return permission.read(queryset, user)
+            return permission.read(queryset, user, access)
         elif request.method == 'DELETE' and 'delete' in dir(permission):
             # If Delete, and the permission has a delete method, use the delete method.
             # Else just use the normal update method.
-            return permission.delete(queryset, user)
+            return permission.delete(queryset, user, access)
         elif request.method in ('PUT', 'PATCH', 'DELETE'):
-            return permission.update(queryset, user)
+            return permission.update(queryset, user, access)
         else:
             return queryset
 
@@ -161,6 +249,29 @@ class GateKeeper(BaseQuerySetPermission):
         queryset = super(GateKeeper, self).get_queryset()
         return self.queryset_filter(queryset, self.model, self.request)
 
+    # Used by Django
+    def dispatch(self, request, *args, **kwargs):
+        if not (row_level_security.is_enabled() and request.method == 'GET'):
+            return super(GateKeeper, self).dispatch(request, *args, **kwargs)
+
+        # row-level security is scoped to this transaction (see `initial`), so it ends with the request, whether
+        # the view returned or raised
+        nested = connection.in_atomic_block
+        with transaction.atomic():
+            response = super(GateKeeper, self).dispatch(request, *args, **kwargs)
+            if nested and getattr(self.request, '_row_level_security', False):
+                # the outer transaction goes on after the request
+                row_level_security.unscope()
+        return response
+
+    # Used by Rest Framework, once the user is authenticated
+    def initial(self, request, *args, **kwargs):
+        super(GateKeeper, self).initial(request, *args, **kwargs)
+        if row_level_security.applies_to(request):
+            access = get_organization_access(request)
+            row_level_security.scope(request.user.id, access.organization_ids)
+            request._row_level_security = True
+
 
 class SideGateKeeper(BaseQuerySetPermission):
     """
@@ -169,4 +280,21 @@ class SideGateKeeper(BaseQuerySetPermission):
 
     # Used by Dynamic Rest Framework to filter sideloads
     def filter_queryset(self, queryset):
-        return self.queryset_filter(queryset, self.Meta.model, self.context['request'], sideload=True)
+        request = self.context['request']
+        if request.method == 'GET' and self.sideloaded_through() in TRUSTED_SIDELOADS:
+            # prefetched through parents that were filtered already, see TRUSTED_SIDELOADS
+            return queryset
+        return self.queryset_filter(queryset, self.Meta.model, request, sideload=True)
+
+    def sideloaded_through(self):
+        # (parent model, relation) this serializer sideloads, or None for the primary resource.
+        # The relation field is the parent of the serializer, or of its list serializer for `many` relations.
+        field = self.parent
+        if isinstance(field, ListSerializer):
+            field = field.parent
+        parent = getattr(field, 'parent', None)
+        # the parent's rows were permission-filtered only if it has a permission class
+        model = getattr(getattr(parent, 'Meta', None), 'model', None)
+        if model not in self.object_perm_mapping or model in self.no_sideload_filtering:
+            return None
+        return (model, field.source)
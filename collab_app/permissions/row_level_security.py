@@ -0,0 +1,133 @@
+from django.conf import settings
+from django.db import connection
+from django.db.transaction import TransactionManagementError
+
+from collab_app.models import (
+    Invite,
+    Membership,
+    Organization,
+    Profile,
+    Project,
+    Task,
+    TaskComment,
+    TaskMetadata,
+    User,
+)
+
+
+"""
+Row-level security mode: organization visibility enforced by Postgres instead of the `read` filters of the
+permission classes. Optional: it is on when PERMISSION_ROW_LEVEL_SECURITY is set, on postgres, once
+`manage.py row_level_security --enable` has installed the role and the policies.
+
+The policies apply to the `collab_tenant` role only. For authenticated GET requests of non-superusers,
+`GateKeeper` runs the request in a transaction, switches it to that role and sets the user's id and
+organization ids as variables of the transaction (SET LOCAL), so they end with it whatever the view does; the
+policies read them back, so the permission filters become one indexed predicate per table
+(`organization_id = ANY(...)`). Everything else (writes, celery, the admin, migrations) runs as the owner of
+the tables, which the policies don't apply to.
+"""
+
+TENANT_ROLE = 'collab_tenant'
+POLICY_NAME = 'collab_tenant_read'
+
+IN_ORGANIZATIONS = 'organization_id = ANY(collab_rls_organization_ids())'
+
+# {model: the rows the tenant role can read}. Each one matches the model's `read` permission in `object_level`.
+POLICIES = {
+    Invite: IN_ORGANIZATIONS,
+    Membership: IN_ORGANIZATIONS,
+    Organization: 'id = ANY(collab_rls_organization_ids())',
+    Profile: 'user_id = collab_rls_user_id()',
+    Project: IN_ORGANIZATIONS,
+    Task: IN_ORGANIZATIONS,
+    TaskComment: IN_ORGANIZATIONS,
+    TaskMetadata: IN_ORGANIZATIONS,
+    User: (
+        f'id = collab_rls_user_id() OR EXISTS ('
+        f'SELECT 1 FROM {Membership._meta.db_table} m '
+        f'WHERE m.user_id = {User._meta.db_table}.id AND m.organization_id = ANY(collab_rls_organization_ids()))'
+    ),
+}
+
+FUNCTIONS_SQL = """
+CREATE OR REPLACE FUNCTION collab_rls_organization_ids() RETURNS integer[] LANGUAGE sql STABLE AS $$
+    SELECT coalesce(nullif(current_setting('collab.organization_ids', true), ''), '{}')::integer[]
+$$;
+CREATE OR REPLACE FUNCTION collab_rls_user_id() RETURNS integer LANGUAGE sql STABLE AS $$
+    SELECT nullif(current_setting('collab.user_id', true), '')::integer
+$$;
+"""
+
+
+def is_enabled():
+    return settings.PERMISSION_ROW_LEVEL_SECURITY and connection.vendor == 'postgresql'
+
+
+def applies_to(request):
+    return (
+        is_enabled() and
+        request.method == 'GET' and
+        request.user.is_authenticated and
+        not request.user.is_superuser
+    )
+
+
+def scope(user_id, organization_ids):
+    # Read as the tenant role, as `user_id` in `organization_ids`, until the end of the current transaction.
+    # Outside of one, SET LOCAL would have no effect.
+    if not connection.in_atomic_block:
+        raise TransactionManagementError('Row-level security can only be scoped inside a transaction.')
+    # array literal, e.g. '{1,2}'. An empty one matches nothing.
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SET LOCAL ROLE {TENANT_ROLE}; '
+            "SELECT set_config('collab.user_id', %s, true), set_config('collab.organization_ids', %s, true)",
+            [str(user_id), '{' + ','.join(str(organization_id) for organization_id in organization_ids) + '}']
+        )
+
+
+def unscope():
+    # before the end of the transaction, e.g. when it's a savepoint of an outer one
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'RESET ROLE; '
+            "SELECT set_config('collab.user_id', '', true), set_config('collab.organization_ids', '', true)"
+        )
+
+
+def enable():
+    """
+    Create the tenant role and the policies (again). Needs the CREATEROLE privilege, and must run as the
+    owner of the tables. Run it again after adding a model to POLICIES.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            DO $$ BEGIN
+                IF NOT EXISTS (SELECT FROM pg_roles WHERE rolname = '{TENANT_ROLE}') THEN
+                    CREATE ROLE {TENANT_ROLE} NOLOGIN;
+                END IF;
+            END $$;
+            GRANT {TENANT_ROLE} TO CURRENT_USER;
+            GRANT USAGE ON SCHEMA public TO {TENANT_ROLE};
+            GRANT SELECT ON ALL TABLES IN SCHEMA public TO {TENANT_ROLE};
+            ALTER DEFAULT PRIVILEGES IN SCHEMA public GRANT SELECT ON TABLES TO {TENANT_ROLE};
+        """)
+        cursor.execute(FUNCTIONS_SQL)
+        for model, condition in POLICIES.items():
+            table = connection.ops.quote_name(model._meta.db_table)
+            cursor.execute(f"""
+                ALTER TABLE {table} ENABLE ROW LEVEL SECURITY;
+                DROP POLICY IF EXISTS {POLICY_NAME} ON {table};
+                CREATE POLICY {POLICY_NAME} ON {table} FOR SELECT TO {TENANT_ROLE} USING ({condition});
+            """)
+
+
+def disable():
+    with connection.cursor() as cursor:
+        for model in POLICIES:
+            table = connection.ops.quote_name(model._meta.db_table)
+            cursor.execute(f"""
+                DROP POLICY IF EXISTS {POLICY_NAME} ON {table};
+                ALTER TABLE {table} DISABLE ROW LEVEL SECURITY;
+            """)
@@ -0,0 +1,117 @@
+"""
+Fractional ranks for ordering tasks inside a task column.
+
+A rank is a base 36 string that sorts byte-wise (the `rank` column uses the "C" collation). A card moved
+between two others gets a rank between theirs, so moving a card only writes that card. Ranks never end
+in '0', which guarantees there is always room for another rank between two neighbours.
+
+Every move between two close neighbours can make the new rank a digit longer. When a rank gets longer
+than TASK_RANK_MAX_LENGTH, the column is rebalanced (see `collab_app.tasks.rebalance_task_column`).
+"""
+import bisect
+
+DIGITS = '0123456789abcdefghijklmnopqrstuvwxyz'
+BASE = len(DIGITS)
+
+
+def rank_between(before=None, after=None):
+    """
+    Return a rank that sorts after `before` and before `after`. Either one may be None, meaning the start
+    or the end of the column.
+    """
+    before = before or ''
+    if after is not None and not before < after:
+        raise ValueError(f'{before!r} does not sort before {after!r}.')
+    if before.endswith('0') or (after or '').endswith('0'):
+        raise ValueError('Ranks can not end in 0.')
+    return _midpoint(before, after)
+
+
+def _midpoint(before, after):
+    if after is not None:
+        # skip the prefix the two ranks share ('' is padded with zeros)
+        n = 0
+        while n < len(after) and (before[n] if n < len(before) else '0') == after[n]:
+            n += 1
+        if n > 0:
+            return after[:n] + _midpoint(before[n:], after[n:])
+
+    digit_before = DIGITS.index(before[0]) if before else 0
+    digit_after = DIGITS.index(after[0]) if after is not None else BASE
+    if digit_after - digit_before > 1:
+        return DIGITS[(digit_before + digit_after) // 2]
+    # the first digits are adjacent
+    if after is not None and len(after) > 1:
+        return after[:1]
+    return DIGITS[digit_before] + _midpoint(before[1:], None)
+
+
+def ranks_between(before, after, count):
+    """
+    Return `count` increasing ranks between `before` and `after`, spread out so they stay short.
+    """
+    if count == 0:
+        return []
+    middle = rank_between(before, after)
+    left = ranks_between(before, middle, (count - 1) // 2)
+    right = ranks_between(middle, after, count - 1 - len(left))
+    return left + [middle] + right
+
+
+def rerank(ranks):
+    """
+    Given the current ranks of a column's tasks in their new order, return {position: new rank} for as few
+    positions as possible so that the column sorts in that order.
+
+    The longest run of ranks that already increase is kept, and every other position gets a rank between
+    its kept neighbours. Empty ranks are always replaced.
+    """
+    # longest increasing subsequence, with back links to rebuild it
+    tails, tail_positions, previous = [], [], [None] * len(ranks)
+    for position, rank in enumerate(ranks):
+        if not rank:
+            continue
+        i = bisect.bisect_left(tails, rank)
+        if i == len(tails):
+            tails.append(rank)
+            tail_positions.append(position)
+        else:
+            tails[i] = rank
+            tail_positions[i] = position
+        previous[position] = tail_positions[i - 1] if i else None
+    kept = set()
+    position = tail_positions[-1] if tail_positions else None
+    while position is not None:
+        kept.add(position)
+        position = previous[position]
+
+    new_ranks = {}
+    run, before = [], None
+    for position in range(len(ranks) + 1):
+        if position < len(ranks) and position not in kept:
+            run.append(position)
+            continue
+        after = ranks[position] if position < len(ranks) else None
+        new_ranks.update(zip(run, ranks_between(before, after, len(run))))
+        run, before = [], after
+    return new_ranks
+
+
+def evenly_spaced_ranks(count):
+    """
+    Return `count` increasing ranks spread evenly over the rank space, all of the shortest length that fits.
+    """
+    width = 1
+    while BASE ** width <= count:
+        width += 1
+    step = BASE ** width // (count + 1)
+    return [_encode(step * (i + 1), width) for i in range(count)]
+
+
+def _encode(value, width):
+    digits = []
+    for _ in range(width):
+        value, digit = divmod(value, BASE)
+        digits.append(DIGITS[digit])
+    # dropping the trailing zeros keeps the order of equal width ranks
+    return ''.join(reversed(digits)).rstrip('0')
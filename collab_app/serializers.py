@@ -1,4 +1,6 @@
 from allauth.account.models import EmailAddress
+from django.db.models import CharField, Case, Exists, OuterRef, Value, When
+from django.db.models.functions import Concat
 from dynamic_rest.serializers import (
     DynamicModelSerializer,
 )
@@ -6,17 +8,24 @@ from dynamic_rest.fields import (
     DynamicMethodField,
     DynamicRelationField
 )
+from rest_framework import serializers
 
 from collab_app.models import (
+    BrowserName,
+    BrowserVersion,
     Invite,
     Membership,
     Organization,
+    OsName,
+    OsVersion,
+    OsVersionName,
     Profile,
     Project,
     Task,
     TaskColumn,
     TaskComment,
     TaskMetadata,
+    UrlOrigin,
     User,
 )
 from collab_app.permissions import (
@@ -28,6 +37,55 @@ class ApiSerializer(SideGateKeeper, DynamicModelSerializer):
     pass
 
 
+def full_name(user_field):
+    """
+    Annotation: `<first name> <last name>` of the user at `user_field`, or NULL without one. Lets a list
+    read display names in its own query, instead of sideloading the users.
+    """
+    return Case(
+        When(**{f'{user_field}__isnull': True}, then=Value(None)),
+        default=Concat(f'{user_field}__first_name', Value(' '), f'{user_field}__last_name'),
+        output_field=CharField()
+    )
+
+
+def get_full_name(instance, user_field):
+    # the `<user_field>_full_name` annotation, or, for an instance that wasn't read through the serializer's
+    # `filter_queryset` (e.g. one that was just created), the name of the user itself
+    annotation = f'{user_field}_full_name'
+    if hasattr(instance, annotation):
+        return getattr(instance, annotation)
+    user = getattr(instance, user_field)
+    return f'{user.first_name} {user.last_name}' if user else None
+
+
+class LookupValueField(serializers.Field):
+    """
+    Read-only. Serializes a foreign key to a lookup table (see `collab_app.models.lookup`) as the value: the
+    lookup row fetched with the instance (see `LookupValuesIterable`), else from the in-memory lookup cache.
+    Filters and sorts on it compare the value (see `collab_app.filters`).
+    """
+
+    def __init__(self, lookup_model, **kwargs):
+        self.lookup_model = lookup_model
+        kwargs['read_only'] = True
+        super(LookupValueField, self).__init__(**kwargs)
+
+    def bind(self, field_name, parent):
+        # read the id, so the lookup row itself is never loaded
+        self.source = self.source or f'{field_name}_id'
+        super(LookupValueField, self).bind(field_name, parent)
+
+    def get_attribute(self, instance):
+        model_field = instance._meta.get_field(self.field_name)
+        if model_field.is_cached(instance):
+            return model_field.get_cached_value(instance).value
+        return self.lookup_model.objects.value_for(super(LookupValueField, self).get_attribute(instance))
+
+    def to_representation(self, value):
+        return value
+
+
 class InviteSerializer(ApiSerializer):
 
     class Meta:
@@ -157,6 +215,7 @@ class TaskSerializer(ApiSerializer):
             'creator_full_name',
             'project',
             'order',
+            'rank',
             'task_column',
             'task_comments',
             'task_metadata',
@@ -174,25 +233,31 @@ class TaskSerializer(ApiSerializer):
         )
 
     assigned_to = DynamicRelationField('UserSerializer')
-    assigned_to_full_name = DynamicMethodField(requires=['assigned_to.'])
+    # annotated in `filter_queryset`
+    assigned_to_full_name = DynamicMethodField(requires=['id'])
     creator = DynamicRelationField('UserSerializer')
-    creator_full_name = DynamicMethodField(requires=['creator.'])
+    creator_full_name = DynamicMethodField(requires=['one_off_email_set_by'])
+    # Deprecated: `move_task` only writes `rank`, so once a task was moved `order` is no longer its position in
+    # the column. Sort by `rank`.
+    order = serializers.IntegerField(read_only=True, help_text='Deprecated. Sort the tasks of a column by rank.')
     project = DynamicRelationField('ProjectSerializer')
     task_column = DynamicRelationField('TaskColumnSerializer')
     task_comments = DynamicRelationField('TaskCommentSerializer', many=True)
     task_metadata = DynamicRelationField('TaskMetadataSerializer')
 
+    # Used by Dynamic Rest Framework for the tasks it reads, listed or sideloaded
+    def filter_queryset(self, queryset):
+        queryset = super(TaskSerializer, self).filter_queryset(queryset)
+        for user_field in ('assigned_to', 'creator'):
+            if f'{user_field}_full_name' in self.fields:
+                queryset = queryset.annotate(**{f'{user_field}_full_name': full_name(user_field)})
+        return queryset
+
     def get_assigned_to_full_name(self, task):
-        assigned_to = task.assigned_to
-        if assigned_to:
-            return f'{task.assigned_to.first_name} {task.assigned_to.last_name}'
-        return ''
+        return get_full_name(task, 'assigned_to') or ''
 
     def get_creator_full_name(self, task):
-        if task.creator:
-            return f'{task.creator.first_name} {task.creator.last_name}'
-        else:
-            return task.one_off_email_set_by
+        return get_full_name(task, 'creator') or task.one_off_email_set_by
 
 
 class TaskCommentSerializer(ApiSerializer):
@@ -212,11 +277,19 @@ class TaskCommentSerializer(ApiSerializer):
         )
 
     creator = DynamicRelationField('UserSerializer')
-    creator_full_name = DynamicMethodField(requires=['creator.'])
+    # annotated in `filter_queryset`
+    creator_full_name = DynamicMethodField(requires=['id'])
     task = DynamicRelationField('TaskSerializer')
 
+    # Used by Dynamic Rest Framework for the comments it reads, listed or sideloaded
+    def filter_queryset(self, queryset):
+        queryset = super(TaskCommentSerializer, self).filter_queryset(queryset)
+        if 'creator_full_name' in self.fields:
+            queryset = queryset.annotate(creator_full_name=full_name('creator'))
+        return queryset
+
     def get_creator_full_name(self, task_comment):
-        return f'{task_comment.creator.first_name} {task_comment.creator.last_name}'
+        return get_full_name(task_comment, 'creator')
 
 
 class TaskColumnSerializer(ApiSerializer):
@@ -229,6 +302,7 @@ class TaskColumnSerializer(ApiSerializer):
             'order',
             'project',
             'tasks',
+            'version',
         )
         deferred_fields = (
             'project',
@@ -267,6 +341,12 @@ class TaskMetadataSerializer(ApiSerializer):
         )
 
     task = DynamicRelationField('TaskSerializer')
+    url_origin = LookupValueField(UrlOrigin)
+    os_name = LookupValueField(OsName)
+    os_version = LookupValueField(OsVersion)
+    os_version_name = LookupValueField(OsVersionName)
+    browser_name = LookupValueField(BrowserName)
+    browser_version = LookupValueField(BrowserVersion)
 
 
 class UserSerializer(ApiSerializer):
@@ -298,12 +378,25 @@ class UserSerializer(ApiSerializer):
             'created_task_comments',
         )
 
-    email_verified = DynamicMethodField()
+    # annotated in `filter_queryset`
+    email_verified = DynamicMethodField(requires=['id'])
     invites_sent = DynamicRelationField('InviteSerializer', many=True)
     memberships = DynamicRelationField('MembershipSerializer', many=True)
     profile = DynamicRelationField('ProfileSerializer')
     created_tasks = DynamicRelationField('TaskSerializer', many=True)
     created_task_comments = DynamicRelationField('TaskCommentSerializer', many=True)
 
+    # Used by Dynamic Rest Framework for the users it reads, listed or sideloaded
+    def filter_queryset(self, queryset):
+        queryset = super(UserSerializer, self).filter_queryset(queryset)
+        if 'email_verified' in self.fields:
+            queryset = queryset.annotate(
+                email_verified=Exists(EmailAddress.objects.filter(user=OuterRef('pk'), verified=True))
+            )
+        return queryset
+
     def get_email_verified(self, user):
+        # the annotation, or, for a user that wasn't read through `filter_queryset`, a query
+        if hasattr(user, 'email_verified'):
+            return user.email_verified
         return EmailAddress.objects.filter(user=user, verified=True).exists()
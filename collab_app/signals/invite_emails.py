@@ -27,7 +27,7 @@ def email_on_invite_change(sender, instance, created, **kwargs):
             'key': invite.key,
             'inviter_name': f'{inviter.first_name} {inviter.last_name}',
             'organization_name': organization_name
-        })
+        }, using='emails')
         send_email(subject, body, settings.EMAIL_HOST_USER, [invite.email], fail_silently=False)
 
     # TODO: send emails on user acceptance?
@@ -65,5 +65,5 @@ def email_on_invite_change(sender, instance, created, **kwargs):
         body = render_to_string('emails/invites/canceled.html', {
             'inviter_name': f'{inviter.first_name} {inviter.last_name}',
             'organization_name': organization_name
-        })
+        }, using='emails')
         send_email(subject, body, settings.EMAIL_HOST_USER, [invite.email], fail_silently=False)
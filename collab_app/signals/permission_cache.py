@@ -0,0 +1,32 @@
+from django.apps import apps
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from collab_app.permissions import cache as permission_cache
+
+
+"""
+Invalidate the cached access of the users concerned when a membership changes, or a project is created or
+deleted (see `collab_app.permissions.cache`).
+
+Bulk `update()` and `delete()` on these models don't send signals: call `permission_cache.invalidate`
+yourself after them.
+"""
+
+
+@receiver(post_save, sender='collab_app.Membership')
+@receiver(post_delete, sender='collab_app.Membership')
+def invalidate_permission_cache_on_membership_change(sender, instance, **kwargs):
+    permission_cache.invalidate([instance.user_id])
+
+
+@receiver(post_save, sender='collab_app.Project')
+@receiver(post_delete, sender='collab_app.Project')
+def invalidate_permission_cache_on_project_change(sender, instance, created=True, **kwargs):
+    # a project never changes organization, so only creating or deleting one changes anyone's access
+    if created:
+        Membership = apps.get_model('collab_app', 'Membership')
+        # evaluated by `invalidate` only when the cache is on
+        permission_cache.invalidate(
+            Membership.objects.filter(organization_id=instance.organization_id).values_list('user_id', flat=True)
+        )
@@ -1,15 +1,17 @@
+from django.apps import apps
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 
-from collab_app.tasks import (
-    notify_participants_of_task,
-    notify_participants_of_task_comment,
-    notify_participants_of_assignee_change
+from collab_app.notifications import (
+    enqueue_notification
 )
 
 
 """
 Notify participants of task when a task or task comment is created.
+
+The notification is written to the outbox in the same transaction as the change.
+The `dispatch_notification_outbox` task sends it.
 """
 
 
@@ -17,14 +19,16 @@ Notify participants of task when a task or task comment is created.
 def notify_on_task_create(sender, instance, created, **kwargs):
     task_id = instance.id  # readability
     if created:
-        notify_participants_of_task.delay_on_commit(task_id)
+        NotificationOutbox = apps.get_model('collab_app', 'NotificationOutbox')
+        enqueue_notification(NotificationOutbox.EventType.TASK_CREATED, task_id=task_id)
 
 
 @receiver(post_save, sender='collab_app.TaskComment')
 def notify_on_task_comment_create(sender, instance, created, **kwargs):
     task_comment_id = instance.id  # readability
     if created:
-        notify_participants_of_task_comment.delay_on_commit(task_comment_id)
+        NotificationOutbox = apps.get_model('collab_app', 'NotificationOutbox')
+        enqueue_notification(NotificationOutbox.EventType.TASK_COMMENT_CREATED, task_comment_id=task_comment_id)
 
 
 @receiver(post_save, sender='collab_app.Task')
@@ -35,4 +39,5 @@ def notify_on_task_assignment_change(sender, instance, created, **kwargs):
         original_assignee_id, new_assignee_id = assignee_diff
         if new_assignee_id is not None:
             # TODO: notify original_assignee (if there was one) that they are unassigned??
-            notify_participants_of_assignee_change.delay_on_commit(task_id)
+            NotificationOutbox = apps.get_model('collab_app', 'NotificationOutbox')
+            enqueue_notification(NotificationOutbox.EventType.ASSIGNEE_CHANGED, task_id=task_id)
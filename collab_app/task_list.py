@@ -0,0 +1,193 @@
+import operator
+import types
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from dynamic_rest.conf import settings as dynamic_rest_settings
+from dynamic_rest.fields import DynamicMethodField, DynamicRelationField
+from dynamic_rest.routers import DynamicRouter
+from rest_framework import serializers
+from rest_framework.response import Response
+
+
+"""
+A fast path for the task list of a board, `GET /api/tasks?filter{project}=<id>`. Optional: it is on when
+TASK_LIST_FAST_PATH is set.
+
+`TaskSerializer` builds a model instance, and runs dynamic-rest's per-field machinery, for every task. The fast
+path reads the same permission-filtered queryset with `values()`, and builds the same JSON from each row with a
+projection compiled once per request from the fields the serializer would render (see `TaskListProjection`).
+
+It only serves the requests it knows the whole shape of: `filter{project}`, `page` and `per_page`, and
+`include[]` / `exclude[]` of the task's own fields (the ids of its relations, the display names). Anything else,
+like sideloads (`include[]=creator.*`), sorting or other filters, goes through the serializer.
+"""
+
+PROJECT_FILTER = 'filter{project}'
+INCLUDE_PARAMS = ('include[]', 'exclude[]')
+PARAMS = {PROJECT_FILTER, 'page', 'per_page'} | set(INCLUDE_PARAMS)
+
+# serializer fields whose `to_representation` returns what the database returns for them
+PASSTHROUGH_FIELDS = (serializers.BooleanField, serializers.CharField, serializers.IntegerField)
+
+
+class UnsupportedField(Exception):
+    pass
+
+
+def applies_to(view):
+    query_params = view.request.query_params
+    if not settings.TASK_LIST_FAST_PATH or set(query_params) - PARAMS:
+        return False
+    if len(query_params.getlist(PROJECT_FILTER)) != 1 or not query_params[PROJECT_FILTER].isdigit():
+        return False
+    return all(
+        field in view.serializer_class.Meta.fields
+        for param in INCLUDE_PARAMS
+        for field in query_params.getlist(param)
+    )
+
+
+def list_tasks(view):
+    """
+    The response of `view.list()` for a request `applies_to` accepted, or None if the serializer renders a field
+    the projection can't.
+    """
+    serializer = view.get_serializer()
+    try:
+        projection = TaskListProjection(serializer)
+    except UnsupportedField:
+        return None
+
+    # the queryset `list()` serializes: the permission filters, then the serializer's (and its annotations)
+    queryset = view.get_queryset().filter(project_id=int(view.request.query_params[PROJECT_FILTER]))
+    queryset = serializer.filter_queryset(queryset)
+    rows = queryset.values(*projection.columns, *queryset.query.annotations)
+
+    page = view.paginate_queryset(rows)
+    data = {serializer.get_plural_name(): projection.render(list(rows) if page is None else page)}
+    return Response(data) if page is None else view.get_paginated_response(data)
+
+
+class TaskListProjection(object):
+    """
+    The columns to read, and how to render a row, for each field `serializer` renders, in its order:
+
+    * model fields are read as columns, and converted with the field's `to_representation` unless it's one of
+      PASSTHROUGH_FIELDS,
+    * the ids of foreign keys are read as columns, and those of reverse relations with one query per relation
+      for the whole page, through the related serializer's `filter_queryset` like a prefetch,
+    * method fields are called with the row as an object, which holds the queryset's annotations and the model
+      fields the method field `requires`,
+    * and the `links` of the relations that aren't rendered are added like dynamic-rest does.
+
+    Raises UnsupportedField for any other field.
+    """
+
+    def __init__(self, serializer):
+        self.model = serializer.Meta.model
+        self.columns = {'id'}
+        # [(field name, function of the row)]
+        self.getters = []
+        # [(field name, related model field, related serializer, many)]
+        self.reverse_relations = []
+        # {field name: {task id: value}}, filled for each page in `render`
+        self.related = {}
+
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            elif isinstance(field, DynamicRelationField):
+                self.add_relation(name, field)
+            elif isinstance(field, DynamicMethodField):
+                self.add_method(name, serializer, field)
+            else:
+                self.add_column(name, field)
+
+        self.link_names, self.links_path = [], None
+        if dynamic_rest_settings.ENABLE_LINKS:
+            for name, field in serializer.get_link_fields().items():
+                if getattr(field, 'link', None) is not None:
+                    raise UnsupportedField(name)
+                self.link_names.append(name)
+            if dynamic_rest_settings.ENABLE_HOST_RELATIVE_LINKS:
+                self.links_path = DynamicRouter.get_canonical_path(serializer.get_resource_key())
+
+    def model_field(self, source):
+        try:
+            return self.model._meta.get_field(source)
+        except FieldDoesNotExist:
+            raise UnsupportedField(source)
+
+    def add_column(self, name, field):
+        model_field = self.model_field(field.source)
+        if not model_field.concrete or model_field.is_relation:
+            raise UnsupportedField(name)
+        self.columns.add(model_field.attname)
+        if type(field) in PASSTHROUGH_FIELDS:
+            self.getters.append((name, operator.itemgetter(model_field.attname)))
+        else:
+            self.getters.append((name, lambda row, column=model_field.attname, field=field: (
+                None if row[column] is None else field.to_representation(row[column])
+            )))
+
+    def add_relation(self, name, field):
+        # sideloaded or embedded relations render the related serializer
+        if not field.serializer.id_only():
+            raise UnsupportedField(name)
+        model_field = self.model_field(field.source)
+        if model_field.many_to_one:
+            self.columns.add(model_field.attname)
+            self.getters.append((name, operator.itemgetter(model_field.attname)))
+        elif model_field.one_to_many or (model_field.one_to_one and not model_field.concrete):
+            related_serializer = field.serializer.child if field.many else field.serializer
+            self.reverse_relations.append((name, model_field, related_serializer, field.many))
+            self.getters.append((name, lambda row, name=name, default=[] if field.many else None: (
+                self.related[name].get(row['id'], default)
+            )))
+        else:
+            raise UnsupportedField(name)
+
+    def add_method(self, name, serializer, field):
+        # without `requires`, the method can read anything of the task
+        requires = getattr(field, 'requires', None)
+        if not requires:
+            raise UnsupportedField(name)
+        for source in requires:
+            model_field = self.model_field(source)
+            if not model_field.concrete or model_field.is_relation:
+                raise UnsupportedField(name)
+            self.columns.add(model_field.attname)
+        method = getattr(serializer, field.method_name)
+        self.getters.append((name, lambda row: method(types.SimpleNamespace(**row))))
+
+    def load_reverse_relations(self, task_ids):
+        for name, model_field, related_serializer, many in self.reverse_relations:
+            # e.g. TaskComment.task_id
+            column = model_field.field.attname
+            queryset = related_serializer.filter_queryset(
+                model_field.related_model.objects.filter(**{f'{column}__in': task_ids})
+            )
+            related = self.related[name] = {}
+            for task_id, related_id in queryset.values_list(column, 'id'):
+                if many:
+                    related.setdefault(task_id, []).append(related_id)
+                else:
+                    related[task_id] = related_id
+
+    def render(self, rows):
+        if self.reverse_relations:
+            self.load_reverse_relations([row['id'] for row in rows])
+        data = []
+        for row in rows:
+            task = {name: get(row) for name, get in self.getters}
+            links = {
+                name: f'{self.links_path}/{row["id"]}/{name}/' if self.links_path else f'{name}/'
+                for name in self.link_names
+                # like dynamic-rest, no link to a rendered relation without data
+                if name not in task or task[name]
+            }
+            if links:
+                task['links'] = links
+            data.append(task)
+        return data
@@ -1,4 +1,5 @@
 import base64
+import datetime
 import os
 import logging
 import re
@@ -6,22 +7,27 @@ import re
 import boto3
 from celery import shared_task
 from django.conf import settings
-from django.template.loader import render_to_string
+from django.db import transaction
+from django.utils import timezone
 from django.utils.crypto import get_random_string
 from playwright import sync_playwright
 from sentry_sdk import capture_exception
 
 from collab_app.models import (
+    IdempotencyKey,
+    NotificationOutbox,
     Task,
     TaskColumn,
-    TaskComment,
     TaskDataUrl,
     TaskHtml,
-    User
 )
-from collab_app.utils import (
-    send_email
+from collab_app.notifications import (
+    dispatch_outbox_batch,
+    enqueue_notification,
+    record_failed_messages,
+    send_messages,
 )
+from collab_app.ranking import evenly_spaced_ranks
 
 logger = logging.getLogger('collabsauce')
 
@@ -190,183 +196,90 @@ def upload_screenshots(task, file_key, window_screenshot_filepath, element_scree
     task.save()
 
 
+# Deprecated: notifications go through the outbox (see `collab_app.notifications`). These only forward
+# messages queued before the outbox was deployed to it, and will be removed in the next release.
 @shared_task
 def notify_participants_of_task(task_id):
-    task = Task.objects.get(id=task_id)
-    if task.creator:
-        task_creator_name = f'{task.creator.first_name} {task.creator.last_name}'
-    else:
-        task_creator_name = task.one_off_email_set_by
-    project_id = task.project.id
-
-    already_mentioned = set()
-
-    # Notify the person assigned on the task (if applicable)
-    assignee = task.assigned_to
-    if assignee:
-        try:
-            subject = f'{task_creator_name} has assigned you a task.'
-            body = render_to_string('emails/tasks/task-assigned.html', {
-                'task_creator_name': task_creator_name,
-                'task_url': f'projects/{project_id}/tasks/{task_id}'
-            })
-            send_email(subject, body, settings.EMAIL_HOST_USER, [assignee.email], fail_silently=False)
-            already_mentioned.add(assignee)
-        except Exception as err:
-            logger.info('Error while notifying assignee on task create')
-            capture_exception(err)
-            logger.info(err)
-
-    # match the id from `@@@__<ID HERE>^^^Some Name@@@^^^`
-
-    # Notify the people mentioned on the comment.
-    regex = r'@@@__(\d+)\^\^\^'
-    matches = re.findall(regex, task.title)
-    for user_id in matches:
-        try:
-            mentioned = User.objects.get(id=user_id)
-            if mentioned not in already_mentioned:
-                subject = f'{task_creator_name} has mentioned you on a task.'
-                body = render_to_string('emails/tasks/task-mention.html', {
-                    'task_creator_name': task_creator_name,
-                    'task_url': f'projects/{project_id}/tasks/{task_id}'
-                })
-                send_email(subject, body, settings.EMAIL_HOST_USER, [mentioned.email], fail_silently=False)
-                already_mentioned.add(mentioned)
-        except Exception as err:
-            logger.info('Error while notifying on task create')
-            capture_exception(err)
-            logger.info(err)
+    enqueue_notification(NotificationOutbox.EventType.TASK_CREATED, task_id=task_id)
 
 
 @shared_task
 def notify_participants_of_task_comment(task_comment_id):
-    task_comment = TaskComment.objects.get(id=task_comment_id)
-    task = task_comment.task
-    task_comment_creator = task_comment.creator
-    taskcomment_creator_name = f'{task_comment_creator.first_name} {task_comment_creator.last_name}'
-    project_id = task.project.id
-
-    already_mentioned = set([task_comment_creator])
-
-    # match the id from `@@@__<ID HERE>^^^Some Name@@@^^^`
-
-    # Notify the people mentioned on the comment.
-    regex = r'@@@__(\d+)\^\^\^'
-    matches = re.findall(regex, task_comment.text)
-    for user_id in matches:
-        try:
-            mentioned = User.objects.get(id=user_id)
-            subject = f'{taskcomment_creator_name} has mentioned you on a task.'
-            body = render_to_string('emails/tasks/taskcomment-mention.html', {
-                'taskcomment_creator_name': taskcomment_creator_name,
-                'task_url': f'projects/{project_id}/tasks/{task.id}'
-            })
-            send_email(subject, body, settings.EMAIL_HOST_USER, [mentioned.email], fail_silently=False)
-            already_mentioned.add(mentioned)
-        except Exception as err:
-            logger.info('Error while notifying on task comment create')
-            capture_exception(err)
-            logger.info(err)
-
-    # notify the task creator and task.assigned_to . If they are the same person, logic below already handles duplicates
-    users_to_notify = [task.creator, task.assigned_to]
-
-    # Now notify everyone who is 'participating' on the task chain
-    for comment in task.task_comments.all():
-        users_to_notify.append(comment.creator)  # notify the task-comment creator
-        matches = re.findall(regex, comment.text)
-        for user_id in matches:
-            mentioned = User.objects.get(id=user_id)
-            users_to_notify.append(mentioned)  # notify anyone who has been previously mentioned on a task
-
-    # check the task.title too
-    matches = re.findall(regex, task.title)
-    for user_id in matches:
-        mentioned = User.objects.get(id=user_id)
-        users_to_notify.append(mentioned)  # notify anyone who has been mentioned on the task title
-
-    for user in users_to_notify:
-        if user and user not in already_mentioned:
-            try:
-                subject = f'{taskcomment_creator_name} has commented on a task you are participating on.'
-                body = render_to_string('emails/tasks/taskcomment-participating.html', {
-                    'taskcomment_creator_name': taskcomment_creator_name,
-                    'task_url': f'projects/{project_id}/tasks/{task.id}'
-                })
-                send_email(subject, body, settings.EMAIL_HOST_USER, [user.email], fail_silently=False)
-                already_mentioned.add(user)
-            except Exception as err:
-                logger.info('Error while notifying on task comment notify all create')
-                capture_exception(err)
-                logger.info(err)
+    enqueue_notification(NotificationOutbox.EventType.TASK_COMMENT_CREATED, task_comment_id=task_comment_id)
 
 
 @shared_task
 def notify_participants_of_assignee_change(task_id):
-    # TODO: notify original_assignee (if there was one) that they are unassigned??
-    task = Task.objects.get(id=task_id)
-
-    assignee = task.assigned_to
-    try:
-        subject = 'You have been assigned a task!'
-        body = render_to_string('emails/tasks/task-assigned-changed.html', {
-            'task_url': f'projects/{task.project.id}/tasks/{task_id}'
-        })
-        send_email(subject, body, settings.EMAIL_HOST_USER, [assignee.email], fail_silently=False)
-    except Exception as err:
-        logger.info('Error while notifying assignee on task update')
-        capture_exception(err)
-        logger.info(err)
+    enqueue_notification(NotificationOutbox.EventType.ASSIGNEE_CHANGED, task_id=task_id)
 
 
 @shared_task
 def notify_participants_of_task_column_change(task_id, prev_task_column_id, new_task_column_id, mover_id):
-    task = Task.objects.get(id=task_id)
-    prev_task_column = TaskColumn.objects.get(id=prev_task_column_id)
-    new_task_column = TaskColumn.objects.get(id=new_task_column_id)
-    mover = User.objects.get(id=mover_id)
-    mover_full_name = f'{mover.first_name} {mover.last_name}'
-    project_id = task.project.id
-
-    # notify the task creator and task.assigned_to.
-    # If they are the same person, or if that was the mover, logic below already handles duplicates
-    users_to_notify = [task.creator, task.assigned_to]
-
-    # Now notify everyone who is 'participating' on the task chain
-    regex = r'@@@__(\d+)\^\^\^'
-    for comment in task.task_comments.all():
-        users_to_notify.append(comment.creator)  # notify the task-comment creator
-        matches = re.findall(regex, comment.text)
-        for user_id in matches:
-            mentioned = User.objects.get(id=user_id)
-            users_to_notify.append(mentioned)  # notify anyone who has been previously mentioned on a task
-
-    # check the task.title too
-    matches = re.findall(regex, task.title)
-    for user_id in matches:
-        mentioned = User.objects.get(id=user_id)
-        users_to_notify.append(mentioned)  # notify anyone who has been mentioned on the task title
-
-    already_mentioned = set([mover])
-
-    for user in users_to_notify:
-        if user and user not in already_mentioned:
-            try:
-                subject = (
-                    f'{mover_full_name} has moved task # {task.task_number} '
-                    f'from `{prev_task_column.name}` to `{new_task_column.name}`.'
-                )
-                body = render_to_string('emails/tasks/task-moved-column.html', {
-                    'mover_full_name': mover_full_name,
-                    'task_number': task.task_number,
-                    'prev_task_column_name': prev_task_column.name,
-                    'new_task_column_name': new_task_column.name,
-                    'task_url': f'projects/{project_id}/tasks/{task.id}'
-                })
-                send_email(subject, body, settings.EMAIL_HOST_USER, [user.email], fail_silently=False)
-                already_mentioned.add(user)
-            except Exception as err:
-                logger.info('Error while notifying on task move notify all')
-                capture_exception(err)
-                logger.info(err)
+    enqueue_notification(
+        NotificationOutbox.EventType.TASK_COLUMN_CHANGED,
+        task_id=task_id,
+        prev_task_column_id=prev_task_column_id,
+        new_task_column_id=new_task_column_id,
+        mover_id=mover_id
+    )
+
+
+@shared_task(bind=True, max_retries=settings.NOTIFICATION_CHUNK_MAX_RETRIES)
+def send_notification_email_chunk(self, messages):
+    # One chunk of a notification fan-out (see `fan_out_messages`).
+    # Only the messages that failed are retried, with an exponential backoff.
+    failed = send_messages(messages)
+    if not failed:
+        return
+    if self.request.retries >= self.max_retries:
+        record_failed_messages(failed)
+        return
+    raise self.retry(
+        args=([message for message, _ in failed],),
+        countdown=settings.NOTIFICATION_CHUNK_RETRY_DELAY * 2 ** self.request.retries
+    )
+
+
+@shared_task
+def dispatch_notification_outbox():
+    # drain the outbox one batch at a time until there is nothing left to claim.
+    while dispatch_outbox_batch():
+        pass
+
+
+@shared_task
+def rebalance_task_column(task_column_id):
+    # respace the ranks of a column once moves have made them too long. The order of the tasks is kept.
+    with transaction.atomic():
+        # lock the column first, like the board writes do (see `TaskColumn.lock_versions`). The order of the
+        # tasks doesn't change, so the column's version doesn't either.
+        list(TaskColumn.objects.select_for_update().filter(id=task_column_id).values_list('id'))
+        tasks = list(
+            Task.objects.select_for_update().filter(task_column_id=task_column_id).order_by('rank', 'id').only('id')
+        )
+        for task, rank in zip(tasks, evenly_spaced_ranks(len(tasks))):
+            task.rank = rank
+        Task.objects.bulk_update(tasks, ['rank'])
+
+
+@shared_task
+def purge_expired_idempotency_keys():
+    cutoff = timezone.now() - datetime.timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)
+    IdempotencyKey.objects.filter(created__lt=cutoff).delete()
+
+
+@shared_task
+def persist_widget_reports():
+    # create the tasks of queued widget reports one batch at a time until there is nothing left to claim.
+    from collab_app.widget import persist_widget_report_batch
+
+    while persist_widget_report_batch():
+        pass
+
+
+@shared_task
+def flush_board_order():
+    # write the board moves made in redis to postgres (see `collab_app.board`)
+    from collab_app import board
+
+    board.flush_board_order()
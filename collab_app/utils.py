@@ -1,5 +1,5 @@
 from django.core.mail.message import EmailMultiAlternatives
-from django.db import IntegrityError
+from django.db import IntegrityError, connection
 from django.db.utils import DataError
 from django.shortcuts import _get_queryset
 from django.utils.html import strip_tags
@@ -23,6 +23,43 @@ def get_object_or_none(klass, *args, **kwargs):
         return None
 
 
+def update_from_values(model, fields, rows):
+    """
+    Update many rows of `model` with a single `UPDATE ... FROM (VALUES ...)` statement.
+    `rows` are tuples of the primary key followed by the new values of `fields`.
+    Unlike `bulk_update`, the statement doesn't need a CASE expression per field. Other databases than
+    postgres fall back to `bulk_update`.
+    """
+    if not rows:
+        return 0
+    if connection.vendor != 'postgresql':
+        objs = [model(pk=row[0], **dict(zip(fields, row[1:]))) for row in rows]
+        return model.objects.bulk_update(objs, fields) or len(rows)
+
+    qn = connection.ops.quote_name
+    table = qn(model._meta.db_table)
+    pk = model._meta.pk
+    model_fields = [pk] + [model._meta.get_field(name) for name in fields]
+    # cast the values so postgres doesn't have to guess the column types. The pk is cast to the type a
+    # foreign key to it would have (`integer`, not `serial`).
+    db_types = [pk.rel_db_type(connection)] + [field.db_type(connection) for field in model_fields[1:]]
+    row_sql = '(' + ', '.join(f'%s::{db_type}' for db_type in db_types) + ')'
+    columns = ', '.join(qn(field.column) for field in model_fields)
+    assignments = ', '.join(f'{qn(field.column)} = v.{qn(field.column)}' for field in model_fields[1:])
+    params = [
+        field.get_db_prep_value(value, connection)
+        for row in rows
+        for field, value in zip(model_fields, row)
+    ]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'UPDATE {table} SET {assignments} FROM (VALUES {", ".join([row_sql] * len(rows))}) AS v ({columns}) '
+            f'WHERE {table}.{qn(pk.column)} = v.{qn(pk.column)}',
+            params
+        )
+        return cursor.rowcount
+
+
 def catch_failures(func):
     def wrapper(*args, **kwargs):
         try:
@@ -1,7 +1,17 @@
+from collections import defaultdict
+
+import logging
+
+import redis
 from allauth.account.models import EmailAddress
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
 from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
 from django.utils.crypto import get_random_string
 from dynamic_rest.viewsets import DynamicModelViewSet
+from sentry_sdk import capture_exception
 from rest_framework.decorators import action
 from rest_framework import exceptions
 from rest_framework.permissions import (
@@ -10,6 +20,11 @@ from rest_framework.permissions import (
 )
 from rest_framework.response import Response
 
+from collab_app import board, task_list
+from collab_app.filters import LookupFilterBackend, LookupSortingFilter
+from collab_app.idempotency import (
+    idempotent,
+)
 from collab_app.mixins.api import (
     ReadOnlyMixin,
     NoCreateMixin,
@@ -21,19 +36,27 @@ from collab_app.mixins.api import (
 from collab_app.models import (
     Invite,
     Membership,
+    NotificationOutbox,
     Organization,
     Profile,
     Project,
     Task,
     TaskColumn,
     TaskComment,
-    TaskDataUrl,
-    TaskHtml,
     TaskMetadata,
     User,
+    WidgetReport,
+)
+from collab_app.notifications import (
+    enqueue_notification,
 )
 from collab_app.permissions import (
     GateKeeper,
+    get_organization_access,
+)
+from collab_app.ranking import (
+    rank_between,
+    rerank,
 )
 from collab_app.serializers import (
     InviteSerializer,
@@ -48,14 +71,26 @@ from collab_app.serializers import (
     UserSerializer,
 )
 from collab_app.tasks import (
-    create_screenshots_for_task,
-    notify_participants_of_task_column_change,
-    upload_chrome_extension_screenshots_for_task,
+    rebalance_task_column,
+)
+from collab_app.utils import (
+    update_from_values,
 )
+from collab_app.widget import (
+    create_widget_tasks,
+    queue_widget_report,
+)
+
+
+logger = logging.getLogger('collabsauce')
+
+# the deferred fields of a task that was just created (see `TaskViewSet._new_task_data`)
+NEW_TASK_FIELDS = tuple(field for field in TaskSerializer.Meta.deferred_fields if field != 'task_comments')
+NEW_TASK_FIELDS_WITHOUT_METADATA = tuple(field for field in NEW_TASK_FIELDS if field != 'task_metadata')
 
 
 class ApiViewSet(GateKeeper, AddCreatorMixin, SaveMixin, DynamicModelViewSet):
-    pass
+    filter_backends = (LookupFilterBackend, LookupSortingFilter)
 
 
 class InviteViewSet(ReadOnlyMixin, ApiViewSet):
@@ -252,223 +287,421 @@ class TaskViewSet(ReadOnlyMixin, ApiViewSet):
     # permission_classes = []
     # authentication_classes = []
 
+    def list(self, request, *args, **kwargs):
+        # board lists skip the serializer when the fast path is on (see `collab_app.task_list`)
+        if task_list.applies_to(self):
+            response = task_list.list_tasks(self)
+            if response is not None:
+                return response
+        return super(TaskViewSet, self).list(request, *args, **kwargs)
+
     @action(detail=False, methods=['post'])
+    @transaction.atomic
     def create_task(self, request, *args, **kwargs):
         project_id = request.data['project']
         task_column_id = request.data['task_column']
 
         # make sure user has access to this project
-        if not Project.objects.filter(
-            id=project_id,
-            organization__memberships__user=request.user
-        ).exists():
+        organization_id = get_organization_access(request).projects.get(int(project_id))
+        if organization_id is None:
             raise exceptions.ValidationError(
                 'You do not have access to this project.'
             )
 
         # make sure the task column is part of the project
-        if not TaskColumn.objects.filter(project_id=project_id, id=task_column_id):
+        if int(task_column_id) not in TaskColumn.project_task_column_ids(int(project_id)):
             raise exceptions.ValidationError(
                 'Invalid task column.'
             )
 
-        next_number = Task.objects.filter(project_id=project_id).count() + 1
-        last_task_in_column = Task.objects.filter(
-            project_id=project_id,
-            task_column_id=task_column_id
-        ).order_by('-order').first()
+        board.sync_columns([task_column_id])
+        next_number = Project.next_task_number(project_id)
+        column_end = Task.objects.filter(task_column_id=task_column_id).aggregate(Max('order'), Max('rank'))
         task = Task.objects.create(
             title=request.data['title'],
             target_dom_path=request.data['target_dom_path'],
-            order=last_task_in_column.order + 1 if last_task_in_column else 1,
+            order=(column_end['order__max'] or 0) + 1,
+            rank=rank_between(column_end['rank__max'], None),
             project_id=project_id,
+            organization_id=organization_id,
             task_column_id=task_column_id,
             creator=request.user,
             task_number=next_number
         )
+        if len(task.rank) > settings.TASK_RANK_MAX_LENGTH:
+            rebalance_task_column.delay_on_commit(task_column_id)
 
         return Response({
-            'task': TaskSerializer(
-                task,
-                include_fields=TaskSerializer.Meta.deferred_fields).data
+            'task': self._new_task_data([task], with_task_metadata=False)[0]
             },
             status=201
         )
 
+    def _get_task_column_versions(self, data):
+        # {task column id: version} the client loaded the board with. Columns left out aren't checked.
+        try:
+            return {
+                int(task_column_id): int(version)
+                for task_column_id, version in (data.get('task_column_versions') or {}).items()
+            }
+        except (AttributeError, TypeError, ValueError):
+            raise exceptions.ValidationError('Invalid task column versions.')
+
+    def _get_stale_task_column_ids(self, versions, expected_versions):
+        return sorted(
+            task_column_id for task_column_id, version in expected_versions.items()
+            if task_column_id in versions and versions[task_column_id] != version
+        )
+
+    def _stale_board_response(self, stale_task_column_ids, versions):
+        # someone else changed these columns since the client loaded them. Send their current state, so
+        # the client can redraw them and try again.
+        return Response({
+            'detail': 'This board has changed. Please refresh and try again.',
+            'task_columns': [
+                {'id': task_column_id, 'version': versions[task_column_id]}
+                for task_column_id in stale_task_column_ids
+            ],
+            'tasks': list(
+                Task.objects.filter(
+                    task_column_id__in=stale_task_column_ids
+                ).order_by('task_column_id', 'rank', 'id').values('id', 'order', 'rank', 'task_column')
+            )
+            },
+            status=409
+        )
+
+    def _sync_task_columns(self, versions):
+        # write the moves made in redis to the locked columns first (see `collab_app.board`). They count as
+        # changes of their columns, so a client that loaded the board before them gets a 409.
+        for task_column_id in board.sync_columns(versions.keys()):
+            versions[task_column_id] += 1
+
+    def _bump_task_column_versions(self, versions, task_column_ids):
+        # returns the new versions, for the response
+        TaskColumn.bump_versions(task_column_ids)
+        for task_column_id in task_column_ids:
+            versions[task_column_id] += 1
+        return [
+            {'id': task_column_id, 'version': versions[task_column_id]}
+            for task_column_id in sorted(task_column_ids)
+        ]
+
     @action(detail=False, methods=['post'])
+    @transaction.atomic
     def reorder_tasks(self, request, *args, **kwargs):
-        task_data = request.data
+        # The client sends back the whole column(s) it changed. Only the tasks whose order, column or
+        # rank actually change are written, in one statement, and only those are sent back.
+        # The body is either the list of tasks, or {'tasks': [...], 'task_column_versions': {id: version}}.
+        # Sending the versions makes the request fail with a 409 if another write got there first.
+        if isinstance(request.data, list):
+            task_data, expected_versions = request.data, {}
+        else:
+            task_data = request.data.get('tasks') or []
+            expected_versions = self._get_task_column_versions(request.data)
+        if not task_data:
+            raise exceptions.ValidationError('Moving card invalid. Please contact support')
         task_ids = [task['id'] for task in task_data]
+        try:
+            project_id = int(task_data[0]['project'])
+        except (KeyError, TypeError, ValueError):
+            raise exceptions.ValidationError('Moving card invalid. Please contact support')
 
-        # TODO: check task_column field is valid too
+        # make sure the user has access to the project before reading or locking anything of it
+        if get_organization_access(request).projects.get(project_id) is None:
+            raise exceptions.ValidationError('You do not have access to this project.')
 
-        # get the specified tasks. make sure they belong to the correct specified project
-        # and that the user has access to those tasks.
-        tasks = Task.objects.filter(
-            id__in=task_ids,
-            project_id=task_data[0]['project'],
-            project__organization__memberships__user=request.user
+        # get the specified tasks, and make sure they belong to the project. Their columns are read again
+        # once they are locked.
+        prev_task_column_ids = set(
+            Task.objects.filter(id__in=task_ids, project_id=project_id).values_list('task_column_id', flat=True)
         )
 
-        if len(tasks) != len(task_ids):
+        # lock every column the request touches (the ones the tasks move to, the ones they come from and the
+        # ones the client sent versions for) in one call, so the locks are taken in one global id order.
+        # Every column must belong to the project.
+        task_column_ids = {json_task['task_column'] for json_task in task_data}
+        locked_task_column_ids = task_column_ids | prev_task_column_ids | expected_versions.keys()
+        versions = TaskColumn.lock_versions(locked_task_column_ids, project_id)
+        if versions.keys() != locked_task_column_ids:
             raise exceptions.ValidationError('Moving card invalid. Please contact support')
+        self._sync_task_columns(versions)
+
+        current = {
+            task_id: (order, task_column_id, rank)
+            for task_id, order, task_column_id, rank in Task.objects.filter(
+                id__in=task_ids,
+                project_id=project_id
+            ).values_list('id', 'order', 'task_column_id', 'rank')
+        }
+        if len(current) != len(task_ids):
+            raise exceptions.ValidationError('Moving card invalid. Please contact support')
+        if any(task_column_id not in versions for _, task_column_id, _ in current.values()):
+            # a task moved to another column between the read and the locks
+            raise exceptions.ValidationError('This board has changed. Please refresh and try again.')
+
+        stale_task_column_ids = self._get_stale_task_column_ids(versions, expected_versions)
+        if stale_task_column_ids:
+            return self._stale_board_response(stale_task_column_ids, versions)
 
-        # create task map
-        task_map = {}
+        # give new ranks to as few tasks as possible so every column sorts in the submitted order
+        new_ranks = {}
+        tasks_by_column = defaultdict(list)
         for json_task in task_data:
-            task_map[json_task['id']] = json_task
+            tasks_by_column[json_task['task_column']].append(json_task)
+        for column_tasks in tasks_by_column.values():
+            column_tasks.sort(key=lambda json_task: (json_task['order'], json_task['id']))
+            ranks = rerank([current[json_task['id']][2] for json_task in column_tasks])
+            for position, rank in ranks.items():
+                new_ranks[column_tasks[position]['id']] = rank
 
         # there should only be one task that changed columns.
         # but just incase, make it a list
         tasks_that_changed_columns = []
-
-        # now for each django-task, update order and task column
-        for task in tasks:
-            json_task = task_map[task.id]
-            task.order = json_task['order']
-            prev_task_column_id = task.task_column_id
-            new_task_column_id = json_task['task_column']
+        now = timezone.now()
+        changed_rows = []
+        for json_task in task_data:
+            task_id = json_task['id']
+            prev_order, prev_task_column_id, prev_rank = current[task_id]
+            order, new_task_column_id = json_task['order'], json_task['task_column']
+            rank = new_ranks.get(task_id, prev_rank)
+            if (order, new_task_column_id, rank) == (prev_order, prev_task_column_id, prev_rank):
+                continue
+            changed_rows.append((task_id, order, rank, new_task_column_id, now))
             if prev_task_column_id != new_task_column_id:
-                task.task_column_id = new_task_column_id
                 tasks_that_changed_columns.append({
-                    'task_id': task.id,
+                    'task_id': task_id,
                     'prev_task_column_id': prev_task_column_id,
                     'new_task_column_id': new_task_column_id
                 })
 
-        Task.objects.bulk_update(tasks, ['order', 'task_column'])
+        # write the rows in primary key order, so concurrent writers lock them in the same order
+        changed_rows.sort()
+        update_from_values(Task, ['order', 'rank', 'task_column_id', 'updated'], changed_rows)
+
+        task_column_versions = self._bump_task_column_versions(
+            versions,
+            {row[3] for row in changed_rows} | {current[row[0]][1] for row in changed_rows}
+        )
+
+        for task_column_id in {row[3] for row in changed_rows if len(row[2]) > settings.TASK_RANK_MAX_LENGTH}:
+            rebalance_task_column.delay_on_commit(task_column_id)
 
         # now, for each task that changed columns, notify particpanta
         # As mentioned above, there should only be one task changed,
         # but just incase, loop through the list.
-        # Also note: we can't do this in a signal because of the `bulk_update`.
+        # Also note: we can't do this in a signal because of the raw update.
         for moved_task_data in tasks_that_changed_columns:
-            notify_participants_of_task_column_change.delay_on_commit(
-                moved_task_data['task_id'],
-                moved_task_data['prev_task_column_id'],
-                moved_task_data['new_task_column_id'],
-                request.user.id
+            enqueue_notification(
+                NotificationOutbox.EventType.TASK_COLUMN_CHANGED,
+                task_id=moved_task_data['task_id'],
+                prev_task_column_id=moved_task_data['prev_task_column_id'],
+                new_task_column_id=moved_task_data['new_task_column_id'],
+                mover_id=request.user.id
             )
 
         return Response({
-            'tasks': TaskSerializer(
-                tasks,
-                many=True,
-                include_fields=TaskSerializer.Meta.deferred_fields).data
+            'tasks': [
+                {'id': task_id, 'order': order, 'rank': rank, 'task_column': task_column_id}
+                for task_id, order, rank, task_column_id, _ in changed_rows
+            ],
+            'task_columns': task_column_versions
             },
             status=200
         )
 
-    def _widget_create_task(self, request, *args, **kwargs):
-        # NOTE: `is_authed` means the user is authenticated and has access to the project.
-        # If they don't, the `creator` will be None and we will set the `one_off_email_set_by` field.
-
-        task_request_data = request.data.get('task')
-        task_metadata_request_data = request.data.get('task_metadata')
-        html = request.data.get('html', None)
-        data_url = request.data.get('data_url', None)
-        element_data_url = request.data.get('element_data_url', None)
-
-        is_authed = request.user.is_authenticated and task_request_data.get('project')
-
-        # if the user is_authed, then they will have access to the project.
-        # But if they are sending this method as non-authed, then they will only
-        # send the `project_key`. We need to get the project_id based off this key.
-        project_id = task_request_data.get('project')
-        if not project_id:
-            project_key = task_request_data.get('project_key')
-            project = Project.objects.filter(key=project_key).first()
-            if not project:
-                raise exceptions.ValidationError(
-                    'The project key is not implemented correctly on this website.'
-                )
-            else:
-                project_id = project.id
-
-        # make sure user has access to this project (if `is_authed`)
-        if is_authed:
-            if not Project.objects.filter(
-                id=project_id,
-                organization__memberships__user=request.user
-            ).exists():
-                raise exceptions.ValidationError(
-                    'You do not have access to this project.'
-                )
+    @action(detail=False, methods=['get'])
+    def board_order(self, request, *args, **kwargs):
+        # The ids of a project's tasks, per column, in board order. Read from redis when the live board
+        # order is on (see `collab_app.board`).
+        project_id = request.query_params.get('project')
+        task_column_ids = list(
+            TaskColumn.objects.filter(
+                project_id=project_id,
+                project__organization__memberships__user=request.user
+            ).order_by('order', 'id').values_list('id', flat=True)
+        ) if project_id and project_id.isdigit() else []
+        if not task_column_ids:
+            raise exceptions.ValidationError(
+                'You do not have access to this project.'
+            )
 
-        assigned_to_id = task_request_data.get('assigned_to', None)
-        if assigned_to_id:
-            # make sure the assignee is part of this user's organization
-            if not Membership.objects.filter(
-                user_id=assigned_to_id,
-                organization__memberships__user=request.user
-            ).exists():
-                raise exceptions.ValidationError(
-                    'This member does not belong to your organization.'
-                )
+        board_order = board.get_board_order(task_column_ids)
+        return Response({
+            'task_columns': [
+                {'id': task_column_id, 'task_ids': board_order[task_column_id]}
+                for task_column_id in task_column_ids
+            ]
+            },
+            status=200
+        )
 
-        task_column = TaskColumn.objects.get(project_id=project_id, name=TaskColumn.TASK_COLUMN_RAW_TASK)
-        next_number = Task.objects.filter(project_id=project_id).count() + 1
-        last_task_in_column = Task.objects.filter(
-            project_id=project_id,
-            task_column=task_column
-        ).order_by('-order').first()
-        task = Task.objects.create(
-            title=task_request_data.get('title'),
-            target_dom_path=task_request_data.get('target_dom_path'),
-            design_edits=task_request_data.get('design_edits'),
-            text_copy_changes=task_request_data.get('text_copy_changes'),
-            has_text_copy_changes=task_request_data.get('has_text_copy_changes'),
-            has_target=task_request_data.get('has_target'),
-            order=last_task_in_column.order + 1 if last_task_in_column else 1,
-            project_id=project_id,
-            task_column=task_column,
-            assigned_to_id=assigned_to_id,
-            creator=request.user if is_authed else None,
-            one_off_email_set_by=task_request_data.get('one_off_email_set_by'),
-            task_number=next_number
+    @action(detail=False, methods=['post'])
+    @transaction.atomic
+    def move_task(self, request, *args, **kwargs):
+        # Move a task between two neighbours. Only the moved task is written.
+        # `before_id` is the task right above the new position and `after_id` the task right below it.
+        # Leave either one out to move the task to the top or the bottom of the column.
+        task_id = request.data['task_id']
+        task_column_id = request.data['task_column_id']
+        before_id = request.data.get('before_id')
+        after_id = request.data.get('after_id')
+        expected_versions = self._get_task_column_versions(request.data)
+
+        # verify that the current user can update this task
+        task = Task.objects.filter(
+            id=task_id,
+            organization__memberships__user=request.user
+        ).first()
+        if not task:
+            raise exceptions.ValidationError(
+                'You do not have permission to update this task.'
+            )
+
+        if board.is_enabled():
+            try:
+                return self._move_task_in_board(request, task, task_column_id, before_id, after_id)
+            except board.ColumnSyncing:
+                # the columns are being written to postgres: move the task there, once that write commits
+                pass
+            except redis.RedisError as err:
+                logger.info(f'Failed to move task {task.id} in redis')
+                capture_exception(err)
+                logger.info(err)
+                board.forget_columns([task.task_column_id, task_column_id])
+
+        # lock the columns the task moves between. This also verifies that the task_column belongs to the
+        # same project as the task.
+        versions = TaskColumn.lock_versions(
+            {task.task_column_id, task_column_id} | expected_versions.keys(),
+            task.project_id
         )
-        task_metadata = TaskMetadata.objects.create(
-            task=task,
-            url_origin=task_metadata_request_data.get('url_origin'),
-            os_name=task_metadata_request_data.get('os_name'),
-            os_version=task_metadata_request_data.get('os_version'),
-            os_version_name=task_metadata_request_data.get('os_version_name'),
-            browser_name=task_metadata_request_data.get('browser_name'),
-            browser_version=task_metadata_request_data.get('browser_version'),
-            selector=task_metadata_request_data.get('selector'),
-            screen_height=task_metadata_request_data.get('screen_height'),
-            screen_width=task_metadata_request_data.get('screen_width'),
-            device_pixel_ratio=task_metadata_request_data.get('device_pixel_ratio'),
-            browser_window_width=task_metadata_request_data.get('browser_window_width'),
-            browser_window_height=task_metadata_request_data.get('browser_window_height'),
-            color_depth=task_metadata_request_data.get('color_depth'),
-            pixel_depth=task_metadata_request_data.get('pixel_depth'),
+        if task_column_id not in versions:
+            raise exceptions.ValidationError(
+                'This task column does not share the same project as the task.'
+            )
+        self._sync_task_columns(versions)
+        stale_task_column_ids = self._get_stale_task_column_ids(versions, expected_versions)
+        if stale_task_column_ids:
+            return self._stale_board_response(stale_task_column_ids, versions)
+
+        column_tasks = Task.objects.filter(task_column_id=task_column_id).exclude(id=task.id)
+        neighbour_ids = [neighbour_id for neighbour_id in (before_id, after_id) if neighbour_id]
+        neighbour_ranks = dict(column_tasks.filter(id__in=neighbour_ids).values_list('id', 'rank'))
+        if len(neighbour_ranks) != len(neighbour_ids):
+            raise exceptions.ValidationError('Moving card invalid. Please contact support')
+        before_rank, after_rank = neighbour_ranks.get(before_id), neighbour_ranks.get(after_id)
+        if not neighbour_ids:
+            # the bottom of the column
+            before_rank = column_tasks.aggregate(Max('rank'))['rank__max']
+        else:
+            # the neighbours must still be next to each other, and a missing one stands for the end of the column
+            between = column_tasks
+            if before_rank is not None:
+                between = between.filter(rank__gt=before_rank)
+            if after_rank is not None:
+                between = between.filter(rank__lt=after_rank)
+            if (before_rank is not None and after_rank is not None and before_rank >= after_rank) or \
+                    between.exists():
+                # the neighbours moved since the client loaded the board
+                return self._stale_board_response([task_column_id], versions)
+        rank = rank_between(before_rank, after_rank)
+
+        prev_task_column_id = task.task_column_id
+        task.rank = rank
+        task.task_column_id = task_column_id
+        task.save(update_fields=['rank', 'task_column', 'updated'])
+        task_column_versions = self._bump_task_column_versions(versions, {prev_task_column_id, task_column_id})
+
+        if len(rank) > settings.TASK_RANK_MAX_LENGTH:
+            rebalance_task_column.delay_on_commit(task_column_id)
+
+        if prev_task_column_id != task.task_column_id:
+            enqueue_notification(
+                NotificationOutbox.EventType.TASK_COLUMN_CHANGED,
+                task_id=task.id,
+                prev_task_column_id=prev_task_column_id,
+                new_task_column_id=task.task_column_id,
+                mover_id=request.user.id
+            )
+
+        # `order` isn't written (see `Task.order`)
+        return Response({
+            'task': {
+                'id': task.id,
+                'rank': task.rank,
+                'task_column': task.task_column_id,
+            },
+            'task_columns': task_column_versions
+            },
+            status=200
         )
 
-        task_id = task.id
-        if html:
-            browser_name = task_metadata.browser_name
-            device_scale_factor = task_metadata.device_pixel_ratio
-            window_width = task_metadata.browser_window_width
-            window_height = task_metadata.browser_window_height
-            task_html = TaskHtml.objects.create(task=task, html=html)
-            create_screenshots_for_task.delay_on_commit(
-                task_id, task_html.id, browser_name, device_scale_factor, window_width, window_height
-            )
-        elif data_url or element_data_url:
-            task_data_url = TaskDataUrl.objects.create(
-                task=task,
-                window_screenshot_data_url=data_url or '',
-                element_screenshot_data_url=element_data_url or ''
+    def _move_task_in_board(self, request, task, task_column_id, before_id, after_id):
+        # Move the task in the live board order (see `collab_app.board`). Postgres is only written when the
+        # task changes columns. `task_column_versions` aren't used: the move fails with a 409 if the
+        # neighbours aren't next to each other any more.
+        if task_column_id not in TaskColumn.project_task_column_ids(task.project_id):
+            raise exceptions.ValidationError(
+                'This task column does not share the same project as the task.'
             )
-            upload_chrome_extension_screenshots_for_task.delay_on_commit(
-                task_id, task_data_url.id
+
+        prev_task_column_id = task.task_column_id
+        try:
+            board.move_task(task.id, prev_task_column_id, task_column_id, before_id, after_id)
+        except ValueError:
+            # the neighbours moved since the client loaded the board
+            return Response({
+                'detail': 'This board has changed. Please refresh and try again.',
+                'task_columns': [
+                    {'id': board_task_column_id, 'task_ids': task_ids}
+                    for board_task_column_id, task_ids in board.get_board_order([task_column_id]).items()
+                ]
+                },
+                status=409
             )
 
+        if prev_task_column_id != task_column_id:
+            try:
+                task.task_column_id = task_column_id
+                task.save(update_fields=['task_column', 'updated'])
+                enqueue_notification(
+                    NotificationOutbox.EventType.TASK_COLUMN_CHANGED,
+                    task_id=task.id,
+                    prev_task_column_id=prev_task_column_id,
+                    new_task_column_id=task_column_id,
+                    mover_id=request.user.id
+                )
+            except Exception:
+                # reload both columns from postgres
+                board.forget_columns([prev_task_column_id, task_column_id])
+                raise
+
         return Response({
-            'task': TaskSerializer(
-                task,
-                include_fields=TaskSerializer.Meta.deferred_fields).data,
+            'task': {'id': task.id, 'task_column': task_column_id}
+            },
+            status=200
+        )
+
+    def _new_task_data(self, tasks, with_task_metadata=True):
+        # a task that was just created has no comments, so don't query for them. Neither for its metadata,
+        # when it was created without.
+        include_fields = NEW_TASK_FIELDS if with_task_metadata else NEW_TASK_FIELDS_WITHOUT_METADATA
+        data = TaskSerializer(
+            tasks,
+            many=True,
+            include_fields=include_fields).data
+        for task_data in data:
+            task_data['task_comments'] = []
+            if not with_task_metadata:
+                task_data['task_metadata'] = None
+        return data
+
+    def _widget_create_task(self, request, *args, **kwargs):
+        (task,), (task_metadata,) = create_widget_tasks([request.data], request.user)
+
+        return Response({
+            'task': self._new_task_data([task])[0],
             'task_metadata': TaskMetadataSerializer(
                 task_metadata,
                 include_fields=TaskMetadataSerializer.Meta.deferred_fields).data
@@ -476,94 +709,176 @@ class TaskViewSet(ReadOnlyMixin, ApiViewSet):
             status=201
         )
 
+    def _widget_create_tasks(self, request, *args, **kwargs):
+        # Several submissions (each shaped like the body of `create_task_from_widget`) in one request,
+        # e.g. reports the widget queued while offline.
+        submissions = request.data.get('tasks')
+        if not submissions or not isinstance(submissions, list):
+            raise exceptions.ValidationError('No tasks to create.')
+        if len(submissions) > settings.WIDGET_MAX_TASKS_PER_REQUEST:
+            raise exceptions.ValidationError(
+                f'Only {settings.WIDGET_MAX_TASKS_PER_REQUEST} tasks can be created at once.'
+            )
+
+        tasks, task_metadatas = create_widget_tasks(submissions, request.user)
+
+        return Response({
+            'tasks': self._new_task_data(tasks),
+            'task_metadatas': TaskMetadataSerializer(
+                task_metadatas,
+                many=True,
+                include_fields=TaskMetadataSerializer.Meta.deferred_fields).data
+            },
+            status=201
+        )
+
     @action(detail=False, methods=['post'])
+    @idempotent
     def create_task_from_widget(self, request, *args, **kwargs):
         return self._widget_create_task(request, *args, **kwargs)
 
     @action(detail=False, methods=['post'], permission_classes=(AllowAny,), authentication_classes=())
+    @idempotent
     def create_task_from_widget_anonymous(self, request, *args, **kwargs):
         return self._widget_create_task(request, *args, **kwargs)
 
     @action(detail=False, methods=['post'])
+    @idempotent
+    def create_tasks_from_widget(self, request, *args, **kwargs):
+        return self._widget_create_tasks(request, *args, **kwargs)
+
+    @action(detail=False, methods=['post'], permission_classes=(AllowAny,), authentication_classes=())
+    @idempotent
+    def create_tasks_from_widget_anonymous(self, request, *args, **kwargs):
+        return self._widget_create_tasks(request, *args, **kwargs)
+
+    @action(detail=False, methods=['post'], permission_classes=(AllowAny,), authentication_classes=())
+    @idempotent
+    def queue_task_from_widget_anonymous(self, request, *args, **kwargs):
+        # Accept the report and create its task later (see `collab_app.tasks.persist_widget_reports`).
+        # The widget can poll `widget_report_status` with the returned ticket.
+        if int(request.META.get('CONTENT_LENGTH') or 0) > settings.WIDGET_REPORT_MAX_BYTES:
+            raise exceptions.ValidationError('The report is too large.')
+        if not isinstance(request.data, dict):
+            raise exceptions.ValidationError('Invalid task.')
+
+        widget_report = queue_widget_report(request.data)
+
+        return Response({'ticket': widget_report.ticket}, status=202)
+
+    @action(detail=False, methods=['get'], permission_classes=(AllowAny,), authentication_classes=())
+    def widget_report_status(self, request, *args, **kwargs):
+        ticket = request.query_params.get('ticket')
+        try:
+            widget_report = WidgetReport.objects.filter(ticket=ticket).values('state', 'task_id').first()
+        except DjangoValidationError:
+            widget_report = None
+        if widget_report is None:
+            raise exceptions.NotFound('This report does not exist.')
+
+        return Response({
+            'state': WidgetReport.ReportState(widget_report['state']).label.lower(),
+            'task': widget_report['task_id']
+            },
+            status=200
+        )
+
+    @action(detail=False, methods=['post'])
+    @transaction.atomic
     def change_column_from_widget(self, request, *args, **kwargs):
         task_id = request.data['task_id']
         task_column_id = request.data['task_column_id']
+        expected_versions = self._get_task_column_versions(request.data)
 
         # verify that the current user can update this task
-        if not Task.objects.filter(
+        task = Task.objects.filter(
             id=task_id,
-            project__organization__memberships__user=request.user
-        ).exists():
+            organization__memberships__user=request.user
+        ).first()
+        if task is None:
             raise exceptions.ValidationError(
                 'You do not have permission to update this task.'
             )
 
-        task = Task.objects.get(id=task_id)
-        task_column = TaskColumn.objects.get(id=task_column_id)
-        last_task_in_column = task_column.tasks.order_by('order').all().last()
-
-        # verify that the task_column belongs to the same project as the task
-        if not Project.objects.filter(
-            tasks=task,
-            task_columns=task_column
-        ).exists():
+        # lock the columns the task moves between. This also verifies that the task_column belongs to the
+        # same project as the task.
+        versions = TaskColumn.lock_versions(
+            {task.task_column_id, task_column_id} | expected_versions.keys(),
+            task.project_id
+        )
+        if task_column_id not in versions:
             raise exceptions.ValidationError(
                 'This task column does not share the same project as the task.'
             )
-
-        prev_task_column_id = task.task_column.id
-        task.task_column = task_column
-        task.order = last_task_in_column.order + 1 if last_task_in_column else 1
-        task.save()
-
-        # for consistency with `reorder` task method, manually call
-        # the `notify_participants_of_task_column_change` method.
-        notify_participants_of_task_column_change.delay_on_commit(
-            task_id,
-            prev_task_column_id,
-            task_column_id,
-            request.user.id
+        self._sync_task_columns(versions)
+        stale_task_column_ids = self._get_stale_task_column_ids(versions, expected_versions)
+        if stale_task_column_ids:
+            return self._stale_board_response(stale_task_column_ids, versions)
+
+        column_end = Task.objects.filter(task_column_id=task_column_id).aggregate(Max('order'), Max('rank'))
+
+        prev_task_column_id = task.task_column_id
+        task.task_column_id = task_column_id
+        task.order = (column_end['order__max'] or 0) + 1
+        task.rank = rank_between(column_end['rank__max'], None)
+        task.save(update_fields=['task_column', 'order', 'rank', 'updated'])
+        task_column_versions = self._bump_task_column_versions(versions, {prev_task_column_id, task_column_id})
+        if len(task.rank) > settings.TASK_RANK_MAX_LENGTH:
+            rebalance_task_column.delay_on_commit(task_column_id)
+
+        # for consistency with `reorder` task method, manually enqueue
+        # the task column change notification.
+        enqueue_notification(
+            NotificationOutbox.EventType.TASK_COLUMN_CHANGED,
+            task_id=task_id,
+            prev_task_column_id=prev_task_column_id,
+            new_task_column_id=task_column_id,
+            mover_id=request.user.id
         )
 
+        # only the fields that changed
         return Response({
-            'task': TaskSerializer(
-                task,
-                include_fields=TaskSerializer.Meta.deferred_fields).data
+            'task': {
+                'id': task.id,
+                'order': task.order,
+                'rank': task.rank,
+                'task_column': task.task_column_id,
+            },
+            'task_columns': task_column_versions
             }, status=200
         )
 
     @action(detail=False, methods=['post'])
+    @transaction.atomic
     def update_assignee(self, request, *args, **kwargs):
         assigned_to_id = request.data['assigned_to_id']
         task_id = request.data['task_id']
 
         # verify that the current user can update this task
-        if not Task.objects.filter(
+        task = Task.objects.filter(
             id=task_id,
-            project__organization__memberships__user=request.user
-        ).exists():
+            organization__memberships__user=request.user
+        ).first()
+        if not task:
             raise exceptions.ValidationError(
                 'You do not have permission to update this task.'
             )
 
-        # make sure the assignee is part of the current user's organization
+        # make sure the assignee is part of the task's organization
         if assigned_to_id:
-            if not Membership.objects.filter(
-                user_id=assigned_to_id,
-                organization__memberships__user=request.user
-            ).exists():
+            if not Membership.objects.filter(user_id=assigned_to_id, organization_id=task.organization_id).exists():
                 raise exceptions.ValidationError(
                     'This member does not belong to your organization.'
                 )
 
-        task = Task.objects.get(id=task_id)
-        user = User.objects.get(id=assigned_to_id) if assigned_to_id else None
-        task.assigned_to = user
-        task.save()
+        task.assigned_to_id = assigned_to_id or None
+        # `post_save` enqueues the assignee changed notification
+        task.save(update_fields=['assigned_to', 'updated'])
         return Response({
-            'task': TaskSerializer(
-                task,
-                include_fields=TaskSerializer.Meta.deferred_fields).data
+            'task': {
+                'id': task.id,
+                'assigned_to': task.assigned_to_id,
+            }
             }, status=200
         )
 
@@ -582,15 +897,17 @@ class TaskCommentViewSet(ReadOnlyMixin, ApiViewSet):
     permission_classes = (IsAuthenticated, )
 
     @action(detail=False, methods=['post'])
+    @transaction.atomic
     def create_task_comment(self, request, *args, **kwargs):
         task_id = request.data['task']
         text = request.data['text']
 
         # make sure user has access to this task
-        if not Task.objects.filter(
+        task = Task.objects.filter(
             id=task_id,
-            project__organization__memberships__user=request.user
-        ):
+            organization__memberships__user=request.user
+        ).values('project_id', 'organization_id').first()
+        if task is None:
             raise exceptions.ValidationError(
                 'You do not have access to comment on this task.'
             )
@@ -598,6 +915,8 @@ class TaskCommentViewSet(ReadOnlyMixin, ApiViewSet):
         task_comment = TaskComment.objects.create(
             text=text,
             task_id=task_id,
+            project_id=task['project_id'],
+            organization_id=task['organization_id'],
             creator=request.user,
         )
 
@@ -0,0 +1,292 @@
+import logging
+from collections import defaultdict
+
+from celery import group
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+from rest_framework import exceptions
+from sentry_sdk import capture_exception
+
+from collab_app import board
+from collab_app.models import (
+    Membership,
+    NotificationOutbox,
+    Project,
+    Task,
+    TaskColumn,
+    TaskDataUrl,
+    TaskHtml,
+    TaskMetadata,
+    WidgetReport,
+)
+from collab_app.notifications import (
+    enqueue_notifications,
+)
+from collab_app.ranking import ranks_between
+from collab_app.tasks import (
+    create_screenshots_for_task,
+    rebalance_task_column,
+    upload_chrome_extension_screenshots_for_task,
+)
+
+
+"""
+Create the tasks that the widget and the chrome extension submit.
+
+A submission is what the widget posts for one task:
+    {'task': {...}, 'task_metadata': {...}, 'html': ..., 'data_url': ..., 'element_data_url': ...}
+
+Anonymous submissions can also be queued as a `WidgetReport` and turned into tasks later, in batches
+(see `queue_widget_report` and `persist_widget_report_batch`).
+"""
+
+logger = logging.getLogger('collabsauce')
+
+
+@transaction.atomic
+def create_widget_tasks(submissions, user):
+    """
+    Create the tasks for a list of submissions to one project, and return the tasks and their task metadata.
+
+    Each step is done once for the whole list: the project and access checks, reserving task numbers, finding
+    the end of the raw task column, the inserts and publishing the screenshot work.
+    """
+    task_requests = [submission.get('task') for submission in submissions]
+    first_task_request = task_requests[0]
+
+    # NOTE: `is_authed` means the user is authenticated and has access to the project.
+    # If they don't, the `creator` will be None and we will set the `one_off_email_set_by` field.
+    is_authed = user.is_authenticated and first_task_request.get('project')
+
+    if any(
+        (task_request.get('project'), task_request.get('project_key')) !=
+        (first_task_request.get('project'), first_task_request.get('project_key'))
+        for task_request in task_requests
+    ):
+        raise exceptions.ValidationError(
+            'All tasks must be for the same project.'
+        )
+
+    # if the user is_authed, then they will have access to the project.
+    # But if they are sending this method as non-authed, then they will only
+    # send the `project_key`. We need to get the project_id based off this key.
+    project_id = first_task_request.get('project')
+    if not project_id:
+        project_id = get_project_id_for_key(first_task_request.get('project_key'))
+        if project_id is None:
+            raise exceptions.ValidationError(
+                'The project key is not implemented correctly on this website.'
+            )
+
+    # make sure the user has access to this project (if `is_authed`), and that the assignees are part of
+    # the project's organization, with one query.
+    assigned_to_ids = {task_request.get('assigned_to') for task_request in task_requests} - {None}
+    if is_authed or assigned_to_ids:
+        member_ids = set(Membership.objects.filter(
+            user_id__in=assigned_to_ids | ({user.id} if is_authed else set()),
+            organization__projects=project_id
+        ).values_list('user_id', flat=True))
+        if is_authed and user.id not in member_ids:
+            raise exceptions.ValidationError(
+                'You do not have access to this project.'
+            )
+        # anonymous submissions can't assign tasks
+        if not is_authed or not assigned_to_ids <= member_ids:
+            raise exceptions.ValidationError(
+                'This member does not belong to your organization.'
+            )
+
+    organization_id = Project.organization_id_for(project_id)
+    task_column_id = TaskColumn.raw_task_column_id(project_id)
+    board.sync_columns([task_column_id])
+    task_numbers = Project.reserve_task_numbers(project_id, len(submissions))
+    column_end = Task.objects.filter(task_column_id=task_column_id).aggregate(Max('order'), Max('rank'))
+    ranks = ranks_between(column_end['rank__max'], None, len(submissions))
+    tasks = Task.objects.bulk_create([
+        Task(
+            title=task_request.get('title'),
+            target_dom_path=task_request.get('target_dom_path'),
+            design_edits=task_request.get('design_edits'),
+            text_copy_changes=task_request.get('text_copy_changes'),
+            has_text_copy_changes=task_request.get('has_text_copy_changes'),
+            has_target=task_request.get('has_target'),
+            order=(column_end['order__max'] or 0) + i + 1,
+            rank=ranks[i],
+            project_id=project_id,
+            organization_id=organization_id,
+            task_column_id=task_column_id,
+            assigned_to_id=task_request.get('assigned_to'),
+            creator=user if is_authed else None,
+            one_off_email_set_by=task_request.get('one_off_email_set_by'),
+            task_number=task_numbers[i]
+        )
+        for i, task_request in enumerate(task_requests)
+    ])
+    if any(len(rank) > settings.TASK_RANK_MAX_LENGTH for rank in ranks):
+        rebalance_task_column.delay_on_commit(task_column_id)
+    # `bulk_create` doesn't send `post_save`, so enqueue the task created notifications here.
+    enqueue_notifications(NotificationOutbox.EventType.TASK_CREATED, [{'task_id': task.id} for task in tasks])
+
+    task_metadata_requests = [submission.get('task_metadata') for submission in submissions]
+    # {field name: {value: lookup id}}, one lookup per field for the whole list
+    lookup_ids = {
+        field_name: TaskMetadata._meta.get_field(field_name).related_model.objects.ids_for(
+            task_metadata_request.get(field_name) for task_metadata_request in task_metadata_requests
+        )
+        for field_name in TaskMetadata.LOOKUP_FIELDS
+    }
+
+    def lookup_row(field_name, value):
+        related_model = TaskMetadata._meta.get_field(field_name).related_model
+        value = related_model.objects.normalize(value)
+        return related_model(id=lookup_ids[field_name][value], value=value)
+
+    task_metadatas = TaskMetadata.objects.bulk_create([
+        TaskMetadata(
+            task=task,
+            project_id=project_id,
+            organization_id=organization_id,
+            selector=task_metadata_request.get('selector'),
+            screen_height=task_metadata_request.get('screen_height'),
+            screen_width=task_metadata_request.get('screen_width'),
+            device_pixel_ratio=task_metadata_request.get('device_pixel_ratio'),
+            browser_window_width=task_metadata_request.get('browser_window_width'),
+            browser_window_height=task_metadata_request.get('browser_window_height'),
+            color_depth=task_metadata_request.get('color_depth'),
+            pixel_depth=task_metadata_request.get('pixel_depth'),
+            # the lookup rows, with their value, so serializing the task metadata doesn't read them back
+            **{
+                field_name: lookup_row(field_name, task_metadata_request.get(field_name))
+                for field_name in TaskMetadata.LOOKUP_FIELDS
+            }
+        )
+        for task, task_metadata_request in zip(tasks, task_metadata_requests)
+    ])
+
+    dispatch_screenshot_work(submissions, tasks, task_metadatas)
+    return tasks, task_metadatas
+
+
+def dispatch_screenshot_work(submissions, tasks, task_metadatas):
+    # save the html and data urls (sqs messages are limited to 256kb), then publish every screenshot
+    # job as one group once the tasks are committed.
+    task_htmls, task_data_urls = [], []
+    for submission, task, task_metadata in zip(submissions, tasks, task_metadatas):
+        html = submission.get('html', None)
+        data_url = submission.get('data_url', None)
+        element_data_url = submission.get('element_data_url', None)
+        if html:
+            task_htmls.append((TaskHtml(task=task, html=html), task_metadata, submission['task_metadata']))
+        elif data_url or element_data_url:
+            task_data_urls.append(TaskDataUrl(
+                task=task,
+                window_screenshot_data_url=data_url or '',
+                element_screenshot_data_url=element_data_url or ''
+            ))
+
+    TaskHtml.objects.bulk_create([task_html for task_html, _, _ in task_htmls])
+    TaskDataUrl.objects.bulk_create(task_data_urls)
+
+    jobs = [
+        create_screenshots_for_task.si(
+            task_html.task_id,
+            task_html.id,
+            task_metadata_request.get('browser_name') or '',
+            task_metadata.device_pixel_ratio,
+            task_metadata.browser_window_width,
+            task_metadata.browser_window_height
+        )
+        for task_html, task_metadata, task_metadata_request in task_htmls
+    ] + [
+        upload_chrome_extension_screenshots_for_task.si(task_data_url.task_id, task_data_url.id)
+        for task_data_url in task_data_urls
+    ]
+    if jobs:
+        transaction.on_commit(group(jobs).apply_async)
+
+
+def get_project_id_for_key(project_key):
+    # project keys never change, so keep the lookup out of the database for the queueing endpoint
+    cache_key = f'project_key:{project_key}'
+    project_id = cache.get(cache_key)
+    if project_id is None:
+        project_id = Project.objects.filter(key=project_key).values_list('id', flat=True).first()
+        if project_id is not None:
+            cache.set(cache_key, project_id, settings.WIDGET_PROJECT_KEY_CACHE_TTL)
+    return project_id
+
+
+def queue_widget_report(submission):
+    """
+    Only check what is cheap to check (the shape of the submission and the project key), then store the
+    submission for `persist_widget_report_batch`. Returns the `WidgetReport`.
+    """
+    task_request = submission.get('task')
+    if not isinstance(task_request, dict) or not isinstance(submission.get('task_metadata'), dict):
+        raise exceptions.ValidationError('Invalid task.')
+
+    project_id = get_project_id_for_key(task_request.get('project_key'))
+    if project_id is None:
+        raise exceptions.ValidationError(
+            'The project key is not implemented correctly on this website.'
+        )
+
+    # the report is anonymous: the project comes from the key only
+    payload = dict(submission, task={key: value for key, value in task_request.items() if key != 'project'})
+    return WidgetReport.objects.create(project_id=project_id, payload=payload)
+
+
+def persist_widget_report_batch(batch_size=None):
+    """
+    Claim a batch of pending widget reports and create their tasks. Returns the number of reports claimed.
+
+    Reports are claimed with `SELECT ... FOR UPDATE SKIP LOCKED`, so concurrent workers never create a
+    report's task twice. The reports of a project are created together with `create_widget_tasks`. If that
+    fails, they are retried one by one so a bad report doesn't hold back the others.
+    """
+    batch_size = batch_size or settings.WIDGET_REPORT_BATCH_SIZE
+    with transaction.atomic():
+        reports = list(
+            WidgetReport.objects.select_for_update(skip_locked=True).filter(
+                state=WidgetReport.ReportState.PENDING
+            ).order_by('id')[:batch_size]
+        )
+        if not reports:
+            return 0
+
+        reports_by_project = defaultdict(list)
+        for report in reports:
+            reports_by_project[report.project_id].append(report)
+        for project_reports in reports_by_project.values():
+            persist_widget_reports(project_reports)
+
+        WidgetReport.objects.bulk_update(reports, ['state', 'error', 'task', 'updated'])
+    return len(reports)
+
+
+def persist_widget_reports(reports):
+    try:
+        with transaction.atomic():
+            tasks, _ = create_widget_tasks([report.payload for report in reports], AnonymousUser())
+    except Exception as err:
+        if len(reports) > 1:
+            for report in reports:
+                persist_widget_reports([report])
+            return
+        logger.info(f'Failed to create the task for widget report {reports[0].id}')
+        capture_exception(err)
+        logger.info(err)
+        reports[0].state = WidgetReport.ReportState.FAILED
+        reports[0].error = str(err)
+    else:
+        for report, task in zip(reports, tasks):
+            report.state = WidgetReport.ReportState.PROCESSED
+            report.task = task
+    finally:
+        # `bulk_update` doesn't set `auto_now` fields
+        for report in reports:
+            report.updated = timezone.now()
@@ -0,0 +1,128 @@
+import json
+from unittest import mock
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from dynamic_rest.fields import DynamicRelationField
+from model_mommy import mommy
+
+from collab_app import views
+from collab_app.models import (
+    Invite,
+    Membership,
+    Organization,
+    Project,
+    Task,
+    TaskColumn,
+    TaskComment,
+    TaskMetadata,
+    User,
+)
+from collab_app.permissions import object_level
+from tests.mixins import BaseApiSetUp
+
+
+VIEWSETS = (
+    views.InviteViewSet,
+    views.MembershipViewSet,
+    views.OrganizationViewSet,
+    views.ProfileViewSet,
+    views.ProjectViewSet,
+    views.TaskViewSet,
+    views.TaskColumnViewSet,
+    views.TaskCommentViewSet,
+    views.TaskMetadataViewSet,
+    views.UserViewSet,
+)
+
+
+class SideloadPermissionTestCase(BaseApiSetUp):
+
+    """
+    Sideloads fetched through a permission-filtered parent (see TRUSTED_SIDELOADS) aren't filtered again,
+    and must read the same rows as when they are.
+    """
+
+    def setUp(self):
+        super(SideloadPermissionTestCase, self).setUp()
+
+        # the user is in two organizations, and sees nothing of a third
+        self.u2, self.u3, self.former_member = mommy.make(User, _quantity=3)
+        self.organization = mommy.make(Organization)
+        for organization, members in (
+            (self.organization, [self.user, self.u2, self.former_member]),
+            (mommy.make(Organization), [self.user]),
+            (mommy.make(Organization), [self.u2, self.u3]),
+        ):
+            for member in members:
+                mommy.make(Membership, organization=organization, user=member)
+            mommy.make(Invite, organization=organization, inviter=members[-1], key=f'key-{organization.id}')
+            project = mommy.make(Project, organization=organization)
+            task_column = mommy.make(TaskColumn, project=project)
+            for creator in members:
+                task = mommy.make(
+                    Task,
+                    project=project,
+                    task_column=task_column,
+                    creator=creator,
+                    assigned_to=members[-1],
+                    title='Fix',
+                    has_target=False
+                )
+                mommy.make(TaskComment, task=task, creator=members[0])
+                mommy.make(TaskMetadata, task=task)
+
+        # their tasks, comments and invite stay in the organization
+        Membership.objects.filter(user=self.former_member).delete()
+
+    def get(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+        # {resource: sorted ids}
+        return {
+            resource: sorted(row['id'] for row in rows)
+            for resource, rows in json.loads(response.content).items()
+            if resource != 'meta'
+        }
+
+    def test_every_sideload_reads_the_same_rows_as_when_filtered(self):
+        for user in (self.user, self.u3):
+            self.client.force_authenticate(user=user)
+            for viewset in VIEWSETS:
+                serializer_class = viewset.serializer_class
+                for name, field in serializer_class._declared_fields.items():
+                    if not isinstance(field, DynamicRelationField):
+                        continue
+                    url = f'/api/{serializer_class.get_plural_name()}?include[]={name}.*'
+                    trusted = self.get(url)
+                    with mock.patch.object(object_level, 'TRUSTED_SIDELOADS', frozenset()):
+                        self.assertEqual(trusted, self.get(url), url)
+
+    def test_untrusted_sideloads_are_still_filtered(self):
+        # u2's membership of the third organization
+        content = self.get('/api/users?include[]=memberships.*')
+        self.assertEqual(
+            set(content['memberships']),
+            set(Membership.objects.filter(user__in=[self.user, self.u2]).exclude(
+                organization__memberships__user=self.u3
+            ).values_list('id', flat=True))
+        )
+
+        # the creator and assignee of a task who left the organization
+        content = self.get('/api/tasks?include[]=creator.*&include[]=assigned_to.*')
+        self.assertEqual(len(content['tasks']), 4)
+        self.assertEqual(content['users'], sorted([self.user.id, self.u2.id]))
+
+    def test_trusted_sideloads_are_not_filtered_again(self):
+        with CaptureQueriesContext(connection) as context:
+            content = self.get('/api/tasks?include[]=task_comments.*&include[]=task_metadata.*')
+        self.assertEqual(len(content['task_comments']), 4)
+        self.assertEqual(len(content['task_metadata']), 4)
+
+        for model in (TaskComment, TaskMetadata):
+            table = model._meta.db_table
+            sql, = [
+                query['sql'] for query in context.captured_queries
+                if query['sql'].startswith('SELECT') and f'FROM "{table}"' in query['sql']
+            ]
+            self.assertNotIn(f'"{table}"."organization_id" IN', sql)
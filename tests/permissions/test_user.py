@@ -1,10 +1,17 @@
 import json
 
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from model_mommy import mommy
 
 from collab_app.models import (
+    Membership,
+    Organization,
+    Project,
+    Task,
     User
 )
+from collab_app.permissions.object_level import OrganizationAccess, UserPermission
 from tests.mixins import BaseApiSetUp
 
 
@@ -85,3 +92,36 @@ class UserPermissionTestCase(BaseApiSetUp):
         # this user should not be readable
         # nothing to test for now
         pass
+
+    def test_users_sharing_several_organizations_are_read_once(self):
+        for organization in mommy.make(Organization, _quantity=3):
+            mommy.make(Membership, user=self.user, organization=organization)
+            mommy.make(Membership, user=self.u2, organization=organization)
+
+        users = UserPermission().read(User.objects.all(), self.user, OrganizationAccess.for_user(self.user))
+
+        self.assertEqual(sorted(users.values_list('id', flat=True)), sorted([self.user.id, self.u2.id]))
+
+    def test_organizations_are_resolved_once_per_request(self):
+        organization = mommy.make(Organization)
+        mommy.make(Membership, user=self.user, organization=organization)
+        mommy.make(Membership, user=self.u2, organization=organization)
+        project = mommy.make(Project, organization=organization)
+        mommy.make(Task, project=project, creator=self.u2, title='Fix', has_target=False, _quantity=2)
+        # a task in an organization the user isn't a member of
+        mommy.make(Task, creator=self.u2, title='Fix', has_target=False)
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(
+                '/api/tasks?include[]=project.*&include[]=creator.*&include[]=project.organization.*'
+            )
+        content = json.loads(response.content)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(content['tasks']), 2)
+        self.assertEqual([user['id'] for user in content['users']], [self.u2.id])
+        self.assertEqual(len(content['organizations']), 1)
+        self.assertEqual(len([
+            query for query in context.captured_queries
+            if query['sql'].startswith('SELECT "collab_app_membership"."organization_id"')
+        ]), 1)
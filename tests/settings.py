@@ -2,6 +2,9 @@ from collab.settings import *   # noqa
 
 # overwrite any test settings here
 
+# the test runner only swaps EMAIL_BACKEND for the locmem backend. Do the same for notifications.
+NOTIFICATION_EMAIL_BACKEND = 'django.core.mail.backends.locmem.EmailBackend'
+
 # Sometimes failing tests break the db connection, and the rest of the tests fail. If you don't want that,
 # uncomment out this line.
 # DATABASES = {
@@ -0,0 +1,169 @@
+import datetime
+from unittest import mock
+
+from django.core import mail
+from django.db import connection
+from django.test import override_settings
+from django.utils import timezone
+from model_mommy import mommy
+from rest_framework.test import APITestCase
+
+from collab_app.models import (
+    Membership,
+    NotificationDelivery,
+    NotificationOutbox,
+    Project,
+    Task,
+    TaskColumn,
+    TaskComment,
+    User,
+)
+from collab_app import notifications
+from collab_app.notifications import dispatch_outbox_batch, record_failed_messages
+
+
+class TaskActionsSignalTestCase(APITestCase):
+
+    def setUp(self):
+        self.creator = mommy.make(User, email='creator@hi.com')
+        self.assignee = mommy.make(User, email='assignee@hi.com')
+        self.commenter = mommy.make(User, email='commenter@hi.com')
+        self.project = mommy.make(Project)
+        for user in (self.creator, self.assignee, self.commenter):
+            mommy.make(Membership, user=user, organization=self.project.organization)
+        self.task_column = TaskColumn.objects.get(project=self.project, name=TaskColumn.TASK_COLUMN_RAW_TASK)
+        self.task = mommy.make(
+            Task,
+            title='A task',
+            has_target=False,
+            task_number=1,
+            project=self.project,
+            task_column=self.task_column,
+            creator=self.creator,
+            assigned_to=self.assignee,
+        )
+        mail.outbox = []
+
+    def test_task_create_writes_to_outbox(self):
+        entry = NotificationOutbox.objects.get()
+        self.assertEqual(entry.event, NotificationOutbox.EventType.TASK_CREATED)
+        self.assertEqual(entry.payload, {'task_id': self.task.id})
+        self.assertEqual(entry.state, NotificationOutbox.OutboxState.PENDING)
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_dispatch_sends_and_records_deliveries(self):
+        mommy.make(TaskComment, task=self.task, creator=self.commenter, text='hello')
+        self.assertEqual(NotificationOutbox.objects.count(), 2)
+
+        self.assertEqual(dispatch_outbox_batch(), 2)
+        self.assertEqual(dispatch_outbox_batch(), 0)
+
+        self.assertFalse(NotificationOutbox.objects.exclude(state=NotificationOutbox.OutboxState.SENT).exists())
+        # assignee on task create. creator and assignee on comment create.
+        self.assertEqual(
+            sorted(message.to[0] for message in mail.outbox),
+            ['assignee@hi.com', 'assignee@hi.com', 'creator@hi.com']
+        )
+        self.assertEqual(
+            NotificationDelivery.objects.filter(state=NotificationDelivery.DeliveryState.SENT).count(), 3
+        )
+
+    def test_retry_skips_recipients_already_delivered(self):
+        entry = NotificationOutbox.objects.get()
+        mommy.make(
+            NotificationDelivery,
+            outbox=entry,
+            email=self.assignee.email,
+            state=NotificationDelivery.DeliveryState.SENT
+        )
+
+        dispatch_outbox_batch()
+
+        entry.refresh_from_db()
+        self.assertEqual(entry.state, NotificationOutbox.OutboxState.SENT)
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_sends_after_the_claim_is_committed(self):
+        savepoints = len(connection.savepoint_ids)
+        states = []
+        original_get_connection = notifications.get_connection
+
+        def get_connection(*args, **kwargs):
+            # no transaction (so no row lock) of the dispatcher is open while sending
+            self.assertEqual(len(connection.savepoint_ids), savepoints)
+            states.append(NotificationOutbox.objects.get().state)
+            return original_get_connection(*args, **kwargs)
+
+        with mock.patch.object(notifications, 'get_connection', get_connection):
+            dispatch_outbox_batch()
+
+        self.assertEqual(states, [NotificationOutbox.OutboxState.SENDING])
+        self.assertEqual(NotificationOutbox.objects.get().state, NotificationOutbox.OutboxState.SENT)
+
+    def dispatch_failing(self):
+        # send with a backend that fails, and return the messages handed to the chunk task to retry
+        error = Exception('Connection refused')
+        with mock.patch.object(notifications, 'get_connection') as get_connection, \
+                mock.patch('collab_app.tasks.send_notification_email_chunk') as send_notification_email_chunk:
+            get_connection.return_value.__enter__.return_value.send_messages.side_effect = error
+            dispatch_outbox_batch()
+        return [(message, error) for message in send_notification_email_chunk.s.call_args[0][0]]
+
+    def test_failed_send_is_retried_through_the_outbox(self):
+        failed = self.dispatch_failing()
+
+        # the chunk task retries it first
+        entry = NotificationOutbox.objects.get()
+        self.assertEqual(entry.state, NotificationOutbox.OutboxState.SENDING)
+        self.assertEqual(entry.unsent, 1)
+        self.assertEqual(dispatch_outbox_batch(), 0)
+
+        # then the outbox
+        record_failed_messages(failed)
+        entry.refresh_from_db()
+        self.assertEqual(entry.state, NotificationOutbox.OutboxState.PENDING)
+        self.assertEqual(entry.last_error, 'Connection refused')
+        self.assertEqual(entry.deliveries.get().state, NotificationDelivery.DeliveryState.FAILED)
+
+        self.assertEqual(dispatch_outbox_batch(), 1)
+        entry.refresh_from_db()
+        self.assertEqual(entry.state, NotificationOutbox.OutboxState.SENT)
+        self.assertEqual(entry.attempts, 2)
+        self.assertEqual([message.to for message in mail.outbox], [['assignee@hi.com']])
+
+    @override_settings(NOTIFICATION_OUTBOX_MAX_ATTEMPTS=1)
+    def test_failed_send_fails_the_entry_after_the_last_attempt(self):
+        record_failed_messages(self.dispatch_failing())
+
+        entry = NotificationOutbox.objects.get()
+        self.assertEqual(entry.state, NotificationOutbox.OutboxState.FAILED)
+        self.assertIsNone(entry.sent_at)
+
+    def test_late_delivery_of_an_expired_claim_is_not_counted(self):
+        failed = self.dispatch_failing()
+        # the dispatcher died, and the entry was claimed again
+        NotificationOutbox.objects.update(updated=timezone.now() - datetime.timedelta(hours=1))
+        self.assertEqual(dispatch_outbox_batch(), 1)
+        self.assertEqual(NotificationOutbox.objects.get().state, NotificationOutbox.OutboxState.SENT)
+
+        record_failed_messages(failed)
+
+        entry = NotificationOutbox.objects.get()
+        self.assertEqual(entry.state, NotificationOutbox.OutboxState.SENT)
+        self.assertEqual(entry.last_error, '')
+
+    def test_comment_body_is_rendered_once_per_event(self):
+        other_participant = mommy.make(User, email='other@hi.com')
+        mommy.make(TaskComment, task=self.task, creator=other_participant, text='first')
+        comment = mommy.make(TaskComment, task=self.task, creator=self.commenter, text='second')
+
+        with mock.patch(
+            'collab_app.notifications.render_to_string',
+            wraps=notifications.render_to_string
+        ) as render:
+            emails = notifications.build_task_comment_created_emails(comment.id)
+
+        # creator, assignee and the other participant all get the same body.
+        self.assertEqual(len(emails), 3)
+        self.assertEqual(render.call_count, 1)
+        self.assertEqual(len(set(email.alternatives[0][0] for email in emails)), 1)
@@ -0,0 +1,219 @@
+import os
+import unittest
+from unittest import mock
+
+from django.test import override_settings
+from model_mommy import mommy
+
+from collab_app import board
+from collab_app.models import (
+    Membership,
+    Project,
+    Task,
+    TaskColumn,
+)
+from tests.mixins import BaseApiSetUp
+
+# the redis tests need a redis database they can empty, e.g. TEST_BOARD_REDIS_URL=redis://localhost:6379/15
+TEST_BOARD_REDIS_URL = os.environ.get('TEST_BOARD_REDIS_URL', '')
+
+
+class BoardTestCase(BaseApiSetUp):
+
+    def setUp(self):
+        super(BoardTestCase, self).setUp()
+        self.project = mommy.make(Project)
+        mommy.make(Membership, user=self.user, organization=self.project.organization)
+        self.task_column = TaskColumn.objects.get(project=self.project, name=TaskColumn.TASK_COLUMN_RAW_TASK)
+        self.done = TaskColumn.objects.get(project=self.project, name='Done')
+        self.tasks = [
+            mommy.make(
+                Task,
+                title=f'Task {i}',
+                has_target=False,
+                task_number=i,
+                project=self.project,
+                task_column=self.task_column,
+            )
+            for i in range(1, 5)
+        ]
+
+    def column_task_ids(self, task_column):
+        return list(Task.objects.filter(task_column=task_column).order_by('rank', 'id').values_list('id', flat=True))
+
+    def get_board_order(self):
+        response = self.client.get('/api/tasks/board_order/', {'project': self.project.id})
+        self.assertEqual(response.status_code, 200)
+        return {task_column['id']: task_column['task_ids'] for task_column in response.data['task_columns']}
+
+    def test_board_order(self):
+        board_order = self.get_board_order()
+
+        self.assertEqual(board_order[self.task_column.id], [task.id for task in self.tasks])
+        self.assertEqual(board_order[self.done.id], [])
+        self.assertEqual(len(board_order), len(TaskColumn.TASK_COLUMN_NAMES))
+
+    def test_board_order_needs_access(self):
+        other_project = mommy.make(Project)
+        response = self.client.get('/api/tasks/board_order/', {'project': other_project.id})
+        self.assertEqual(response.status_code, 400)
+
+    def test_write_column_order(self):
+        first, second, third, fourth = self.tasks
+
+        board.write_column_order(self.task_column.id, [fourth.id, first.id, second.id, third.id])
+
+        self.assertEqual(self.column_task_ids(self.task_column), [fourth.id, first.id, second.id, third.id])
+        self.assertEqual(
+            list(Task.objects.filter(task_column=self.task_column).order_by('rank').values_list('order', flat=True)),
+            [1, 2, 3, 4]
+        )
+        self.assertEqual(TaskColumn.objects.get(id=self.task_column.id).version, 1)
+        # nothing changes the second time
+        self.assertEqual(board.write_column_order(self.task_column.id, [fourth.id, first.id, second.id, third.id]), 0)
+
+
+@unittest.skipUnless(TEST_BOARD_REDIS_URL, 'TEST_BOARD_REDIS_URL is not set')
+@override_settings(BOARD_REDIS_URL=TEST_BOARD_REDIS_URL)
+class RedisBoardTestCase(BoardTestCase):
+
+    def setUp(self):
+        super(RedisBoardTestCase, self).setUp()
+        board._redis = None
+        board.get_redis().flushdb()
+        self.addCleanup(board.get_redis().flushdb)
+
+    def move(self, task, task_column, before=None, after=None):
+        return self.client.post('/api/tasks/move_task/', {
+            'task_id': task.id,
+            'task_column_id': task_column.id,
+            'before_id': before and before.id,
+            'after_id': after and after.id,
+        }, format='json')
+
+    def test_move_is_written_behind(self):
+        first, second, third, fourth = self.tasks
+        ranks_before = dict(Task.objects.values_list('id', 'rank'))
+
+        response = self.move(fourth, self.task_column, before=first, after=second)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get_board_order()[self.task_column.id], [first.id, fourth.id, second.id, third.id])
+        # postgres catches up when the order is flushed
+        self.assertEqual(dict(Task.objects.values_list('id', 'rank')), ranks_before)
+        self.assertEqual(board.flush_board_order(), 1)
+        self.assertEqual(self.column_task_ids(self.task_column), [first.id, fourth.id, second.id, third.id])
+
+    def test_move_to_another_column(self):
+        response = self.move(self.tasks[0], self.done)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Task.objects.get(id=self.tasks[0].id).task_column, self.done)
+        board_order = self.get_board_order()
+        self.assertEqual(board_order[self.done.id], [self.tasks[0].id])
+        self.assertEqual(board_order[self.task_column.id], [task.id for task in self.tasks[1:]])
+
+    def test_stale_neighbours_are_rejected(self):
+        first, second, third, fourth = self.tasks
+        self.move(fourth, self.task_column, before=first, after=second)
+
+        response = self.move(third, self.task_column, before=first, after=second)
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['task_columns'], [
+            {'id': self.task_column.id, 'task_ids': [first.id, fourth.id, second.id, third.id]}
+        ])
+
+    def test_reorder_syncs_the_columns(self):
+        first, second, third, fourth = self.tasks
+        self.move(fourth, self.task_column, before=first, after=second)
+
+        # a reorder written straight to postgres first writes the pending move
+        board.sync_columns([self.task_column.id])
+
+        self.assertEqual(self.column_task_ids(self.task_column), [first.id, fourth.id, second.id, third.id])
+
+    def test_a_move_in_redis_makes_older_versions_stale(self):
+        first, second, third, fourth = self.tasks
+        self.move(fourth, self.task_column, before=first, after=second)
+
+        # this client loaded the board before the move, which isn't in postgres yet
+        response = self.client.post('/api/tasks/reorder_tasks/', {
+            'tasks': [
+                {'id': task.id, 'project': self.project.id, 'task_column': self.task_column.id, 'order': order}
+                for order, task in enumerate([second, first, third, fourth], 1)
+            ],
+            'task_column_versions': {self.task_column.id: 0},
+        }, format='json')
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['task_columns'], [{'id': self.task_column.id, 'version': 1}])
+        self.assertEqual(
+            [task['id'] for task in response.data['tasks']],
+            [first.id, fourth.id, second.id, third.id]
+        )
+
+        response = self.client.post('/api/tasks/change_column_from_widget/', {
+            'task_id': first.id,
+            'task_column_id': self.done.id,
+            'task_column_versions': {self.task_column.id: 0},
+        }, format='json')
+        self.assertEqual(response.status_code, 409)
+
+    def test_moves_in_a_syncing_column_go_to_postgres(self):
+        first, second, third, fourth = self.tasks
+        self.get_board_order()
+
+        # the column is being written to postgres, and dropped from redis when that commits
+        board.sync_columns([self.task_column.id])
+        with self.assertRaises(board.ColumnSyncing):
+            board.move_task(fourth.id, self.task_column.id, self.task_column.id, first.id, second.id)
+
+        response = self.move(fourth, self.task_column, before=first, after=second)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.column_task_ids(self.task_column), [first.id, fourth.id, second.id, third.id])
+        self.assertNotIn(str(self.task_column.id), board.get_redis().smembers(board.DIRTY_KEY))
+
+    def test_a_flush_does_not_overwrite_a_reorder_made_meanwhile(self):
+        first, second, third, fourth = self.tasks
+        self.move(fourth, self.task_column, before=first, after=second)
+        lock_column = board.lock_column
+
+        def reorder_before_the_lock(task_column_id):
+            # a reorder writes the column between the flush taking the dirty set and locking the column. It
+            # doesn't see the column as dirty, and drops it from redis when it commits (run by hand here, the
+            # test's transaction never commits).
+            lock.side_effect = lock_column
+            response = self.client.post('/api/tasks/reorder_tasks/', [
+                {'id': task.id, 'project': self.project.id, 'task_column': self.task_column.id, 'order': order}
+                for order, task in enumerate([second, first, third, fourth], 1)
+            ], format='json')
+            self.assertEqual(response.status_code, 200)
+            board.get_redis().delete(board.column_key(task_column_id), board.syncing_key(task_column_id))
+            lock_column(task_column_id)
+
+        with mock.patch.object(board, 'lock_column', side_effect=reorder_before_the_lock) as lock:
+            board.flush_board_order()
+
+        self.assertEqual(self.column_task_ids(self.task_column), [second.id, first.id, third.id, fourth.id])
+
+    def test_a_flush_skips_syncing_columns(self):
+        first, second, third, fourth = self.tasks
+        self.move(fourth, self.task_column, before=first, after=second)
+        board.get_redis().sadd(board.syncing_key(self.task_column.id), 'token')
+
+        board.flush_board_order()
+
+        self.assertEqual(self.column_task_ids(self.task_column), [first.id, second.id, third.id, fourth.id])
+        # flushed once the sync is done, if it didn't commit
+        self.assertIn(str(self.task_column.id), board.get_redis().smembers(board.DIRTY_KEY))
+
+    def test_syncing_marks_are_cleared_on_commit(self):
+        board.forget_columns([self.task_column.id], 'token')
+        board.get_redis().sadd(board.syncing_key(self.task_column.id), 'token', 'other')
+
+        board.forget_columns([self.task_column.id], 'token')
+
+        # another sync of the column is still running
+        self.assertEqual(board.get_redis().smembers(board.syncing_key(self.task_column.id)), {'other'})
@@ -0,0 +1,60 @@
+from unittest import mock
+
+from model_mommy import mommy
+
+from collab_app.models import (
+    Membership,
+    Project,
+    Task,
+    TaskComment,
+    TaskMetadata,
+)
+from collab_app.permissions.object_level import OrganizationAccess, TaskCommentPermission
+from tests.mixins import BaseApiSetUp
+from tests.test_widget import make_submission
+
+
+class DenormalizedOrganizationTestCase(BaseApiSetUp):
+
+    def setUp(self):
+        super(DenormalizedOrganizationTestCase, self).setUp()
+        self.project = mommy.make(Project)
+        mommy.make(Membership, user=self.user, organization=self.project.organization)
+
+    def test_saving_copies_the_project_and_organization(self):
+        task = mommy.make(Task, title='one', has_target=False, project=self.project)
+        task_comment = mommy.make(TaskComment, task=task)
+        task_metadata = mommy.make(TaskMetadata, task=task)
+
+        self.assertEqual(task.organization_id, self.project.organization_id)
+        for row in (task_comment, task_metadata):
+            self.assertEqual(row.project_id, self.project.id)
+            self.assertEqual(row.organization_id, self.project.organization_id)
+
+    def test_the_task_actions_set_the_organization(self):
+        with mock.patch('collab_app.widget.group'):
+            response = self.client.post(
+                '/api/tasks/create_task_from_widget/',
+                make_submission('from the widget', project=self.project.id),
+                format='json'
+            )
+        self.assertEqual(response.status_code, 201)
+        task = Task.objects.get(title='from the widget')
+        self.assertEqual(task.organization_id, self.project.organization_id)
+        self.assertEqual(task.task_metadata.organization_id, self.project.organization_id)
+
+        response = self.client.post('/api/task_comments/create_task_comment/', {'task': task.id, 'text': 'hi'})
+        self.assertEqual(response.status_code, 201)
+        task_comment = TaskComment.objects.get(task=task)
+        self.assertEqual(
+            (task_comment.project_id, task_comment.organization_id),
+            (self.project.id, self.project.organization_id)
+        )
+
+    def test_permission_filters_need_no_join(self):
+        queryset = TaskCommentPermission().read(
+            TaskComment.objects.all(),
+            self.user,
+            OrganizationAccess.for_user(self.user)
+        )
+        self.assertNotIn('JOIN', str(queryset.query))
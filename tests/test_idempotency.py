@@ -0,0 +1,88 @@
+from django.core.cache import cache
+from model_mommy import mommy
+
+from collab_app.models import (
+    IdempotencyKey,
+    Project,
+    Task,
+    TaskDataUrl,
+)
+from tests.mixins import BaseApiSetUp
+from tests.test_widget import make_submission
+
+
+class IdempotencyTestCase(BaseApiSetUp):
+
+    def setUp(self):
+        super(IdempotencyTestCase, self).setUp()
+        self.project = mommy.make(Project)
+        self.client.logout()
+        cache.clear()
+
+    def submit(self, key, title='one', project=None):
+        submission = make_submission(title, project_key=(project or self.project).key)
+        submission['data_url'] = 'data:image/png;base64,aGk='
+        return self.client.post(
+            '/api/tasks/create_task_from_widget_anonymous/',
+            submission,
+            format='json',
+            HTTP_IDEMPOTENCY_KEY=key
+        )
+
+    def test_retry_returns_the_original_response(self):
+        response = self.submit('abc')
+        self.assertEqual(response.status_code, 201)
+
+        with self.assertNumQueries(0):
+            retry = self.submit('abc')
+
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry.data, response.data)
+        self.assertEqual(Task.objects.count(), 1)
+        self.assertEqual(TaskDataUrl.objects.count(), 1)
+
+    def test_retry_falls_back_to_the_database(self):
+        response = self.submit('abc')
+        cache.clear()
+
+        retry = self.submit('abc')
+
+        self.assertEqual(retry.data, response.data)
+        self.assertEqual(Task.objects.count(), 1)
+
+    def test_different_keys_create_different_tasks(self):
+        self.submit('abc')
+        self.submit('def', title='two')
+        self.submit('ghi')
+        self.assertEqual(Task.objects.count(), 3)
+
+    def test_same_key_for_different_projects_creates_both_tasks(self):
+        other_project = mommy.make(Project)
+        self.assertEqual(self.submit('abc').status_code, 201)
+        self.assertEqual(self.submit('abc', project=other_project).status_code, 201)
+        self.assertEqual(Task.objects.filter(project=self.project).count(), 1)
+        self.assertEqual(Task.objects.filter(project=other_project).count(), 1)
+
+    def test_same_key_for_a_different_request_is_rejected(self):
+        self.submit('abc')
+
+        response = self.submit('abc', title='two')
+        self.assertEqual(response.status_code, 422)
+
+        cache.clear()
+        response = self.submit('abc', title='two')
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Task.objects.count(), 1)
+
+    def test_failed_request_does_not_keep_the_key(self):
+        submission = make_submission('one', project_key='wrong')
+        response = self.client.post(
+            '/api/tasks/create_task_from_widget_anonymous/',
+            submission,
+            format='json',
+            HTTP_IDEMPOTENCY_KEY='abc'
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(IdempotencyKey.objects.exists())
+        self.assertEqual(self.submit('abc').status_code, 201)
@@ -0,0 +1,68 @@
+from unittest import mock
+
+from django.core import mail
+from django.test import TestCase, override_settings
+
+from collab_app import tasks
+from collab_app.models import NotificationOutbox
+from collab_app.notifications import (
+    chunk_messages,
+    fan_out_messages,
+)
+
+
+def make_message(to):
+    return {'outbox_id': None, 'to': to, 'subject': 'Hi', 'text_body': 'Hi', 'html_body': '<p>Hi</p>'}
+
+
+@override_settings(NOTIFICATION_FANOUT_CHUNK_SIZE=2, NOTIFICATION_FANOUT_MAX_CHUNKS=3)
+class FanOutTestCase(TestCase):
+
+    def test_chunks_keep_a_recipients_messages_together(self):
+        messages = [make_message(to) for to in ['a@hi.com', 'b@hi.com', 'a@hi.com', 'c@hi.com']]
+        chunks = chunk_messages(messages)
+        self.assertEqual(
+            [[message['to'] for message in chunk] for chunk in chunks],
+            [['a@hi.com', 'a@hi.com', 'b@hi.com'], ['c@hi.com']]
+        )
+
+    def test_chunk_count_is_capped(self):
+        messages = [make_message(f'{i}@hi.com') for i in range(10)]
+        chunks = chunk_messages(messages)
+        self.assertEqual(len(chunks), 3)
+        self.assertEqual(sum(len(chunk) for chunk in chunks), 10)
+
+    def test_small_fan_out_is_sent_right_away(self):
+        fan_out_messages([make_message('a@hi.com'), make_message('b@hi.com')])
+        self.assertEqual([email.to for email in mail.outbox], [['a@hi.com'], ['b@hi.com']])
+
+    def test_large_fan_out_is_sent_as_a_group_on_commit(self):
+        with mock.patch('collab_app.notifications.group') as group, \
+                mock.patch('collab_app.notifications.transaction.on_commit') as on_commit:
+            fan_out_messages([make_message(f'{i}@hi.com') for i in range(5)])
+
+        self.assertEqual(len(mail.outbox), 0)
+        on_commit.assert_called_once_with(group.return_value.apply_async)
+        self.assertEqual(len(list(group.call_args[0][0])), 3)
+
+
+class DeprecatedNotificationTaskTestCase(TestCase):
+
+    def test_queued_notification_tasks_go_to_the_outbox(self):
+        # messages queued before the outbox was deployed
+        tasks.notify_participants_of_task(1)
+        tasks.notify_participants_of_task_comment(2)
+        tasks.notify_participants_of_assignee_change(3)
+        tasks.notify_participants_of_task_column_change(4, 5, 6, 7)
+
+        self.assertEqual(
+            list(NotificationOutbox.objects.order_by('id').values_list('event', 'payload')),
+            [
+                (NotificationOutbox.EventType.TASK_CREATED, {'task_id': 1}),
+                (NotificationOutbox.EventType.TASK_COMMENT_CREATED, {'task_comment_id': 2}),
+                (NotificationOutbox.EventType.ASSIGNEE_CHANGED, {'task_id': 3}),
+                (NotificationOutbox.EventType.TASK_COLUMN_CHANGED, {
+                    'task_id': 4, 'prev_task_column_id': 5, 'new_task_column_id': 6, 'mover_id': 7
+                }),
+            ]
+        )
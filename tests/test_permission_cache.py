@@ -0,0 +1,106 @@
+import json
+import os
+import unittest
+from unittest import mock
+
+import redis
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from model_mommy import mommy
+
+from collab_app.models import (
+    Membership,
+    Organization,
+    Project,
+)
+from collab_app.permissions import cache as permission_cache
+from tests.mixins import BaseApiSetUp
+
+
+# the tests need a redis database they can empty, e.g. TEST_PERMISSION_CACHE_REDIS_URL=redis://localhost:6379/14
+TEST_PERMISSION_CACHE_REDIS_URL = os.environ.get('TEST_PERMISSION_CACHE_REDIS_URL', '')
+
+
+@unittest.skipUnless(TEST_PERMISSION_CACHE_REDIS_URL, 'TEST_PERMISSION_CACHE_REDIS_URL is not set')
+@override_settings(PERMISSION_CACHE_REDIS_URL=TEST_PERMISSION_CACHE_REDIS_URL)
+class PermissionCacheTestCase(BaseApiSetUp):
+
+    def setUp(self):
+        super(PermissionCacheTestCase, self).setUp()
+        permission_cache._redis = None
+        permission_cache._local_cache.clear()
+        permission_cache.get_redis().flushdb()
+        self.addCleanup(permission_cache._local_cache.clear)
+        self.addCleanup(permission_cache.get_redis().flushdb)
+
+        self.organization = mommy.make(Organization)
+        mommy.make(Membership, user=self.user, organization=self.organization)
+
+    def get_organization_ids(self):
+        # returns the organization ids and the number of times the user's access was read from the database
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/api/organizations')
+        self.assertEqual(response.status_code, 200)
+        return (
+            [organization['id'] for organization in json.loads(response.content)['organizations']],
+            len([
+                query for query in context.captured_queries
+                if query['sql'].startswith('SELECT "collab_app_membership"."organization_id"')
+            ])
+        )
+
+    def test_access_is_read_once_across_requests(self):
+        self.assertEqual(self.get_organization_ids(), ([self.organization.id], 1))
+        self.assertEqual(self.get_organization_ids(), ([self.organization.id], 0))
+
+        # another process has no local copy, and reads it from redis
+        permission_cache._local_cache.clear()
+        self.assertEqual(self.get_organization_ids(), ([self.organization.id], 0))
+
+    def test_membership_changes_invalidate_the_access(self):
+        self.get_organization_ids()
+        other_organization = mommy.make(Organization)
+        membership = mommy.make(Membership, user=self.user, organization=other_organization)
+        self.assertEqual(
+            sorted(self.get_organization_ids()[0]),
+            sorted([self.organization.id, other_organization.id])
+        )
+
+        membership.delete()
+        self.assertEqual(self.get_organization_ids(), ([self.organization.id], 1))
+
+    def test_creating_a_project_invalidates_its_members_access(self):
+        self.get_organization_ids()
+        project = mommy.make(Project, organization=self.organization)
+
+        response = self.client.post('/api/tasks/create_task/', {
+            'project': project.id,
+            'task_column': project.task_columns.get(name='To-Do').id,
+            'title': 'New task',
+            'target_dom_path': 'body',
+        })
+        self.assertEqual(response.status_code, 201)
+
+    def test_falls_back_to_the_database_when_redis_is_down(self):
+        with mock.patch.object(permission_cache, 'get_redis', side_effect=redis.ConnectionError):
+            self.assertEqual(self.get_organization_ids(), ([self.organization.id], 1))
+            self.assertEqual(self.get_organization_ids(), ([self.organization.id], 1))
+
+    def test_a_lost_version_does_not_match_old_entries(self):
+        # cached under version 0, in this process too
+        permission_cache.get_redis().flushdb()
+        self.assertEqual(permission_cache.get_access(self.user.id, lambda: 'old'), 'old')
+        # the version is bumped, then lost in a restart of redis: it starts again from 0
+        permission_cache.bump_versions([self.user.id])
+        permission_cache.get_redis().flushdb()
+
+        self.assertEqual(permission_cache.get_access(self.user.id, lambda: 'new'), 'new')
+
+    def test_a_failed_invalidation_drops_the_local_entries(self):
+        self.get_organization_ids()
+        with mock.patch.object(permission_cache, 'get_redis', side_effect=redis.ConnectionError):
+            Membership.objects.filter(user=self.user).delete()
+            permission_cache.invalidate([self.user.id])
+
+        self.assertEqual(permission_cache._local_cache, {})
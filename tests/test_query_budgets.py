@@ -0,0 +1,237 @@
+from unittest import mock
+
+from allauth.account.models import EmailAddress
+from django.core.cache import cache
+from model_mommy import mommy
+
+from collab_app.models import (
+    Membership,
+    Organization,
+    Project,
+    Task,
+    TaskColumn,
+    TaskComment,
+    TaskMetadata,
+    User,
+)
+from collab_app.models.lookup import _lookup_cache
+from tests.mixins import BaseApiSetUp
+from tests.test_widget import make_submission
+
+
+class TaskActionQueryBudgetTestCase(BaseApiSetUp):
+
+    """
+    The custom task actions run a fixed number of queries. If one of these fails, a query was added to a
+    hot path: make sure it is needed before raising the budget.
+    """
+
+    def setUp(self):
+        super(TaskActionQueryBudgetTestCase, self).setUp()
+        cache.clear()
+        self.project = mommy.make(Project)
+        mommy.make(Membership, user=self.user, organization=self.project.organization)
+        self.raw_task = TaskColumn.objects.get(project=self.project, name=TaskColumn.TASK_COLUMN_RAW_TASK)
+        self.done = TaskColumn.objects.get(project=self.project, name='Done')
+        self.task = mommy.make(
+            Task,
+            title='one',
+            has_target=False,
+            project=self.project,
+            task_column=self.raw_task,
+            task_number=Project.next_task_number(self.project.id)
+        )
+
+    def warm_caches(self):
+        # what a running server has cached after its first widget request: the lookups, the project key
+        # and the Raw Task column id
+        with mock.patch('collab_app.widget.group'):
+            self.client.post(
+                '/api/tasks/create_task_from_widget/',
+                make_submission('warm up', project=self.project.id),
+                format='json'
+            )
+        # lookups are only cached on commit, which never happens in a test case
+        self.addCleanup(_lookup_cache.clear)
+        for field_name in TaskMetadata.LOOKUP_FIELDS:
+            lookup_model = TaskMetadata._meta.get_field(field_name).related_model
+            lookup_model.objects._remember(dict(lookup_model.objects.values_list('value', 'id')))
+
+    def test_change_column_from_widget(self):
+        # the task, locking the columns, the end of the column, the update, the column versions and the
+        # notification, plus the savepoint
+        with self.assertNumQueries(8):
+            response = self.client.post('/api/tasks/change_column_from_widget/', {
+                'task_id': self.task.id,
+                'task_column_id': self.done.id,
+            }, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['task']['task_column'], self.done.id)
+
+    def test_change_column_checks_the_column_project(self):
+        other_column = mommy.make(TaskColumn)
+        response = self.client.post('/api/tasks/change_column_from_widget/', {
+            'task_id': self.task.id,
+            'task_column_id': other_column.id,
+        }, format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.task_column, self.raw_task)
+
+    def test_create_task_from_widget(self):
+        self.warm_caches()
+
+        # the access check, the task number, the end of the column, the task, notification and metadata
+        # inserts, plus the savepoint
+        with mock.patch('collab_app.widget.group'), self.assertNumQueries(8):
+            response = self.client.post(
+                '/api/tasks/create_task_from_widget/',
+                make_submission('two', project=self.project.id),
+                format='json'
+            )
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['task']['task_comments'], [])
+        self.assertEqual(response.data['task_metadata']['browser_name'], 'chrome')
+
+    def test_create_task(self):
+        # the access check, the project's columns (cached after the first request), the task number, the end of
+        # the column, the task and notification inserts, plus the savepoint
+        with self.assertNumQueries(8):
+            response = self.client.post('/api/tasks/create_task/', {
+                'project': self.project.id,
+                'task_column': self.raw_task.id,
+                'title': 'two',
+                'target_dom_path': 'body',
+            }, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['task']['task_comments'], [])
+        self.assertIsNone(response.data['task']['task_metadata'])
+
+    def test_move_task(self):
+        # the task, locking the columns, the bottom of the column, the update, the column versions and the
+        # notification, plus the savepoint
+        with self.assertNumQueries(8):
+            response = self.client.post('/api/tasks/move_task/', {
+                'task_id': self.task.id,
+                'task_column_id': self.done.id,
+            }, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['task']['task_column'], self.done.id)
+
+    def test_update_assignee(self):
+        # the task, the assignee's membership, the update and the notification, plus the savepoint
+        with self.assertNumQueries(6):
+            response = self.client.post('/api/tasks/update_assignee/', {
+                'task_id': self.task.id,
+                'assigned_to_id': self.user.id,
+            }, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['task'], {'id': self.task.id, 'assigned_to': self.user.id})
+
+    def test_create_task_comment(self):
+        # the access check, the comment and notification inserts, plus the savepoint
+        with self.assertNumQueries(5):
+            response = self.client.post('/api/task_comments/create_task_comment/', {
+                'task': self.task.id,
+                'text': 'hi',
+            }, format='json')
+
+        self.assertEqual(response.status_code, 201)
+
+
+class TaskListQueryBudgetTestCase(BaseApiSetUp):
+
+    """
+    Display names are read with the tasks and comments, whatever their number, without loading the users.
+    """
+
+    def setUp(self):
+        super(TaskListQueryBudgetTestCase, self).setUp()
+        self.project = mommy.make(Project)
+        mommy.make(Membership, user=self.user, organization=self.project.organization)
+        self.creator = mommy.make(User, first_name='Ada', last_name='Lovelace')
+        for i in range(3):
+            task = mommy.make(
+                Task,
+                title='one',
+                has_target=False,
+                project=self.project,
+                creator=self.creator,
+                assigned_to=self.user if i else None
+            )
+            mommy.make(TaskComment, task=task, creator=self.creator)
+        mommy.make(
+            Task,
+            title='from the widget',
+            has_target=False,
+            project=self.project,
+            creator=None,
+            one_off_email_set_by='visitor@example.com'
+        )
+
+    def test_full_names(self):
+        # the access, the tasks and their comments
+        with self.assertNumQueries(3):
+            response = self.client.get(
+                f'/api/tasks?filter{{project}}={self.project.id}&include[]=creator_full_name'
+                '&include[]=assigned_to_full_name&include[]=task_comments.creator_full_name'
+            )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('users', response.data)
+        user_name = f'{self.user.first_name} {self.user.last_name}'
+        self.assertEqual(
+            sorted((task['creator_full_name'], task['assigned_to_full_name']) for task in response.data['tasks']),
+            [
+                ('Ada Lovelace', ''),
+                ('Ada Lovelace', user_name),
+                ('Ada Lovelace', user_name),
+                ('visitor@example.com', ''),
+            ]
+        )
+        # the creator isn't in the user's organization: their user can't be read, but their name is shown
+        self.assertEqual(
+            [comment['creator_full_name'] for comment in response.data['task_comments']],
+            ['Ada Lovelace'] * 3
+        )
+
+
+class UserListQueryBudgetTestCase(BaseApiSetUp):
+
+    """
+    Whether the users' emails are verified is read with the users, whatever their number.
+    """
+
+    def setUp(self):
+        super(UserListQueryBudgetTestCase, self).setUp()
+        organization = mommy.make(Organization)
+        self.members = [self.user] + mommy.make(User, _quantity=4)
+        for i, member in enumerate(self.members):
+            mommy.make(Membership, user=member, organization=organization)
+            mommy.make(EmailAddress, user=member, email=member.email, verified=bool(i % 2))
+
+    def test_email_verified(self):
+        # the access and the users
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/users?include[]=email_verified')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            {user['id']: user['email_verified'] for user in response.data['users']},
+            {member.id: bool(i % 2) for i, member in enumerate(self.members)}
+        )
+
+    def test_email_verified_of_sideloaded_users(self):
+        # the access, the memberships and their users
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/memberships?include[]=user.email_verified')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['users']), 5)
+        self.assertEqual(sum(user['email_verified'] for user in response.data['users']), 2)
@@ -0,0 +1,149 @@
+import json
+import unittest
+from unittest import mock
+
+from django.db import DatabaseError, connection, transaction
+from django.test import override_settings
+from model_mommy import mommy
+
+from collab_app.models import (
+    Invite,
+    Membership,
+    Organization,
+    Project,
+    Task,
+    TaskComment,
+    TaskMetadata,
+    User,
+)
+from collab_app.permissions import row_level_security
+from collab_app.permissions.object_level import BaseQuerySetPermission, OrganizationAccess
+from collab_app.views import TaskViewSet
+from tests.mixins import BaseApiSetUp
+
+
+ENDPOINTS = (
+    '/api/invites',
+    '/api/memberships?include[]=user.*&include[]=organization.*',
+    '/api/organizations?include[]=projects.*',
+    '/api/profiles',
+    '/api/projects',
+    '/api/tasks?include[]=creator.*&include[]=task_metadata.*&include[]=task_comments.*',
+    '/api/task_comments?include[]=task.*',
+    '/api/task_metadata',
+    '/api/users?include[]=memberships.*',
+    '/api/users/me',
+)
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'row-level security needs postgres')
+class RowLevelSecurityParityTestCase(BaseApiSetUp):
+
+    """
+    Row-level security mode must read exactly what the permission filters read.
+    """
+
+    def setUp(self):
+        super(RowLevelSecurityParityTestCase, self).setUp()
+        try:
+            with transaction.atomic():
+                row_level_security.enable()
+        except DatabaseError as err:
+            self.skipTest(f'Could not install the policies: {err}')
+
+        # the user is in two organizations, and sees nothing of a third
+        self.u2, self.u3 = mommy.make(User, _quantity=2)
+        for organization, members in (
+            (mommy.make(Organization), [self.user, self.u2]),
+            (mommy.make(Organization), [self.user]),
+            (mommy.make(Organization), [self.u2, self.u3]),
+        ):
+            for member in members:
+                mommy.make(Membership, organization=organization, user=member)
+            mommy.make(Invite, organization=organization, inviter=members[0], key=f'key-{organization.id}')
+            project = mommy.make(Project, organization=organization)
+            for creator in members:
+                task = mommy.make(Task, project=project, creator=creator, title='Fix', has_target=False)
+                mommy.make(TaskComment, task=task, creator=creator)
+                mommy.make(TaskMetadata, task=task)
+
+    def get(self, url, row_level_security):
+        with override_settings(PERMISSION_ROW_LEVEL_SECURITY=row_level_security):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+        # {resource: sorted ids}. The order of unordered lists can differ between the two plans.
+        return {
+            resource: sorted(row['id'] for row in (rows if isinstance(rows, list) else [rows]))
+            for resource, rows in json.loads(response.content).items()
+            if resource != 'meta'
+        }
+
+    def test_the_policies_match_the_read_permissions(self):
+        access = OrganizationAccess.for_user(self.user)
+        for model, permission in BaseQuerySetPermission.object_perm_mapping.items():
+            expected = set(permission.read(model.objects.all(), self.user, access).values_list('id', flat=True))
+            with transaction.atomic():
+                row_level_security.scope(self.user.id, access.organization_ids)
+                visible = set(model.objects.values_list('id', flat=True))
+                row_level_security.unscope()
+            self.assertEqual(visible, expected, model.__name__)
+
+    def test_the_endpoints_return_the_same_rows_in_both_modes(self):
+        for user in (self.user, self.u3, mommy.make(User)):
+            self.client.force_authenticate(user=user)
+            for url in ENDPOINTS:
+                self.assertEqual(self.get(url, row_level_security=1), self.get(url, row_level_security=0), url)
+
+    def assertUnscoped(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT current_user = session_user, current_setting('collab.organization_ids', true)")
+            self.assertIn(cursor.fetchone(), [(True, ''), (True, None)])
+        self.assertEqual(Task.objects.count(), 5)
+
+    def test_the_connection_is_unscoped_after_the_request(self):
+        self.get('/api/tasks', row_level_security=1)
+        self.assertUnscoped()
+
+    def test_the_connection_is_unscoped_after_the_view_raised(self):
+        # re-raised by Rest Framework's `handle_exception`, so `finalize_response` isn't called
+        with mock.patch.object(TaskViewSet, 'list', side_effect=RuntimeError('boom')):
+            with override_settings(PERMISSION_ROW_LEVEL_SECURITY=1):
+                with self.assertRaises(RuntimeError):
+                    self.client.get('/api/tasks')
+        self.assertUnscoped()
+
+
+class RowLevelSecurityTransactionTestCase(BaseApiSetUp):
+
+    """
+    The scope of a request is set in a transaction around it, so it ends with the request even when the view
+    raises. Runs on any database, with the SQL mocked.
+    """
+
+    def test_the_request_is_scoped_in_a_transaction_that_ends_with_it(self):
+        # the test's own transaction is open already: the request's is a savepoint of it
+        savepoints = len(connection.savepoint_ids)
+        scoped_in = []
+        with mock.patch.object(row_level_security, 'is_enabled', return_value=True), \
+                mock.patch.object(row_level_security, 'applies_to', return_value=True), \
+                mock.patch.object(row_level_security, 'unscope') as unscope, \
+                mock.patch.object(
+                    row_level_security, 'scope', side_effect=lambda *args: scoped_in.append(connection.savepoint_ids[:])
+                ), \
+                mock.patch.object(TaskViewSet, 'list', side_effect=RuntimeError('boom')):
+            with self.assertRaises(RuntimeError):
+                self.client.get('/api/tasks')
+
+        self.assertEqual(len(scoped_in), 1)
+        self.assertEqual(len(scoped_in[0]), savepoints + 1)
+        # rolled back with the scope, so there's nothing left to reset
+        self.assertEqual(len(connection.savepoint_ids), savepoints)
+        unscope.assert_not_called()
+
+        with mock.patch.object(row_level_security, 'is_enabled', return_value=True), \
+                mock.patch.object(row_level_security, 'applies_to', return_value=True), \
+                mock.patch.object(row_level_security, 'scope'), \
+                mock.patch.object(row_level_security, 'unscope') as unscope:
+            self.assertEqual(self.client.get('/api/tasks').status_code, 200)
+        # released into the test's transaction, which goes on
+        unscope.assert_called_once_with()
@@ -0,0 +1,92 @@
+import json
+from unittest import mock
+
+from django.test import override_settings
+from model_mommy import mommy
+
+from collab_app.models import (
+    Membership,
+    Project,
+    Task,
+    TaskColumn,
+    TaskComment,
+    TaskMetadata,
+    User,
+)
+from collab_app.serializers import TaskSerializer
+from tests.mixins import BaseApiSetUp
+
+
+QUERIES = (
+    '',
+    '&include[]=creator_full_name&include[]=assigned_to_full_name',
+    '&include[]=task_comments&include[]=task_metadata',
+    '&include[]=assigned_to&include[]=creator&include[]=project&include[]=task_column',
+    '&include[]=task_comments&exclude[]=description&exclude[]=title',
+    ''.join(f'&include[]={field}' for field in TaskSerializer.Meta.deferred_fields),
+    '&per_page=2',
+    '&per_page=2&page=2&include[]=task_comments',
+)
+
+
+class TaskListFastPathTestCase(BaseApiSetUp):
+
+    """
+    The fast path must render exactly what the serializer renders.
+    """
+
+    def setUp(self):
+        super(TaskListFastPathTestCase, self).setUp()
+        self.project = mommy.make(Project)
+        mommy.make(Membership, user=self.user, organization=self.project.organization)
+        task_column = TaskColumn.objects.filter(project=self.project).first()
+        self.former_member = mommy.make(User, first_name='Ada', last_name='Lovelace')
+        for creator, assigned_to in (
+            (self.user, None),
+            (self.user, self.former_member),
+            (self.former_member, self.user),
+            (None, None),
+        ):
+            task = mommy.make(
+                Task,
+                title='Fix',
+                has_target=False,
+                project=self.project,
+                task_column=task_column,
+                creator=creator,
+                assigned_to=assigned_to,
+                one_off_email_set_by='' if creator else 'visitor@example.com'
+            )
+            if creator:
+                mommy.make(TaskComment, task=task, creator=creator, _quantity=2)
+                mommy.make(TaskMetadata, task=task)
+        # tasks of another organization's project are never listed
+        mommy.make(Task, title='Fix', has_target=False, project=mommy.make(Project))
+
+    def get(self, url, fast_path):
+        with override_settings(TASK_LIST_FAST_PATH=fast_path):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+        content = json.loads(response.content)
+        # the order of unordered lists can differ between the two queries
+        for task in content['tasks']:
+            if 'task_comments' in task:
+                task['task_comments'].sort()
+        content['tasks'].sort(key=lambda task: task['id'])
+        return content
+
+    def test_the_fast_path_renders_what_the_serializer_renders(self):
+        for query in QUERIES:
+            url = f'/api/tasks?filter{{project}}={self.project.id}{query}'
+            with mock.patch.object(TaskSerializer, 'to_representation', side_effect=AssertionError):
+                fast = self.get(url, fast_path=1)
+            self.assertEqual(fast, self.get(url, fast_path=0), url)
+
+    def test_other_requests_go_through_the_serializer(self):
+        for query in ('&include[]=creator.*', '&sort[]=order', '&filter{is_resolved}=true', '&include[]=*'):
+            url = f'/api/tasks?filter{{project}}={self.project.id}{query}'
+            self.assertEqual(self.get(url, fast_path=1), self.get(url, fast_path=0), url)
+
+    def test_projects_of_other_organizations_are_empty(self):
+        other_project = Task.objects.exclude(project=self.project).get().project
+        self.assertEqual(self.get(f'/api/tasks?filter{{project}}={other_project.id}', fast_path=1), {'tasks': []})
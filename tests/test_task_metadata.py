@@ -0,0 +1,125 @@
+from unittest import mock
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from model_mommy import mommy
+
+from collab_app.models import (
+    BrowserName,
+    Membership,
+    Project,
+    Task,
+    TaskMetadata,
+    UrlOrigin,
+)
+from collab_app.models.lookup import LookupManager, _lookup_cache
+from collab_app.serializers import TaskMetadataSerializer
+from tests.mixins import BaseApiSetUp
+from tests.test_widget import make_submission
+
+
+class TaskMetadataLookupTestCase(BaseApiSetUp):
+
+    def setUp(self):
+        super(TaskMetadataLookupTestCase, self).setUp()
+        self.project = mommy.make(Project)
+        self.client.logout()
+
+    def test_repeated_values_are_stored_once(self):
+        submissions = [make_submission(f'Task {i}', project_key=self.project.key) for i in range(3)]
+        submissions[2]['task_metadata']['browser_name'] = 'firefox'
+
+        response = self.client.post(
+            '/api/tasks/create_tasks_from_widget_anonymous/',
+            {'tasks': submissions},
+            format='json'
+        )
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            [task_metadata['browser_name'] for task_metadata in response.data['task_metadatas']],
+            ['chrome', 'chrome', 'firefox']
+        )
+        self.assertEqual(sorted(BrowserName.objects.values_list('value', flat=True)), ['chrome', 'firefox'])
+        self.assertEqual(UrlOrigin.objects.count(), 1)
+        self.assertEqual(
+            TaskMetadata.objects.values('browser_name').distinct().count(), 2
+        )
+
+    def test_serializer_returns_the_values(self):
+        task_metadata = mommy.make(
+            TaskMetadata,
+            task=mommy.make(Task, title='A task', has_target=False, task_number=1, project=self.project),
+            url_origin_id=UrlOrigin.objects.id_for('https://hi.com'),
+            browser_name_id=BrowserName.objects.id_for('safari'),
+        )
+
+        data = TaskMetadataSerializer(task_metadata).data
+
+        self.assertEqual(data['url_origin'], 'https://hi.com')
+        self.assertEqual(data['browser_name'], 'safari')
+
+    def test_id_for_gets_or_creates(self):
+        self.assertEqual(BrowserName.objects.id_for('edge'), BrowserName.objects.id_for('edge'))
+        self.assertEqual(BrowserName.objects.id_for(None), BrowserName.objects.get(value='').id)
+
+    def test_id_for_evicts_the_least_recently_used_values(self):
+        self.addCleanup(_lookup_cache.clear)
+        ids = {value: BrowserName.objects.id_for(value) for value in ['chrome', 'edge', 'firefox']}
+        with mock.patch.object(LookupManager, 'max_cached', 2):
+            BrowserName.objects._remember({'chrome': ids['chrome'], 'edge': ids['edge']})
+            BrowserName.objects.id_for('chrome')
+            BrowserName.objects._remember({'firefox': ids['firefox']})
+
+        self.assertEqual(BrowserName.objects._cache()['ids'], {'chrome': ids['chrome'], 'firefox': ids['firefox']})
+        self.assertEqual(list(BrowserName.objects._cache()['values']), [ids['chrome'], ids['firefox']])
+
+
+class TaskMetadataListTestCase(BaseApiSetUp):
+
+    def setUp(self):
+        super(TaskMetadataListTestCase, self).setUp()
+        self.project = mommy.make(Project)
+        mommy.make(Membership, user=self.user, organization=self.project.organization)
+        url_origin_id = UrlOrigin.objects.id_for('https://hi.com')
+        for i, browser_name in enumerate(['safari', 'chrome', 'firefox', 'chrome']):
+            mommy.make(
+                TaskMetadata,
+                task=mommy.make(Task, title='A task', has_target=False, task_number=i + 1, project=self.project),
+                url_origin_id=url_origin_id,
+                browser_name_id=BrowserName.objects.id_for(browser_name),
+            )
+
+    def get(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+        return [task_metadata['browser_name'] for task_metadata in response.data['task_metadata']]
+
+    def test_each_lookup_table_is_read_once_per_page(self):
+        # the lookups aren't cached: they were created in this (never committed) transaction
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(sorted(self.get('/api/task_metadata')), ['chrome', 'chrome', 'firefox', 'safari'])
+
+        lookup_queries = [
+            query['sql'] for query in context.captured_queries
+            if f'FROM "{BrowserName._meta.db_table}"' in query['sql']
+        ]
+        self.assertEqual(len(lookup_queries), 1)
+
+    def test_filters_and_sorts_on_the_value(self):
+        self.assertEqual(self.get('/api/task_metadata?filter{browser_name}=chrome'), ['chrome', 'chrome'])
+        self.assertEqual(
+            sorted(self.get('/api/task_metadata?filter{browser_name.in}=safari&filter{browser_name.in}=firefox')),
+            ['firefox', 'safari']
+        )
+        self.assertEqual(self.get('/api/task_metadata?filter{-browser_name}=chrome&sort[]=browser_name'), [
+            'firefox', 'safari'
+        ])
+        self.assertEqual(
+            self.get('/api/task_metadata?sort[]=-browser_name'),
+            ['safari', 'firefox', 'chrome', 'chrome']
+        )
+
+        # through a relation
+        response = self.client.get('/api/tasks?filter{task_metadata.browser_name}=firefox')
+        self.assertEqual(len(response.data['tasks']), 1)
@@ -0,0 +1,51 @@
+from model_mommy import mommy
+
+from collab_app.models import (
+    Membership,
+    Project,
+    Task,
+    TaskColumn,
+)
+from tests.mixins import BaseApiSetUp
+
+
+class TaskNumberTestCase(BaseApiSetUp):
+
+    def setUp(self):
+        super(TaskNumberTestCase, self).setUp()
+        self.project = mommy.make(Project)
+        self.other_project = mommy.make(Project)
+        mommy.make(Membership, user=self.user, organization=self.project.organization)
+        self.task_column = TaskColumn.objects.get(project=self.project, name=TaskColumn.TASK_COLUMN_RAW_TASK)
+
+    def create_task(self, title):
+        return self.client.post('/api/tasks/create_task/', {
+            'project': self.project.id,
+            'task_column': self.task_column.id,
+            'title': title,
+            'target_dom_path': 'body',
+        }, format='json')
+
+    def test_task_numbers_come_from_the_project_counter(self):
+        self.assertEqual(self.create_task('one').status_code, 201)
+        self.assertEqual(self.create_task('two').status_code, 201)
+
+        self.assertEqual(
+            list(Task.objects.filter(project=self.project).order_by('id').values_list('task_number', flat=True)),
+            [1, 2]
+        )
+        self.project.refresh_from_db()
+        self.assertEqual(self.project.last_task_number, 2)
+
+    def test_counters_are_per_project(self):
+        self.assertEqual(Project.next_task_number(self.project.id), 1)
+        self.assertEqual(Project.next_task_number(self.other_project.id), 1)
+        self.assertEqual(Project.next_task_number(self.project.id), 2)
+
+    def test_a_missing_project_has_no_counter(self):
+        missing_project_id = Project.objects.order_by('-id').values_list('id', flat=True).first() + 1
+
+        with self.assertRaises(Project.DoesNotExist):
+            Project.next_task_number(missing_project_id)
+        with self.assertRaises(Project.DoesNotExist):
+            Project.reserve_task_numbers(missing_project_id, 3)
@@ -0,0 +1,329 @@
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+from model_mommy import mommy
+
+from collab_app.models import (
+    Membership,
+    Project,
+    Task,
+    TaskColumn,
+)
+from collab_app.ranking import (
+    evenly_spaced_ranks,
+    rank_between,
+)
+from collab_app.tasks import rebalance_task_column
+from tests.mixins import BaseApiSetUp
+from tests.test_widget import make_submission
+
+
+class RankingTestCase(SimpleTestCase):
+
+    def test_rank_between(self):
+        self.assertEqual(rank_between(None, None), 'i')
+        self.assertTrue('a' < rank_between('a', 'b') < 'b')
+        self.assertTrue('a' < rank_between('a', 'a1') < 'a1')
+        self.assertTrue(rank_between(None, '1') < '1')
+        self.assertTrue('zz' < rank_between('zz', None))
+
+    def test_repeated_inserts_stay_ordered(self):
+        ranks = ['1', '2']
+        for _ in range(50):
+            ranks.insert(1, rank_between(ranks[0], ranks[1]))
+        self.assertEqual(ranks, sorted(ranks))
+        self.assertEqual(len(set(ranks)), len(ranks))
+
+    def test_out_of_order_neighbours(self):
+        with self.assertRaises(ValueError):
+            rank_between('b', 'a')
+
+    def test_evenly_spaced_ranks(self):
+        ranks = evenly_spaced_ranks(100)
+        self.assertEqual(ranks, sorted(ranks))
+        self.assertEqual(len(set(ranks)), 100)
+        self.assertTrue(all(len(rank) <= 2 for rank in ranks))
+
+
+class MoveTaskTestCase(BaseApiSetUp):
+
+    def setUp(self):
+        super(MoveTaskTestCase, self).setUp()
+        self.project = mommy.make(Project)
+        mommy.make(Membership, user=self.user, organization=self.project.organization)
+        self.task_column = TaskColumn.objects.get(project=self.project, name=TaskColumn.TASK_COLUMN_RAW_TASK)
+        self.tasks = [
+            mommy.make(
+                Task,
+                title=f'Task {i}',
+                has_target=False,
+                task_number=i,
+                project=self.project,
+                task_column=self.task_column,
+            )
+            for i in range(1, 5)
+        ]
+
+    def column_task_ids(self, task_column):
+        return list(Task.objects.filter(task_column=task_column).order_by('rank', 'id').values_list('id', flat=True))
+
+    def move(self, task, task_column, before=None, after=None):
+        return self.client.post('/api/tasks/move_task/', {
+            'task_id': task.id,
+            'task_column_id': task_column.id,
+            'before_id': before and before.id,
+            'after_id': after and after.id,
+        }, format='json')
+
+    def test_created_tasks_go_to_the_bottom(self):
+        self.assertEqual(self.column_task_ids(self.task_column), [task.id for task in self.tasks])
+
+    def test_move_writes_only_the_moved_task(self):
+        first, second, third, fourth = self.tasks
+        ranks_before = dict(Task.objects.values_list('id', 'rank'))
+
+        # task, locking the columns, neighbours, the check that nothing is between them, the update and the column
+        # versions, plus the savepoint. None of them depend on the size of the column.
+        with self.assertNumQueries(8):
+            response = self.move(fourth, self.task_column, before=first, after=second)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.column_task_ids(self.task_column), [first.id, fourth.id, second.id, third.id])
+        ranks_after = dict(Task.objects.values_list('id', 'rank'))
+        self.assertEqual(
+            [task_id for task_id, rank in ranks_after.items() if rank != ranks_before[task_id]],
+            [fourth.id]
+        )
+
+    def test_move_to_another_column(self):
+        done = TaskColumn.objects.get(project=self.project, name='Done')
+        self.assertEqual(self.move(self.tasks[0], done).status_code, 200)
+        self.assertEqual(self.column_task_ids(done), [self.tasks[0].id])
+
+    def test_neighbours_must_be_in_the_column(self):
+        done = TaskColumn.objects.get(project=self.project, name='Done')
+        response = self.move(self.tasks[0], done, before=self.tasks[1])
+        self.assertEqual(response.status_code, 400)
+
+    def test_move_without_neighbours_goes_to_the_bottom(self):
+        first, second, third, fourth = self.tasks
+        response = self.move(first, self.task_column)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.column_task_ids(self.task_column), [second.id, third.id, fourth.id, first.id])
+        self.assertEqual(len(set(Task.objects.values_list('rank', flat=True))), 4)
+
+    def test_a_missing_neighbour_stands_for_the_end_of_the_column(self):
+        first, second, third, fourth = self.tasks
+        ranks_before = dict(Task.objects.values_list('id', 'rank'))
+
+        # second isn't the last task, nor third the first
+        self.assertEqual(self.move(fourth, self.task_column, before=second).status_code, 409)
+        self.assertEqual(self.move(first, self.task_column, after=third).status_code, 409)
+        self.assertEqual(dict(Task.objects.values_list('id', 'rank')), ranks_before)
+
+        self.assertEqual(self.move(first, self.task_column, before=fourth).status_code, 200)
+        self.assertEqual(self.move(fourth, self.task_column, after=second).status_code, 200)
+        self.assertEqual(self.column_task_ids(self.task_column), [fourth.id, second.id, third.id, first.id])
+
+    def test_neighbours_must_be_next_to_each_other(self):
+        first, second, third, fourth = self.tasks
+        ranks_before = dict(Task.objects.values_list('id', 'rank'))
+
+        response = self.move(fourth, self.task_column, before=first, after=third)
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(
+            [task['id'] for task in response.data['tasks']],
+            [first.id, second.id, third.id, fourth.id]
+        )
+        self.assertEqual(dict(Task.objects.values_list('id', 'rank')), ranks_before)
+        # nor the wrong way round
+        self.assertEqual(self.move(fourth, self.task_column, before=second, after=first).status_code, 409)
+
+    def test_rebalance_keeps_the_order(self):
+        # keep moving a task right below the first one, so the ranks get longer
+        first, below = self.tasks[0], self.tasks[1]
+        for i in range(20):
+            moved = self.tasks[2 + i % 2]
+            self.move(moved, self.task_column, before=first, after=below)
+            below = moved
+        order = self.column_task_ids(self.task_column)
+        self.assertGreater(max(len(rank) for rank in Task.objects.values_list('rank', flat=True)), 1)
+
+        rebalance_task_column(self.task_column.id)
+
+        self.assertEqual(self.column_task_ids(self.task_column), order)
+        self.assertTrue(all(len(rank) == 1 for rank in Task.objects.values_list('rank', flat=True)))
+
+    @override_settings(TASK_RANK_MAX_LENGTH=1)
+    def test_appends_rebalance_long_ranks(self):
+        # every append to the column now gets a 2 character rank, after 'z'
+        Task.objects.filter(id=self.tasks[-1].id).update(rank='z')
+        done = TaskColumn.objects.get(project=self.project, name='Done')
+        Task.objects.filter(id=self.tasks[0].id).update(rank='y', task_column=done)
+        Task.objects.filter(id=self.tasks[1].id).update(rank='z', task_column=done)
+        Project.objects.filter(id=self.project.id).update(last_task_number=len(self.tasks))
+
+        with mock.patch.object(rebalance_task_column, 'delay_on_commit') as delay_on_commit:
+            response = self.client.post('/api/tasks/create_task/', {
+                'project': self.project.id,
+                'task_column': self.task_column.id,
+                'title': 'created',
+                'target_dom_path': 'body',
+            }, format='json')
+            self.assertEqual(response.status_code, 201)
+            delay_on_commit.assert_called_once_with(self.task_column.id)
+
+            delay_on_commit.reset_mock()
+            response = self.client.post('/api/tasks/change_column_from_widget/', {
+                'task_id': self.tasks[0].id,
+                'task_column_id': self.task_column.id,
+            }, format='json')
+            self.assertEqual(response.status_code, 200)
+            delay_on_commit.assert_called_once_with(self.task_column.id)
+
+            delay_on_commit.reset_mock()
+            response = self.client.post(
+                '/api/tasks/create_task_from_widget/',
+                make_submission('reported', project=self.project.id),
+                format='json'
+            )
+            self.assertEqual(response.status_code, 201)
+            delay_on_commit.assert_called_once_with(self.task_column.id)
+
+            delay_on_commit.reset_mock()
+            mommy.make(Task, title='saved', has_target=False, task_number=10, project=self.project, task_column=done)
+            delay_on_commit.assert_called_once_with(done.id)
+
+    def reorder(self, *tasks, task_column=None):
+        task_column = task_column or self.task_column
+        return self.client.post('/api/tasks/reorder_tasks/', [
+            {'id': task.id, 'project': self.project.id, 'task_column': task_column.id, 'order': order}
+            for order, task in enumerate(tasks, 1)
+        ], format='json')
+
+    def test_reorder_writes_and_returns_only_changed_tasks(self):
+        first, second, third, fourth = self.tasks
+        for order, task in enumerate(self.tasks, 1):
+            Task.objects.filter(id=task.id).update(order=order)
+        ranks_before = dict(Task.objects.values_list('id', 'rank'))
+
+        response = self.reorder(first, fourth, second, third)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.column_task_ids(self.task_column), [first.id, fourth.id, second.id, third.id])
+        # second, third and fourth get a new order, but only fourth needs a new rank
+        self.assertEqual(sorted(task['id'] for task in response.data['tasks']), [second.id, third.id, fourth.id])
+        ranks_after = dict(Task.objects.values_list('id', 'rank'))
+        self.assertEqual(
+            [task_id for task_id, rank in ranks_after.items() if rank != ranks_before[task_id]],
+            [fourth.id]
+        )
+
+        response = self.reorder(first, fourth, second, third)
+        self.assertEqual(response.data['tasks'], [])
+
+    def test_reorder_into_a_column_of_another_project(self):
+        other_column = mommy.make(TaskColumn)
+        response = self.reorder(*self.tasks, task_column=other_column)
+        self.assertEqual(response.status_code, 400)
+
+    def test_reorder_needs_access_to_the_project(self):
+        other_column = TaskColumn.objects.get(project=mommy.make(Project), name=TaskColumn.TASK_COLUMN_RAW_TASK)
+        other_task = mommy.make(Task, title='Theirs', has_target=False, project=other_column.project)
+
+        with mock.patch.object(TaskColumn, 'lock_versions') as lock_versions:
+            response = self.client.post('/api/tasks/reorder_tasks/', {
+                'tasks': [{'id': other_task.id, 'project': other_column.project_id, 'task_column': other_column.id,
+                           'order': 1}],
+                'task_column_versions': {other_column.id: 12345},
+            }, format='json')
+
+        # nothing of the other board is locked or sent back
+        self.assertEqual(response.status_code, 400)
+        self.assertNotIn('tasks', response.data)
+        lock_versions.assert_not_called()
+
+    def test_reorder_checks_the_columns_it_was_sent_versions_for(self):
+        other_column = mommy.make(TaskColumn)
+        response = self.client.post('/api/tasks/reorder_tasks/', {
+            'tasks': [{'id': self.tasks[0].id, 'project': self.project.id, 'task_column': self.task_column.id,
+                       'order': 1}],
+            'task_column_versions': {other_column.id: 12345},
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertNotIn('tasks', response.data)
+
+    def test_reorder_locks_every_column_at_once(self):
+        done = TaskColumn.objects.get(project=self.project, name='Done')
+        with mock.patch.object(TaskColumn, 'lock_versions', wraps=TaskColumn.lock_versions) as lock_versions:
+            response = self.reorder(self.tasks[0], task_column=done)
+
+        self.assertEqual(response.status_code, 200)
+        # the column the task comes from is locked with the one it moves to
+        lock_versions.assert_called_once_with({self.task_column.id, done.id}, self.project.id)
+        self.assertEqual(response.data['task_columns'], [
+            {'id': self.task_column.id, 'version': 1},
+            {'id': done.id, 'version': 1},
+        ])
+
+    def test_writes_bump_the_column_versions(self):
+        done = TaskColumn.objects.get(project=self.project, name='Done')
+
+        response = self.move(self.tasks[0], done)
+
+        self.assertEqual(response.data['task_columns'], [
+            {'id': self.task_column.id, 'version': 1},
+            {'id': done.id, 'version': 1},
+        ])
+        self.reorder(*self.tasks[1:])
+        self.assertEqual(TaskColumn.objects.get(id=self.task_column.id).version, 2)
+        # nothing changes, so the version stays
+        response = self.reorder(*self.tasks[1:])
+        self.assertEqual(response.data['task_columns'], [])
+        self.assertEqual(TaskColumn.objects.get(id=self.task_column.id).version, 2)
+
+    def test_stale_version_is_rejected_with_the_current_state(self):
+        first, second, third, fourth = self.tasks
+        self.move(fourth, self.task_column, before=first, after=second)
+        ranks_before = dict(Task.objects.values_list('id', 'rank'))
+
+        # this client loaded the board before the move
+        response = self.client.post('/api/tasks/reorder_tasks/', {
+            'tasks': [
+                {'id': task.id, 'project': self.project.id, 'task_column': self.task_column.id, 'order': order}
+                for order, task in enumerate([second, first, third, fourth], 1)
+            ],
+            'task_column_versions': {self.task_column.id: 0},
+        }, format='json')
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['task_columns'], [{'id': self.task_column.id, 'version': 1}])
+        self.assertEqual(
+            [task['id'] for task in response.data['tasks']],
+            [first.id, fourth.id, second.id, third.id]
+        )
+        self.assertEqual(dict(Task.objects.values_list('id', 'rank')), ranks_before)
+
+        response = self.client.post('/api/tasks/move_task/', {
+            'task_id': first.id,
+            'task_column_id': self.task_column.id,
+            'before_id': third.id,
+            'task_column_versions': {self.task_column.id: 0},
+        }, format='json')
+        self.assertEqual(response.status_code, 409)
+
+    def test_current_version_is_accepted(self):
+        first, second, third, fourth = self.tasks
+        response = self.client.post('/api/tasks/reorder_tasks/', {
+            'tasks': [
+                {'id': task.id, 'project': self.project.id, 'task_column': self.task_column.id, 'order': order}
+                for order, task in enumerate([second, first, third, fourth], 1)
+            ],
+            'task_column_versions': {self.task_column.id: 0},
+        }, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['task_columns'], [{'id': self.task_column.id, 'version': 1}])
+        self.assertEqual(self.column_task_ids(self.task_column), [second.id, first.id, third.id, fourth.id])
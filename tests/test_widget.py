@@ -0,0 +1,112 @@
+from unittest import mock
+
+from model_mommy import mommy
+
+from collab_app.models import (
+    Membership,
+    NotificationOutbox,
+    Project,
+    Task,
+    TaskDataUrl,
+    TaskMetadata,
+)
+from tests.mixins import BaseApiSetUp
+
+
+def make_submission(title, **kwargs):
+    # what the widget sends for one task
+    task = {
+        'title': title,
+        'target_dom_path': 'body',
+        'design_edits': '',
+        'text_copy_changes': '',
+        'has_text_copy_changes': False,
+        'has_target': True,
+        'one_off_email_set_by': '',
+    }
+    task_metadata = {
+        'url_origin': 'https://hi.com',
+        'os_name': 'Mac OS',
+        'os_version': '10.15',
+        'os_version_name': 'Catalina',
+        'browser_name': 'chrome',
+        'browser_version': '87',
+        'selector': 'body',
+        'screen_height': 900,
+        'screen_width': 1440,
+        'device_pixel_ratio': 2,
+        'browser_window_width': 1440,
+        'browser_window_height': 800,
+        'color_depth': 24,
+        'pixel_depth': 24,
+    }
+    return {'task': dict(task, **kwargs), 'task_metadata': task_metadata}
+
+
+class WidgetTaskTestCase(BaseApiSetUp):
+
+    def setUp(self):
+        super(WidgetTaskTestCase, self).setUp()
+        self.project = mommy.make(Project)
+        mommy.make(Membership, user=self.user, organization=self.project.organization)
+
+    def test_create_task_from_widget(self):
+        response = self.client.post(
+            '/api/tasks/create_task_from_widget/',
+            make_submission('one', project=self.project.id),
+            format='json'
+        )
+
+        self.assertEqual(response.status_code, 201)
+        task = Task.objects.get()
+        self.assertEqual((task.task_number, task.creator), (1, self.user))
+        self.assertEqual(TaskMetadata.objects.get().task, task)
+        self.assertEqual(NotificationOutbox.objects.get().payload, {'task_id': task.id})
+
+    def test_lookup_values_are_stored_as_strings(self):
+        submission = make_submission('one', project=self.project.id)
+        submission['task_metadata'].update(browser_version=87, os_version=10.15, os_version_name=None)
+
+        response = self.client.post('/api/tasks/create_task_from_widget/', submission, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        task_metadata = TaskMetadata.objects.get()
+        self.assertEqual(
+            (task_metadata.browser_version.value, task_metadata.os_version.value, task_metadata.os_version_name.value),
+            ('87', '10.15', '')
+        )
+
+    def test_create_tasks_from_widget_anonymous(self):
+        submissions = [make_submission(f'Task {i}', project_key=self.project.key) for i in range(3)]
+        submissions[1]['data_url'] = 'data:image/png;base64,aGk='
+        self.client.logout()
+
+        with mock.patch('collab_app.widget.group') as group, \
+                mock.patch('collab_app.widget.transaction.on_commit') as on_commit:
+            response = self.client.post(
+                '/api/tasks/create_tasks_from_widget_anonymous/',
+                {'tasks': submissions},
+                format='json'
+            )
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data['tasks']), 3)
+        tasks = list(Task.objects.order_by('rank'))
+        self.assertEqual([task.title for task in tasks], ['Task 0', 'Task 1', 'Task 2'])
+        self.assertEqual([task.task_number for task in tasks], [1, 2, 3])
+        self.assertEqual(TaskMetadata.objects.filter(task__in=tasks).count(), 3)
+        self.assertEqual(NotificationOutbox.objects.count(), 3)
+        self.assertEqual(TaskDataUrl.objects.get().task, tasks[1])
+        # the upload is published once the tasks are committed
+        on_commit.assert_any_call(group.return_value.apply_async)
+        self.assertEqual(len(group.call_args[0][0]), 1)
+
+    def test_tasks_must_be_for_one_project(self):
+        other_project = mommy.make(Project)
+        response = self.client.post('/api/tasks/create_tasks_from_widget/', {'tasks': [
+            make_submission('one', project=self.project.id),
+            make_submission('two', project=other_project.id),
+        ]}, format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Task.objects.exists())
@@ -0,0 +1,85 @@
+from unittest import mock
+
+from django.core.cache import cache
+from model_mommy import mommy
+
+from collab_app.models import (
+    Project,
+    Task,
+    WidgetReport,
+)
+from collab_app.tasks import persist_widget_reports
+from collab_app.widget import persist_widget_report_batch
+from tests.mixins import BaseApiSetUp
+from tests.test_widget import make_submission
+
+
+class WidgetReportTestCase(BaseApiSetUp):
+
+    def setUp(self):
+        super(WidgetReportTestCase, self).setUp()
+        cache.clear()
+        self.project = mommy.make(Project)
+        self.client.logout()
+
+    def queue(self, submission):
+        return self.client.post('/api/tasks/queue_task_from_widget_anonymous/', submission, format='json')
+
+    def test_queue_task_from_widget_anonymous(self):
+        response = self.queue(make_submission('one', project_key=self.project.key, project=1234))
+
+        self.assertEqual(response.status_code, 202)
+        widget_report = WidgetReport.objects.get(ticket=response.data['ticket'])
+        self.assertEqual(widget_report.project, self.project)
+        self.assertEqual(widget_report.state, WidgetReport.ReportState.PENDING)
+        # an anonymous report can't pick its project by id
+        self.assertNotIn('project', widget_report.payload['task'])
+        self.assertFalse(Task.objects.exists())
+
+    def test_queue_rejects_unknown_project_key(self):
+        response = self.queue(make_submission('one', project_key='nope'))
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(WidgetReport.objects.exists())
+
+    def test_persist_widget_reports(self):
+        tickets = [
+            self.queue(make_submission(f'Task {i}', project_key=self.project.key)).data['ticket']
+            for i in range(3)
+        ]
+
+        with mock.patch('collab_app.widget.group'):
+            persist_widget_reports()
+
+        widget_reports = WidgetReport.objects.filter(ticket__in=tickets).order_by('id')
+        self.assertEqual(
+            [widget_report.state for widget_report in widget_reports],
+            [WidgetReport.ReportState.PROCESSED] * 3
+        )
+        self.assertEqual(
+            [widget_report.task.title for widget_report in widget_reports],
+            ['Task 0', 'Task 1', 'Task 2']
+        )
+        self.assertEqual(persist_widget_report_batch(), 0)
+
+        response = self.client.get('/api/tasks/widget_report_status/', {'ticket': tickets[0]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {'state': 'processed', 'task': widget_reports[0].task_id})
+
+    def test_persist_marks_bad_reports_failed(self):
+        good = self.queue(make_submission('good', project_key=self.project.key)).data['ticket']
+        bad = self.queue(make_submission('bad', project_key=self.project.key, assigned_to=1234)).data['ticket']
+
+        with mock.patch('collab_app.widget.group'), mock.patch('collab_app.widget.capture_exception'):
+            self.assertEqual(persist_widget_report_batch(), 2)
+
+        self.assertEqual(WidgetReport.objects.get(ticket=good).state, WidgetReport.ReportState.PROCESSED)
+        bad_report = WidgetReport.objects.get(ticket=bad)
+        self.assertEqual(bad_report.state, WidgetReport.ReportState.FAILED)
+        self.assertIsNone(bad_report.task)
+        self.assertEqual(list(Task.objects.values_list('title', flat=True)), ['good'])
+
+    def test_widget_report_status_unknown_ticket(self):
+        response = self.client.get('/api/tasks/widget_report_status/', {'ticket': 'nope'})
+
+        self.assertEqual(response.status_code, 404)